@@ -0,0 +1,84 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+"""
+@package    Sekator
+@brief      Microbenchmark of the AdapterTrimmer throughput (reads/s)
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~GLOBAL IMPORTS~~~~~~~#
+
+# Standard library imports
+from time import time
+from string import maketrans
+import optparse
+import gzip
+import os
+import sys
+
+# Local Package import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from AdapterTrimmer import AdapterTrimmer
+from ReadBatch import ReadBlock
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test", "dataset", "S1_R1_pass.fastq.gz")
+
+# Default Illumina adapters used in the example configuration file
+ADAPTERS = [
+    "GATCGGAAGAGCACACGTCTGAACTCCAGTCACNNNNNNATCTCGTATGCCGTCTTCTGCTTG",
+    "AATGATACGGCGACCACCGAGATCTACACTCTTTCCCTACACGACGCTCTTCCGATCT",
+    "CAAGCAGAAGACGGCATACGAGATNNNNNNGTGACTGGAGTTCAGACGTGTGCTCTTCCGATCT",
+    "ACACTCTTTCCCTACACGACGCTCTTCCGATCT",
+    "GTTCGTCTTCTGCCGTATGCTCTA",
+    "CTGTCTCTTATACACATCT"]
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+def reverse_complement (seq):
+    return seq.translate(maketrans("ACGTNacgtn", "TGCANtgcan"))[::-1]
+
+def bench_adapter (fastq, adapter_list, n_pass):
+    """
+    Load all the reads of a fastq file in memory and time n_pass rounds of adapter trimming
+    @return The best throughput in reads per second
+    """
+    reads = list(ReadBlock.from_lines(gzip.open(fastq).readlines()))
+    trimmer = AdapterTrimmer(adapter_list = adapter_list)
+    best = 0
+
+    for i in range(n_pass):
+        start_time = time()
+        for read in reads:
+            trimmer(read)
+        best = max(best, len(reads)/(time()-start_time))
+
+    return len(reads), best
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+#   TOP LEVEL INSTRUCTIONS
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+if __name__ == '__main__':
+
+    optparser = optparse.OptionParser(usage = "Usage: %prog [-f reads.fastq.gz -n 5]")
+    optparser.add_option('-f', dest="fastq", default=DATASET,
+        help= "Fastq file to trim [Default test dataset]")
+    optparser.add_option('-n', dest="n_pass", type="int", default=5,
+        help= "Number of timed passes over the reads, the best is kept [Default 5]")
+    options, args = optparser.parse_args()
+
+    # Adapters and their reverse complements
+    adapter_list = ADAPTERS + [reverse_complement(adapter) for adapter in ADAPTERS]
+
+    n_read, reads_per_s = bench_adapter(options.fastq, adapter_list, options.n_pass)
+    print ("AdapterTrimmer\t{} adapters\t{} reads\t{} reads/s".format(
+        len(adapter_list), n_read, int(reads_per_s)))
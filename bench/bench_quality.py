@@ -0,0 +1,100 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+"""
+@package    Sekator
+@brief      Microbenchmark of the QualityTrimmer engines throughput (reads/s)
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~GLOBAL IMPORTS~~~~~~~#
+
+# Standard library imports
+from time import time
+import optparse
+import gzip
+import os
+import sys
+
+# Local Package import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from QualityTrimmer import QualityTrimmer, NumpyQualityTrimmer
+from FastQualityTrimmer import FastQualityTrimmer
+from ReadBatch import ReadBlock
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test", "dataset", "S1_R1_pass.fastq.gz")
+
+# Quality parameters of the example configuration file
+PARAMETERS = {"qual_cutdown":28, "win_size":6, "step":2, "min_size":25}
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+def bench_call (reads, trimmer_class, n_pass):
+    """
+    Time n_pass rounds of read by read quality trimming
+    @return The best throughput in reads per second
+    """
+    trimmer = trimmer_class(**PARAMETERS)
+    best = 0
+
+    for i in range(n_pass):
+        start_time = time()
+        for read in reads:
+            trimmer(read)
+        best = max(best, len(reads)/(time()-start_time))
+
+    return best
+
+def bench_batch (reads, trimmer_class, batch_size, n_pass):
+    """
+    Time n_pass rounds of quality trimming by blocks of batch_size reads
+    @return The best throughput in reads per second
+    """
+    trimmer = trimmer_class(**PARAMETERS)
+    batches = []
+    for i in range(0, len(reads), batch_size):
+        block = reads[i:i+batch_size]
+        batches.append(("".join([read.qualstr for read in block]), [len(read) for read in block]))
+    best = 0
+
+    for i in range(n_pass):
+        start_time = time()
+        for quals, lengths in batches:
+            trimmer.trim_batch(quals, lengths)
+        best = max(best, len(reads)/(time()-start_time))
+
+    return best
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+#   TOP LEVEL INSTRUCTIONS
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+if __name__ == '__main__':
+
+    optparser = optparse.OptionParser(usage = "Usage: %prog [-f reads.fastq.gz -n 5 -b 1000]")
+    optparser.add_option('-f', dest="fastq", default=DATASET,
+        help= "Fastq file to trim [Default test dataset]")
+    optparser.add_option('-n', dest="n_pass", type="int", default=5,
+        help= "Number of timed passes over the reads, the best is kept [Default 5]")
+    optparser.add_option('-b', dest="batch_size", type="int", default=1000,
+        help= "Number of reads per block for the batch mode [Default 1000]")
+    options, args = optparser.parse_args()
+
+    reads = list(ReadBlock.from_lines(gzip.open(options.fastq).readlines()))
+
+    for trimmer_class in [QualityTrimmer, NumpyQualityTrimmer, FastQualityTrimmer]:
+        print ("{}\tcall\t{} reads\t{} reads/s".format(
+            trimmer_class.__name__, len(reads), int(bench_call(reads, trimmer_class, options.n_pass))))
+
+    for trimmer_class in [NumpyQualityTrimmer, FastQualityTrimmer]:
+        print ("{}\tbatch {}\t{} reads\t{} reads/s".format(
+            trimmer_class.__name__, options.batch_size, len(reads),
+            int(bench_batch(reads, trimmer_class, options.batch_size, options.n_pass))))
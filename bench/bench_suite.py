@@ -0,0 +1,260 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+"""
+@package    Sekator
+@brief      Throughput benchmark of the Sekator stages and pipeline on synthetic data, as JSON
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~GLOBAL IMPORTS~~~~~~~#
+
+# Standard library imports
+from multiprocessing import Process, Queue, Event, cpu_count
+from subprocess import Popen
+from datetime import datetime
+from time import time
+import platform
+import optparse
+import resource
+import tempfile
+import shutil
+import json
+import os
+import re
+import sys
+
+# Third party package import
+import numpy as np
+
+# Local Package import
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC)
+from AdapterTrimmer import AdapterTrimmer
+from QualityTrimmer import QualityTrimmer, NumpyQualityTrimmer
+from FastQualityTrimmer import FastQualityTrimmer
+from ReadBatch import ReadBatchReader
+from BlockGzipWriter import BlockGzipWriter
+from Conf_file import write_example_conf
+from make_fastq import make_fastq, adapter_set, reverse_complement
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+STAGES = ["quality", "adapter", "reader", "writer", "pipeline"]
+
+# Quality parameters of the example configuration file
+PARAMETERS = {"qual_cutdown":28, "win_size":6, "step":2, "min_size":30}
+
+QUALITY_ENGINES = {"python":QualityTrimmer, "numpy":NumpyQualityTrimmer, "compiled":FastQualityTrimmer}
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+def load_batches (R1_path, R2_path, batch_size=1000):
+    return list(ReadBatchReader(R1_path, R2_path, batch_size))
+
+def run_quality (batches, n_thread, engine="compiled"):
+    trimmer = QUALITY_ENGINES[engine](**PARAMETERS)
+    for batch in batches:
+        trimmer.trim_batch(batch.R1.quals, batch.R1.lengths)
+        trimmer.trim_batch(batch.R2.quals, batch.R2.lengths)
+
+def run_adapter (batches, n_thread, adapter_list):
+    trimmer = AdapterTrimmer(adapter_list = adapter_list + [reverse_complement(a) for a in adapter_list])
+    for batch in batches:
+        trimmer.trim_batch(batch.R1.seqs, batch.R1.quals, batch.R1.lengths, num_threads=1)
+        trimmer.trim_batch(batch.R2.seqs, batch.R2.quals, batch.R2.lengths, num_threads=1)
+
+def run_reader (paths, n_thread):
+    for batch in ReadBatchReader(paths[0], paths[1], 1000, n_thread):
+        pass
+
+def run_writer (fastq, n_thread, path):
+    out = BlockGzipWriter(path, n_thread=n_thread)
+    for chunk in fastq:
+        out.write(chunk)
+    out.close()
+
+def worker (func, load, args, n_thread, ready, start, results):
+    """
+    Prepare the data of a stage, wait for the start signal, then run the stage once and send
+    its duration and the peak RSS of the process in KB
+    """
+    # Messages of the trimmers must not mix with the JSON output
+    sys.stdout = sys.stderr
+    data = load()
+    ready.put(1)
+    start.wait()
+    t = time()
+    func(data, n_thread, *args)
+    results.put((time()-t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+def time_stage (func, load, args, n_thread, n_process):
+    """
+    Run a stage in n_process processes started at the same time after the loading of their data
+    @return The wall time of the slowest process and the largest peak RSS in KB
+    """
+    ready, results, start = Queue(), Queue(), Event()
+    ps = [Process(target=worker, args=(func, load, args, n_thread, ready, start, results)) for i in range(n_process)]
+    for p in ps:
+        p.start()
+    for p in ps:
+        ready.get()
+
+    t = time()
+    start.set()
+    rss = max([results.get()[1] for p in ps])
+    wall = time()-t
+    for p in ps:
+        p.join()
+    return wall, rss
+
+def time_pipeline (R1_path, R2_path, adapter_list, n_thread, workdir):
+    """
+    Run Sekator on the synthetic sample with the example configuration file and n_thread workers
+    @return The wall time of the run and the peak RSS of the largest process in KB
+    """
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        write_example_conf()
+        with open("Sekator_conf_file.txt") as fp:
+            conf = fp.read()
+        conf = conf[:conf.index("[sample1]")]
+        conf = re.sub("(?m)^auto_thread = True", "auto_thread = False", conf)
+        conf = re.sub("(?m)^n_thread :.*$", "n_thread : {}".format(n_thread), conf)
+        conf += "[sample1]\nname : synthetic\nR1_path : {}\nR2_path : {}\nadapter_list : {}\n".format(
+            R1_path, R2_path, " ".join(adapter_list))
+        with open("Sekator_conf_file.txt", "w") as fp:
+            fp.write(conf)
+
+        with open(os.devnull, "w") as devnull:
+            t = time()
+            p = Popen([sys.executable, os.path.join(SRC, "Sekator.py"), "-c", "Sekator_conf_file.txt"], stdout=devnull)
+            pid, status, rusage = os.wait4(p.pid, 0)
+            wall = time()-t
+        if status:
+            raise RuntimeError ("Sekator exited with status {}".format(status))
+        return wall, rusage.ru_maxrss
+
+    finally:
+        os.chdir(cwd)
+
+def bench (stage, n_thread, dataset, workdir, n_pass, engine):
+    """
+    Best of n_pass runs of a stage. The trimmers are run in n_thread processes working on all the
+    reads, as the filter processes of the pipeline, the reader and the writer in one process
+    with n_thread decompression or compression threads, and the pipeline with n_thread workers
+    @return The best wall time, the number of reads and the bytes of fastq processed and the
+    peak RSS in KB
+    """
+    paths = (dataset["R1_path"], dataset["R2_path"])
+    n_read, size = 2*dataset["n_pair"], dataset["fastq_bytes"]
+    load_reads = lambda: load_batches(*paths)
+
+    if stage == "quality":
+        run = lambda: time_stage(run_quality, load_reads, (engine,), n_thread, n_thread)
+        n_read, size = n_read*n_thread, size*n_thread
+    elif stage == "adapter":
+        run = lambda: time_stage(run_adapter, load_reads, (dataset["adapter_list"],), n_thread, n_thread)
+        n_read, size = n_read*n_thread, size*n_thread
+    elif stage == "reader":
+        run = lambda: time_stage(run_reader, lambda: paths, (), n_thread, 1)
+    elif stage == "writer":
+        load_fastq = lambda: [batch.R1.fastqstr+batch.R2.fastqstr for batch in load_reads()]
+        run = lambda: time_stage(run_writer, load_fastq, (os.path.join(workdir, "writer.fastq.gz"),), n_thread, 1)
+    else:
+        run = lambda: time_pipeline(paths[0], paths[1], dataset["adapter_list"], n_thread, workdir)
+
+    runs = [run() for i in range(n_pass)]
+    return min([wall for wall, rss in runs]), n_read, size, max([rss for wall, rss in runs])
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+#   TOP LEVEL INSTRUCTIONS
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+if __name__ == '__main__':
+
+    optparser = optparse.OptionParser(usage = "Usage: %prog [-n 100000 -t 1,2,4 -s quality,adapter,reader,writer,pipeline -o bench.json]")
+    optparser.add_option('-n', dest="n_pair", type="int", default=100000,
+        help= "Number of synthetic read pairs [Default 100000]")
+    optparser.add_option('-l', dest="read_len", type="int", default=150,
+        help= "Length of the reads [Default 150]")
+    optparser.add_option('-a', dest="adapter_rate", type="float", default=0.3,
+        help= "Fraction of the pairs containing adapters [Default 0.3]")
+    optparser.add_option('-c', dest="n_adapter", type="int", default=2,
+        help= "Number of different adapters [Default 2]")
+    optparser.add_option('--qual-end', dest="qual_end", type="int", default=25,
+        help= "Mean Phred quality at the end of the reads, decreasing from 38 [Default 25]")
+    optparser.add_option('-t', dest="threads", default="1,2,4",
+        help= "Comma separated list of n_thread values [Default 1,2,4]")
+    optparser.add_option('-s', dest="stages", default=",".join(STAGES),
+        help= "Comma separated list of stages among {} [Default all]".format(", ".join(STAGES)))
+    optparser.add_option('-e', dest="engine", default="compiled",
+        help= "Quality engine of the quality stage: python, numpy or compiled [Default compiled]")
+    optparser.add_option('-p', dest="n_pass", type="int", default=3,
+        help= "Number of timed passes, the best is kept [Default 3]")
+    optparser.add_option('-o', dest="output",
+        help= "Path of the JSON output [Default stdout]")
+    optparser.add_option('-k', dest="keep", action='store_true',
+        help= "Keep the working directory containing the synthetic files [Facultative]")
+    options, args = optparser.parse_args()
+
+    threads = sorted(set([int(i) for i in options.threads.split(",")]))
+    stages = options.stages.split(",")
+    assert all([stage in STAGES for stage in stages]), "Unknown stage in {}".format(options.stages)
+    assert options.engine in QUALITY_ENGINES, "Unknown quality engine {}".format(options.engine)
+
+    workdir = tempfile.mkdtemp(prefix="sekator_bench_")
+    try:
+        sys.stderr.write("Generate {} synthetic read pairs in {}\n".format(options.n_pair, workdir))
+        adapter_list = adapter_set(options.n_adapter, np.random.RandomState(1))
+        R1_path, R2_path, size = make_fastq(os.path.join(workdir, "synthetic"), options.n_pair,
+            read_len=options.read_len, adapter_rate=options.adapter_rate, adapters=adapter_list,
+            qual_end=options.qual_end)
+        dataset = {"n_pair":options.n_pair, "read_len":options.read_len, "adapter_rate":options.adapter_rate,
+            "adapter_list":adapter_list, "qual_end":options.qual_end, "fastq_bytes":size,
+            "R1_path":R1_path, "R2_path":R2_path}
+
+        results = []
+        for stage in stages:
+            base = None
+            for n_thread in threads:
+                sys.stderr.write("Benchmark {} with {} threads\n".format(stage, n_thread))
+                wall, n_read, size, rss = bench(stage, n_thread, dataset, workdir, options.n_pass, options.engine)
+
+                # Scaling efficiency relative to the smallest number of threads
+                base = base or (n_read/wall/n_thread)
+                results.append({
+                    "stage":stage,
+                    "n_thread":n_thread,
+                    "seconds":round(wall, 4),
+                    "reads_per_s":int(n_read/wall),
+                    "mb_per_s":round(size/wall/1e6, 2),
+                    "peak_rss_mb":round(rss/1024.0, 1),
+                    "scaling_efficiency":round(n_read/wall/n_thread/base, 3)})
+
+    finally:
+        if not options.keep:
+            shutil.rmtree(workdir)
+
+    del dataset["R1_path"], dataset["R2_path"]
+    report = {
+        "date":datetime.now().isoformat(),
+        "python":platform.python_version(),
+        "cpu_count":cpu_count(),
+        "n_pass":options.n_pass,
+        "quality_engine":options.engine,
+        "dataset":dataset,
+        "results":results}
+
+    if options.output:
+        with open(options.output, "w") as fp:
+            json.dump(report, fp, indent=2, sort_keys=True)
+    else:
+        print (json.dumps(report, indent=2, sort_keys=True))
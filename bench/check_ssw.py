@@ -0,0 +1,205 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+"""
+@package    Sekator
+@brief      Check of the SSW kernels against a naive affine Smith-Waterman on random adapter/read pairs
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~GLOBAL IMPORTS~~~~~~~#
+
+# Standard library imports
+from distutils.ccompiler import new_compiler
+import optparse
+import tempfile
+import shutil
+import ctypes
+import os
+import sys
+
+# Third party package import
+import numpy as np
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+KERNELS = ["sse2_byte", "sse2_word", "avx2_byte", "avx2_word"]
+
+# Gap penalties (gapO, gapE) of the random cases, including gapO == gapE
+GAPS = [(3, 1), (5, 2), (4, 1), (1, 1), (2, 2), (3, 3)]
+
+# The static kernels of ssw.c are wrapped in a single entry point of a shared library
+WRAPPER = r"""
+#include "ssw.c"
+
+int32_t align_kernel (int32_t kernel, const int8_t* query, int32_t queryLen, const int8_t* ref, int32_t refLen,
+    const int8_t* mat, int8_t gapO, int8_t gapE, int32_t* out)
+{
+    int32_t i, bias = 0;
+    void* profile;
+    s_alignment_end best;
+
+    for (i = 0; i < 25; ++i) if (mat[i] < bias) bias = mat[i];
+    bias = abs(bias);
+
+    if (kernel == 0) {
+        profile = qP_byte(query, mat, queryLen, bias);
+        best = sw_sse2_byte(ref, 0, refLen, queryLen, gapO, gapE, profile, -1, bias);
+    }
+    else if (kernel == 1) {
+        profile = qP_word(query, mat, queryLen);
+        best = sw_sse2_word(ref, 0, refLen, queryLen, gapO, gapE, profile, -1);
+    }
+#ifdef SSW_AVX2
+    else if (kernel == 2 && __builtin_cpu_supports("avx2")) {
+        profile = qP_byte_avx2(query, mat, queryLen, bias);
+        best = sw_avx2_byte(ref, 0, refLen, queryLen, gapO, gapE, profile, -1, bias);
+    }
+    else if (kernel == 3 && __builtin_cpu_supports("avx2")) {
+        profile = qP_word_avx2(query, mat, queryLen);
+        best = sw_avx2_word(ref, 0, refLen, queryLen, gapO, gapE, profile, -1);
+    }
+#endif
+    else return 0;
+
+    free(profile);
+    out[0] = best.score;
+    out[1] = best.ref;
+    out[2] = best.query;
+    return 1;
+}
+"""
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+def build_library (workdir):
+    """
+    Compile ssw.c and the wrapper of its kernels in a shared library
+    @return The ctypes library
+    """
+    with open(os.path.join(workdir, "ssw_check.c"), "w") as fp:
+        fp.write(WRAPPER)
+    compiler = new_compiler()
+    objects = compiler.compile([os.path.join(workdir, "ssw_check.c")], output_dir=workdir,
+        include_dirs=[SRC], extra_preargs=["-fPIC", "-O2"])
+    path = os.path.join(workdir, "ssw_check.so")
+    compiler.link_shared_object(objects, path)
+    lib = ctypes.CDLL(path)
+    lib.align_kernel.argtypes = [ctypes.c_int32, ctypes.c_void_p, ctypes.c_int32, ctypes.c_void_p,
+        ctypes.c_int32, ctypes.c_void_p, ctypes.c_int8, ctypes.c_int8, ctypes.c_void_p]
+    return lib
+
+def score_matrix (match, mismatch):
+    """ Score matrix of ssw.c, ambiguous bases score 0 """
+    mat = np.full((5, 5), -mismatch, dtype=np.int8)
+    np.fill_diagonal(mat, match)
+    mat[4, :] = mat[:, 4] = 0
+    return mat
+
+def naive_sw (query, ref, mat, gapO, gapE):
+    """
+    Affine Smith-Waterman column by column along the reference. A gap of length L costs
+    gapO + (L-1)*gapE. As in ssw.c, the best alignment ends in the first reference position
+    reaching the best score, at its first query position reaching it
+    @return The score and the 0-based ending positions on the reference and on the query
+    """
+    n = len(query)
+    H = [0]*(n+1)
+    E = [0]*(n+1)
+    best = (0, 0, n-1)
+    for i, base in enumerate(ref):
+        diag = 0
+        F = 0
+        column = [0]*(n+1)
+        for j in range(1, n+1):
+            E[j] = max(E[j]-gapE, H[j]-gapO)
+            F = max(F-gapE, column[j-1]-gapO)
+            column[j] = max(0, diag+mat[query[j-1], base], E[j], F)
+            diag = H[j]
+        H = column
+        score = max(column)
+        if score > best[0]:
+            best = (score, i, column.index(score)-1)
+    return best
+
+def random_case (rng, adapter_len, read_len):
+    """
+    Random adapter and read containing a mutated copy of the adapter, with substitutions,
+    insertions and deletions, so that the gaps are exercised
+    """
+    adapter = list(rng.randint(0, 4, adapter_len))
+    copy = []
+    for base in adapter:
+        event = rng.random_sample()
+        if event < 0.05:
+            continue
+        elif event < 0.1:
+            copy.extend(rng.randint(0, 4, rng.randint(1, 4)))
+        elif event < 0.15:
+            base = rng.randint(0, 4)
+        copy.append(base)
+    start = rng.randint(0, read_len)
+    read = list(rng.randint(0, 4, start)) + copy
+    read += list(rng.randint(0, 4, max(read_len-len(read), 0)))
+    return np.array(adapter, dtype=np.int8), np.array(read[:read_len], dtype=np.int8)
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+#   TOP LEVEL INSTRUCTIONS
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+if __name__ == '__main__':
+
+    optparser = optparse.OptionParser(usage = "Usage: %prog [-n 600 -s 1 -v]")
+    optparser.add_option('-n', dest="n_case", type="int", default=600,
+        help= "Number of random cases, spread over the gap penalties [Default 600]")
+    optparser.add_option('-s', dest="seed", type="int", default=1,
+        help= "Seed of the random generator [Default 1]")
+    optparser.add_option('-v', dest="verbose", action='store_true',
+        help= "Print the failing cases [Facultative]")
+    options, args = optparser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="sekator_ssw_")
+    try:
+        lib = build_library(workdir)
+    finally:
+        shutil.rmtree(workdir)
+
+    rng = np.random.RandomState(options.seed)
+    out = np.zeros(3, dtype=np.int32)
+    errors = dict([(kernel, 0) for kernel in KERNELS])
+    available = set()
+
+    for case in range(options.n_case):
+        gapO, gapE = GAPS[case % len(GAPS)]
+        match, mismatch = [(2, 2), (1, 3), (3, 1)][case/len(GAPS) % 3]
+        mat = score_matrix(match, mismatch)
+        query, ref = random_case(rng, rng.randint(15, 65), rng.randint(30, 160))
+        expected = naive_sw(query, ref, mat, gapO, gapE)
+
+        for number, kernel in enumerate(KERNELS):
+            if not lib.align_kernel(number, query.ctypes.data, len(query), ref.ctypes.data, len(ref),
+                mat.ctypes.data, gapO, gapE, out.ctypes.data):
+                continue
+            available.add(kernel)
+            if tuple(out) != expected:
+                errors[kernel] += 1
+                if options.verbose:
+                    print ("{}\tgapO {} gapE {} match {} mismatch {}\tnaive {}\tkernel {}".format(
+                        kernel, gapO, gapE, match, mismatch, expected, tuple(out)))
+
+    failed = False
+    for kernel in KERNELS:
+        if kernel in available:
+            print ("{}\t{} cases\t{} different from the naive Smith-Waterman".format(kernel, options.n_case, errors[kernel]))
+            failed = failed or errors[kernel] > 0
+        else:
+            print ("{}\tnot supported by this CPU".format(kernel))
+    sys.exit(1 if failed else 0)
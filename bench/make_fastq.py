@@ -0,0 +1,151 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+"""
+@package    Sekator
+@brief      Generator of synthetic paired fastq files with controlled adapter contamination
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~GLOBAL IMPORTS~~~~~~~#
+
+# Standard library imports
+from string import maketrans
+import optparse
+import os
+import sys
+
+# Third party package import
+import numpy as np
+
+# Local Package import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from BlockGzipWriter import BlockGzipWriter
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+# Default Illumina adapters used in the example configuration file, then other common adapters
+ADAPTERS = [
+    "GATCGGAAGAGCACACGTCTGAACTCCAGTCACNNNNNNATCTCGTATGCCGTCTTCTGCTTG",
+    "AATGATACGGCGACCACCGAGATCTACACTCTTTCCCTACACGACGCTCTTCCGATCT",
+    "CAAGCAGAAGACGGCATACGAGATNNNNNNGTGACTGGAGTTCAGACGTGTGCTCTTCCGATCT",
+    "ACACTCTTTCCCTACACGACGCTCTTCCGATCT",
+    "GTTCGTCTTCTGCCGTATGCTCTA",
+    "CTGTCTCTTATACACATCT"]
+
+BASES = np.array(list("ACGT"))
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+def reverse_complement (seq):
+    return seq.translate(maketrans("ACGTNacgtn", "TGCANtgcan"))[::-1]
+
+def adapter_set (n_adapter, rng):
+    """
+    The n_adapter first adapters of ADAPTERS, completed by random 33 bases adapters
+    """
+    adapters = ADAPTERS[:n_adapter]
+    while len(adapters) < n_adapter:
+        adapters.append(BASES[rng.randint(0, 4, 33)].tostring())
+    return adapters
+
+def synthetic_pairs (n_pair, read_len=150, adapter_rate=0.3, adapters=ADAPTERS[:2], qual_start=38,
+    qual_end=25, error_rate=0.005, seed=1, chunk_size=10000):
+    """
+    Generate random read pairs of read_len bases. A fraction adapter_rate of the pairs comes from
+    an insert shorter than the reads, so that each read runs through the insert into one of the
+    adapters. The mean Phred quality decreases linearly from qual_start to qual_end along the
+    reads and the bases are mutated with a probability error_rate
+    @return Iterator of tuple (name, seq1, qual1, seq2, qual2)
+    """
+    rng = np.random.RandomState(seed)
+    adapters = [adapter.replace("N", "A") for adapter in adapters]
+    qual_mean = np.linspace(qual_start, qual_end, read_len)
+
+    for chunk_start in range(0, n_pair, chunk_size):
+        n = min(chunk_size, n_pair-chunk_start)
+
+        # Quality strings and sequencing errors are drawn for the whole chunk at once
+        quals = np.clip(np.round(qual_mean + rng.normal(0, 4, (2*n, read_len))), 2, 41).astype(np.uint8)+33
+        errors = BASES[rng.randint(0, 4, (2*n, read_len))]
+        mutated = rng.random_sample((2*n, read_len)) < error_rate
+        contaminated = rng.random_sample(n) < adapter_rate
+        insert_sizes = np.where(contaminated, rng.randint(read_len//4, read_len, n), 2*read_len)
+        adapter_index = rng.randint(0, len(adapters), (n, 2))
+
+        for i in range(n):
+            insert = BASES[rng.randint(0, 4, insert_sizes[i])].tostring()
+            tail = BASES[rng.randint(0, 4, read_len)].tostring()
+            seqs = [
+                (insert + adapters[adapter_index[i, 0]] + tail)[:read_len],
+                (reverse_complement(insert) + adapters[adapter_index[i, 1]] + tail)[:read_len]]
+
+            for j in (0, 1):
+                seq = np.array(list(seqs[j]))
+                seq[mutated[2*i+j]] = errors[2*i+j][mutated[2*i+j]]
+                seqs[j] = seq.tostring()
+
+            yield "synthetic:{}".format(chunk_start+i+1), seqs[0], quals[2*i].tostring(), seqs[1], quals[2*i+1].tostring()
+
+def make_fastq (prefix, n_pair, bgzf=True, n_thread=1, **kwargs):
+    """
+    Write synthetic read pairs in prefix_R1.fastq.gz and prefix_R2.fastq.gz. The keyword
+    arguments are passed to synthetic_pairs
+    @param bgzf Write BGZF files that can be decompressed in parallel
+    @param n_thread Number of compression threads
+    @return The paths of the R1 and R2 files and the number of bytes of uncompressed fastq
+    """
+    R1_path, R2_path = prefix+"_R1.fastq.gz", prefix+"_R2.fastq.gz"
+    out_R1 = BlockGzipWriter(R1_path, level=1, bgzf=bgzf, n_thread=n_thread)
+    out_R2 = BlockGzipWriter(R2_path, level=1, bgzf=bgzf, n_thread=n_thread)
+    size = 0
+
+    for name, seq1, qual1, seq2, qual2 in synthetic_pairs(n_pair, **kwargs):
+        fastq1 = "@{} 1:N:0:1\n{}\n+\n{}\n".format(name, seq1, qual1)
+        fastq2 = "@{} 2:N:0:1\n{}\n+\n{}\n".format(name, seq2, qual2)
+        out_R1.write(fastq1)
+        out_R2.write(fastq2)
+        size += len(fastq1)+len(fastq2)
+
+    out_R1.close()
+    out_R2.close()
+    return R1_path, R2_path, size
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+#   TOP LEVEL INSTRUCTIONS
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+if __name__ == '__main__':
+
+    optparser = optparse.OptionParser(usage = "Usage: %prog [-o synthetic -n 100000 -l 150 -a 0.3 -c 2]")
+    optparser.add_option('-o', dest="prefix", default="synthetic",
+        help= "Prefix of the fastq files [Default synthetic]")
+    optparser.add_option('-n', dest="n_pair", type="int", default=100000,
+        help= "Number of read pairs [Default 100000]")
+    optparser.add_option('-l', dest="read_len", type="int", default=150,
+        help= "Length of the reads [Default 150]")
+    optparser.add_option('-a', dest="adapter_rate", type="float", default=0.3,
+        help= "Fraction of the pairs containing adapters [Default 0.3]")
+    optparser.add_option('-c', dest="n_adapter", type="int", default=2,
+        help= "Number of different adapters [Default 2]")
+    optparser.add_option('--qual-start', dest="qual_start", type="int", default=38,
+        help= "Mean Phred quality at the beginning of the reads [Default 38]")
+    optparser.add_option('--qual-end', dest="qual_end", type="int", default=25,
+        help= "Mean Phred quality at the end of the reads [Default 25]")
+    optparser.add_option('-s', dest="seed", type="int", default=1,
+        help= "Seed of the random generator [Default 1]")
+    options, args = optparser.parse_args()
+
+    adapters = adapter_set(options.n_adapter, np.random.RandomState(options.seed))
+    R1_path, R2_path, size = make_fastq(options.prefix, options.n_pair, read_len=options.read_len,
+        adapter_rate=options.adapter_rate, adapters=adapters, qual_start=options.qual_start,
+        qual_end=options.qual_end, seed=options.seed)
+
+    print ("{}\t{}\t{} pairs\t{} MB of fastq".format(R1_path, R2_path, options.n_pair, round(size/1e6, 1)))
+    print ("adapter_list : {}".format(" ".join(adapters)))
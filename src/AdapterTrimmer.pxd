@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+#    @package    Sekator
+#    @brief      Declaration of AdapterTrimmer for the other Cython extensions
+#    @copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+#    @author     Adrien Leger - 2014
+#    * <adrien.leger@gmail.com>
+#    * <adrien.leger@inserm.fr>
+#    * <adrien.leger@univ-nantes.fr>
+#    * [Github](https://github.com/a-slide)
+#    * [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+
+#~~~~~~~CIMPORTS~~~~~~~#
+
+# C standard library import
+from libc.stdint cimport int8_t, uint8_t, int32_t, uint32_t, uint64_t
+cimport openmp
+
+# Local package import
+from ssw cimport s_profile
+
+#~~~~~~~STRUCTURES~~~~~~~#
+
+ctypedef struct s_query:
+    int32_t id
+    int32_t size
+    int8_t* seq_int
+    s_profile* profile
+    int32_t seed_len
+    uint64_t* seed_set
+    int32_t count
+    int32_t min_len
+    int32_t min_score
+
+#    @typedef struct to store adapters information
+#    @field  id          Number of identification
+#    @field  size        Size of the reference in base
+#    @field  seq_int     Base sequence converted in numeric values (A,a=0; C,c=1; G,g=2; T,t=3; other char = 4)
+#    @field  profile     SSW query profile computed once and reused for all the reads
+#    @field  seed_len    Length of the exact seeds, 0 if the adapter cannot be prefiltered
+#    @field  seed_set    Bitset of the 2 bits packed seeds found in the adapter (4^seed_len bits)
+#    @field  count       Number of time the adapter is found
+#    @field  min_len     Minimal length of the adapter to match on the reference
+#    @field  min_score   Minimal score of the adapter match on the reference
+
+ctypedef struct s_counts:
+    uint64_t total
+    uint64_t untrimmed
+    uint64_t trimmed
+    uint64_t fail
+    uint64_t base_trimmed
+    uint64_t reverse_skipped
+    uint64_t prefiltered
+    uint64_t align_skipped
+    uint64_t stub_trimmed
+    uint64_t memo_hit
+    uint64_t memo_miss
+
+#    @typedef struct to store the trimming counters
+#    @field  total           Number of reads analysed
+#    @field  untrimmed       Number of reads without adapter
+#    @field  trimmed         Number of reads trimmed
+#    @field  fail            Number of reads too short after trimming
+#    @field  base_trimmed    Number of bases removed
+#    @field  reverse_skipped Number of reverse SSW passes skipped because of a too low score
+#    @field  prefiltered     Number of reads not aligned at all thanks to the seed prefilter
+#    @field  align_skipped   Number of alignments skipped thanks to the seed prefilter
+#    @field  stub_trimmed    Number of reads trimmed at a short adapter stub ending the read
+#    @field  memo_hit        Number of reads whose result was found in the memoization cache
+#    @field  memo_miss       Number of reads aligned and added to the memoization cache
+
+ctypedef struct s_memo:
+    uint64_t key
+    uint64_t check
+    uint64_t found
+    int32_t size
+    int32_t start
+    int32_t end
+    int32_t base_trimmed
+    int8_t status
+    int8_t stub
+    int8_t ref
+
+#    @typedef struct to store a trimming result in the memoization cache
+#    @field  key             Hash of the encoded read sequence selecting the set of the entry
+#    @field  check           Second independent hash of the sequence verifying the match
+#    @field  found           Bitmask of the adapters found in the read
+#    @field  size            Length of the read, -1 for an empty entry
+#    @field  start           Start of the interval
+#    @field  end             End of the interval (excluded)
+#    @field  base_trimmed    Number of bases removed
+#    @field  status          UNTRIMMED, TRIMMED or FAIL
+#    @field  stub            1 if the read was trimmed at an adapter stub
+#    @field  ref             CLOCK reference bit, set when the entry is used
+
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+cdef class AdapterTrimmer:
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~SELF VARIABLES DEFINITION~~~~~~~#
+
+    cdef:
+        uint32_t min_size, n_query
+        s_counts counts
+        int8_t ssw_match, ssw_mismatch, ssw_gapO, ssw_gapE
+        int8_t* score_mat
+        s_query* ql
+        bint anchor_3prime
+        int32_t search_window, min_stub
+        s_memo* memo
+        uint8_t* memo_hand
+        uint64_t n_memo_set
+        openmp.omp_lock_t memo_lock
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    cdef int32_t trim_core (self, int8_t* seq_int, int32_t seq_size, int8_t* bool_mat,
+        int32_t* start, int32_t* end, s_counts* counts, int32_t* found) nogil
+    cdef int32_t align_core (self, int8_t* seq_int, int32_t seq_size, int8_t* bool_mat,
+        int32_t* start, int32_t* end, s_counts* counts, int32_t* found, uint64_t* mask) nogil
+    cdef int32_t trim_3prime (self, int8_t* seq_int, int32_t seq_size, int8_t has_n,
+        int32_t* start, int32_t* end, s_counts* counts, int32_t* found, uint64_t* mask) nogil
+    cdef int8_t memo_get (self, uint64_t key, uint64_t check, int32_t seq_size, s_memo* entry) nogil
+    cdef void memo_put (self, s_memo* entry) nogil
+    cdef int32_t find_stub (self, int8_t* seq_int, int32_t seq_size) nogil
+    cdef int32_t trim_seq (self, const unsigned char* seq, int32_t seq_size, int8_t* seq_int,
+        int8_t* bool_mat, int32_t* start, int32_t* end) nogil
+    cdef s_query build_query (self, int32_t n, char* seq, float min_match_len, float min_match_score)
+    cdef int32_t seed_length (self, s_query q)
@@ -16,28 +16,41 @@
 # C standard library import
 from libc.stdint cimport int8_t, int16_t, int32_t, int64_t, uint8_t, uint16_t, uint32_t, uint64_t
 from libc.stdlib cimport malloc, calloc, free
+from cython.parallel cimport parallel, prange
+cimport cython
+cimport openmp
 
 # Local package import
-from ssw cimport s_align, score_matrix, DNA_seq_to_int, ssw_align
+from ssw cimport s_align, s_profile, score_matrix, DNA_seq_to_int, DNA_seq_fill_int, ssw_simd_init, ssw_init, init_destroy, ssw_align_profile
 
-#~~~~~~~STRUCTURES~~~~~~~#
+#~~~~~~~GLOBAL IMPORTS~~~~~~~#
 
-ctypedef struct s_query:
-    int32_t id
-    int32_t size
-    int8_t* seq_int
-    int32_t count
-    int32_t min_len
-    int32_t min_score
+# Third party package import
+import numpy as np
 
-#    @typedef struct to store adapters information
-#    @field  id          Number of identification
-#    @field  size        Size of the reference in base
-#    @field  seq_int     Base sequence converted in numeric values (A,a=0; C,c=1; G,g=2; T,t=3; other char = 4)
-#    @field  count       Number of time the adapter is found
-#    @field  min_len     Minimal length of the adapter to match on the reference
-#    @field  min_score   Minimal score of the adapter match on the reference
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
 
+# Bounds of the exact seed length used by the k-mer prefilter. Shorter seeds would hit almost all
+# the reads and longer seeds would need a too large bitset (4^k bits per adapter)
+DEF SEED_MIN = 8
+DEF SEED_MAX = 10
+
+# Number of entries per set of the memoization cache, and maximal number of adapters whose matches
+# can be stored in the bitmask of the entries
+DEF MEMO_WAYS = 4
+DEF MEMO_MAX_QUERY = 64
+
+# Select the widest SIMD kernels supported by the CPU once at import
+SIMD = "AVX2" if ssw_simd_init(1) else "SSE2"
+
+# Maximal number of adapters of a trimmer with a memoization cache, larger lists disable the cache
+MEMO_MAX_ADAPTERS = MEMO_MAX_QUERY
+
+# Status of the reads returned by trim_batch
+cpdef enum:
+    UNTRIMMED = 0
+    TRIMMED = 1
+    FAIL = 2
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 cdef class AdapterTrimmer:
@@ -49,19 +62,14 @@ cdef class AdapterTrimmer:
 
     #~~~~~~~SELF VARIABLES DEFINITION~~~~~~~#
 
-    cdef:
-        uint32_t min_size, n_query, total, untrimmed, trimmed, fail
-        uint64_t base_trimmed
-        int8_t ssw_match, ssw_mismatch, ssw_gapO, ssw_gapE
-        int8_t* score_mat
-        s_query* ql
-
+    # Declared in AdapterTrimmer.pxd with the structures to be shared with the other extensions
 
     #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
 
     def __init__(self, list adapter_list, int32_t min_size=30,\
         float min_match_len=0.3, float min_match_score=1, int8_t ssw_match=2,\
-        int8_t ssw_mismatch=2, int8_t ssw_gapO=3, int8_t ssw_gapE=1):
+        int8_t ssw_mismatch=2, int8_t ssw_gapO=3, int8_t ssw_gapE=1,\
+        bint anchor_3prime=False, int32_t search_window=0, int32_t min_stub=0, float memo_size=0):
 
 #        Initialize AdapterTrimmer from a list of adapter sequence and compute the score matrix
 #        based on the provided ssw scores.
@@ -73,21 +81,31 @@ cdef class AdapterTrimmer:
 #        @param ssw_mismatch    Penalty in case of mismatch (POSITIVE)
 #        @param ssw_gapO        Penalty in case of gap opening (POSITIVE)
 #        @param ssw_gapE        Penalty in case of gap extension (POSITIVE)
+#        @param anchor_3prime   Trim the reads from the first adapter match to their 3' end instead
+#                               of keeping the longest interval without adapter
+#        @param search_window   In 3' mode, align the adapters only on the last search_window bases
+#                               of the reads (0 = whole read)
+#        @param min_stub        In 3' mode, minimal length of the adapter prefixes searched at the
+#                               end of the reads without adapter match (0 = no stub search)
+#        @param memo_size       Memory in MB of the cache of the trimming results of the sequences
+#                               already seen, for libraries with many duplicated reads (0 = no cache).
+#                               The cache is silently disabled with more than MEMO_MAX_ADAPTERS adapters
 #        @note Default values determined for 100pb reads with randomly generated 60 pb adaptors
 
+        cdef uint64_t i
+
         # Store self value for future usage
         self.min_size = min_size
         self.ssw_match = ssw_match
         self.ssw_mismatch = ssw_mismatch
         self.ssw_gapO = ssw_gapO
         self.ssw_gapE = ssw_gapE
+        self.anchor_3prime = anchor_3prime
+        self.search_window = search_window
+        self.min_stub = min_stub
 
         # Init Counters
-        self.total = 0
-        self.untrimmed = 0
-        self.trimmed = 0
-        self.fail = 0
-        self.base_trimmed = 0
+        self.counts = s_counts(0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
 
         # Init a score matrix
         self.score_mat = score_matrix (ssw_match, ssw_mismatch)
@@ -98,17 +116,37 @@ cdef class AdapterTrimmer:
         for n, seq in enumerate(adapter_list):
             self.ql[n] = self.build_query (n, seq, min_match_len, min_match_score)
 
+        # Init the memoization cache, organized in sets of MEMO_WAYS entries with a CLOCK hand each
+        self.memo = NULL
+        self.memo_hand = NULL
+        self.n_memo_set = 0
+        openmp.omp_init_lock(&self.memo_lock)
+        if memo_size > 0 and self.n_query <= MEMO_MAX_QUERY:
+            self.n_memo_set = max(1, <uint64_t>(memo_size*1024*1024) / (MEMO_WAYS*sizeof(s_memo)))
+            self.memo = <s_memo*>malloc(self.n_memo_set * MEMO_WAYS * sizeof(s_memo))
+            self.memo_hand = <uint8_t*>calloc(self.n_memo_set, sizeof(uint8_t))
+            for i in range(self.n_memo_set * MEMO_WAYS):
+                self.memo[i].size = -1
+
     def __str__(self):
         msg = "ADAPTER TRIMMER CLASS\n"
         msg += "Minimal size:{} Total:{} Untrimmed:{} Trimmed:{} Fail:{} Base Trimmed:{}\n".format(
-            self.min_size, self.total, self.untrimmed, self.trimmed, self.fail, self.base_trimmed)
+            self.min_size, self.counts.total, self.counts.untrimmed, self.counts.trimmed, self.counts.fail,
+            self.counts.base_trimmed)
+        msg += "Reverse alignment passes skipped:{}\n".format(self.counts.reverse_skipped)
+        msg += "Reads prefiltered:{} Alignments skipped:{}\n".format(self.counts.prefiltered, self.counts.align_skipped)
+        msg += "3' anchored:{} Search window:{} Minimal stub:{} Stubs trimmed:{}\n".format(
+            self.anchor_3prime, self.search_window, self.min_stub, self.counts.stub_trimmed)
+        msg += "Memoization cache entries:{} Hits:{} Misses:{}\n".format(
+            self.n_memo_set*MEMO_WAYS, self.counts.memo_hit, self.counts.memo_miss)
         msg += "Number of adater (+rc) : {}\n".format(self.n_query)
         msg += "List of adapter\n"
         for i in range(self.n_query):
-            msg += "\tID:{} Size:{} Found:{} Min len:{} Min score:{}\n".format(
-                self.ql[i].id, self.ql[i].size, self.ql[i].count, self.ql[i].min_len, self.ql[i].min_score)
+            msg += "\tID:{} Size:{} Found:{} Min len:{} Min score:{} Seed len:{}\n".format(
+                self.ql[i].id, self.ql[i].size, self.ql[i].count, self.ql[i].min_len, self.ql[i].min_score,
+                self.ql[i].seed_len)
             msg += "\tInteger sequence : {}\n".format("".join([str(self.ql[i].seq_int[j]) for j in range(self.ql[i].size)]))
-        msg += "SSW parameters\n"
+        msg += "SSW parameters ({} kernels)\n".format(SIMD)
         msg += "Match:{} Mismatch:{} Ambiguous:{} Gap Open:{} Gap extend:{}\n".format(
             self.ssw_match, self.ssw_mismatch, 0, self.ssw_gapO, self.ssw_gapE)
         msg += "Score matrix\n"
@@ -128,10 +166,15 @@ cdef class AdapterTrimmer:
         # Free memory
 
         for i in range(self.n_query):
+            init_destroy(self.ql[i].profile)
+            free(self.ql[i].seed_set)
             free(self.ql[i].seq_int)
 
         free(self.ql)
         free(self.score_mat)
+        free(self.memo)
+        free(self.memo_hand)
+        openmp.omp_destroy_lock(&self.memo_lock)
 
     #~~~~~~~PUBLIC METHODS~~~~~~~#
 
@@ -139,47 +182,259 @@ cdef class AdapterTrimmer:
 
 #        Find imperfect adapter matches with ssw algorithm and extract the larger interval of
 #        reference sequence that do not overlap interval match
-#        @param seq a Fastq.FastqSeq object
+#        @param seq a ReadBatch.FastqRead or Fastq.FastqSeq object
 
         cdef:
-            int32_t seq_size, i, start_max=0, end_max=0, inter_max=0, start=0, inter=0
+            int32_t seq_size, status, start=0, end=0
             int8_t* seq_int
             int8_t* bool_mat
-            s_align res
-            int8_t found = 0
-            s_query query
-
-        self.total += 1
 
         # Prepare the reference sequence by converting the HTSfastq sequence in int8_t*
         seq_size = len(seq)
         seq_int = DNA_seq_to_int(seq.seq, seq_size)
+        bool_mat = <int8_t *>malloc(seq_size * sizeof(int8_t))
+
+        status = self.trim_core(seq_int, seq_size, bool_mat, &start, &end, &self.counts, NULL)
+
+        # Dealoc int8_t* allocated for seq_int and bool_mat
+        free(seq_int) ##
+        free(bool_mat) ##
+
+        # Return an unchanged sequence if no significant match were found
+        if status == UNTRIMMED:
+            return seq
+
+        # Return None if the size of the longer interval is too short
+        if status == FAIL:
+            return None
+
+        # Finally in the last case
+        return seq[start:end]
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def trim_batch (self, seqs, quals, lengths, int num_threads=0):
+
+#        Same as __call__ for a block of reads packed in a contiguous buffer. The alignments are done
+#        without the GIL by a pool of OpenMP threads, each of them using its own scratch arrays.
+#        @param seqs        Buffer of the concatenated sequences of the reads
+#        @param quals       Buffer of the concatenated qualities (unused by the adapter trimming, but
+#                           accepted to share the same batch interface than the quality trimmers)
+#        @param lengths     Sequence of the lengths of the reads in the buffers
+#        @param num_threads Number of OpenMP threads (0 = OpenMP default)
+#        @return 3 numpy arrays containing the start, the end (excluded) and the status (UNTRIMMED,
+#                TRIMMED or FAIL) of each read
+
+        cdef:
+            const unsigned char[:] seq_view = seqs
+            int32_t[:] len_view
+            Py_ssize_t n_read, i
+            int64_t[:] offset_view
+            int32_t[:] start_view, end_view
+            int8_t[:] status_view
+            int32_t j, max_len = 0
+            int8_t* seq_int
+            int8_t* bool_mat
+            int32_t* found
+            s_counts* counts
+
+        # Offsets of the reads in the packed buffer and size of the scratch arrays
+        lengths = np.ascontiguousarray(lengths, dtype=np.int32)
+        n_read = lengths.shape[0]
+        offsets = np.zeros(n_read, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)[:n_read-1]
+        len_view = lengths
+        offset_view = offsets
+        for i in range(n_read):
+            if len_view[i] > max_len:
+                max_len = len_view[i]
+        if n_read and offset_view[n_read-1] + len_view[n_read-1] > seq_view.shape[0]:
+            raise ValueError("The sequence buffer is shorter than the sum of the read lengths")
+
+        starts = np.zeros(n_read, dtype=np.int32)
+        ends = np.zeros(n_read, dtype=np.int32)
+        status = np.zeros(n_read, dtype=np.int8)
+        start_view = starts
+        end_view = ends
+        status_view = status
+
+        if num_threads <= 0:
+            num_threads = openmp.omp_get_max_threads()
+
+        with nogil, parallel(num_threads=num_threads):
+
+            # Thread private scratch arrays and counters
+            seq_int = <int8_t *>malloc((max_len+1) * sizeof(int8_t))
+            bool_mat = <int8_t *>malloc((max_len+1) * sizeof(int8_t))
+            found = <int32_t *>calloc(self.n_query+1, sizeof(int32_t))
+            counts = <s_counts *>calloc(1, sizeof(s_counts))
+
+            for i in prange(n_read, schedule="dynamic", chunksize=64):
+                DNA_seq_fill_int(<char*>&seq_view[offset_view[i]] if len_view[i] else NULL, len_view[i], seq_int)
+                status_view[i] = self.trim_core(seq_int, len_view[i], bool_mat, &start_view[i], &end_view[i], counts, found)
+
+            # Merge the thread counters in the object counters
+            with gil:
+                add_counts(&self.counts, counts)
+                for j in range(self.n_query):
+                    self.ql[j].count += found[j]
+
+            free(seq_int)
+            free(bool_mat)
+            free(found)
+            free(counts)
+
+        return starts, ends, status
+
+    def get_summary (self):
+
+        cdef:
+            dict summary
+            int32_t i
+
+        summary = {}
+        summary["total"] = int(self.counts.total)
+        summary["untrimmed"] = int(self.counts.untrimmed)
+        summary["trimmed"] = int(self.counts.trimmed)
+        summary["fail"] = int(self.counts.fail)
+        summary["base_trimmed"] = int(self.counts.base_trimmed)
+        summary["reverse_skipped"] = int(self.counts.reverse_skipped)
+        summary["prefiltered"] = int(self.counts.prefiltered)
+        summary["align_skipped"] = int(self.counts.align_skipped)
+        summary["stub_trimmed"] = int(self.counts.stub_trimmed)
+        summary["memo_hit"] = int(self.counts.memo_hit)
+        summary["memo_miss"] = int(self.counts.memo_miss)
+        summary["adapter_found"] = []
+
+        for i in range(self.n_query):
+            summary["adapter_found"].append(int(self.ql[i].count))
+
+        return summary
+
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    cdef int32_t trim_core (self, int8_t* seq_int, int32_t seq_size, int8_t* bool_mat,
+        int32_t* start, int32_t* end, s_counts* counts, int32_t* found) nogil:
+#       Trim an integer encoded read, reusing the result of an identical sequence from the
+#       memoization cache if enabled. Does not require the GIL and can be called concurrently with
+#       distinct scratch arrays
+#       @param seq_int  Read sequence encoded by DNA_seq_to_int
+#       @param seq_size Length of the read
+#       @param bool_mat Scratch array of at least seq_size bytes
+#       @param start    Return the start of the interval
+#       @param end      Return the end of the interval (excluded)
+#       @param counts   Counters to update
+#       @param found    Array of per adapter counts to update, or NULL to update the adapter structures
+#       @return UNTRIMMED, TRIMMED or FAIL
+        cdef:
+            s_memo entry
+            uint64_t base_trimmed, stub_trimmed
+            int32_t i
+
+        counts.total += 1
+
+        if self.memo == NULL:
+            entry.found = 0
+            return self.align_core(seq_int, seq_size, bool_mat, start, end, counts, found, &entry.found)
+
+        entry.key = memo_hash(seq_int, seq_size, &entry.check)
+
+        # Replay the counters of the cached result, except the ones of the alignment work
+        if self.memo_get(entry.key, entry.check, seq_size, &entry):
+            counts.memo_hit += 1
+            if entry.status == UNTRIMMED:
+                counts.untrimmed += 1
+            elif entry.status == TRIMMED:
+                counts.trimmed += 1
+            else:
+                counts.fail += 1
+            counts.base_trimmed += entry.base_trimmed
+            counts.stub_trimmed += entry.stub
+            for i in range(self.n_query):
+                if entry.found & (1ULL << i):
+                    if found == NULL:
+                        self.ql[i].count += 1
+                    else:
+                        found[i] += 1
+            start[0] = entry.start
+            end[0] = entry.end
+            return entry.status
+
+        counts.memo_miss += 1
+        base_trimmed = counts.base_trimmed
+        stub_trimmed = counts.stub_trimmed
+        entry.found = 0
+        entry.status = self.align_core(seq_int, seq_size, bool_mat, start, end, counts, found, &entry.found)
+        entry.size = seq_size
+        entry.start = start[0]
+        entry.end = end[0]
+        entry.base_trimmed = counts.base_trimmed - base_trimmed
+        entry.stub = counts.stub_trimmed - stub_trimmed
+        self.memo_put(&entry)
+        return entry.status
+
+    cdef int32_t align_core (self, int8_t* seq_int, int32_t seq_size, int8_t* bool_mat,
+        int32_t* start, int32_t* end, s_counts* counts, int32_t* found, uint64_t* mask) nogil:
+#       Align all the adapters against an integer encoded read and find the longer interval without
+#       adapter
+#       @param mask     Bitmask receiving the adapters found (only the MEMO_MAX_QUERY first)
+#       Other parameters and return value as trim_core
+        cdef:
+            int32_t i, j, start_max=0, end_max=0, inter_max=0, begin=0, inter=0
+            s_align res
+            int8_t match = 0, aligned = 0, has_n = 0
+
+        # Ambiguous bases of the read are not penalized by the score matrix, the prefilter is lossless
+        # only for reads without N
+        for i in range(seq_size):
+            if seq_int[i] == 4:
+                has_n = 1
+                break
+
+        if self.anchor_3prime:
+            return self.trim_3prime(seq_int, seq_size, has_n, start, end, counts, found, mask)
 
         # Init a zero padded matrix of short 8 bits int
-        bool_mat = <int8_t *>malloc(seq_size * sizeof(int8_t))
         for i in range(seq_size):
             bool_mat[i] = 0
 
         # Iterate over the adapter query sequence to align against the reference read
         for i in range(self.n_query):
-            res = ssw_align(
-                query = self.ql[i].seq_int,
-                queryLen = self.ql[i].size,
+
+            # Skip the alignment if the read does not share any exact seed with the adapter
+            if not has_n and self.ql[i].seed_len and not seed_hit(&self.ql[i], seq_int, seq_size):
+                counts.align_skipped += 1
+                continue
+
+            aligned = 1
+            res = ssw_align_profile(
+                prof = self.ql[i].profile,
                 ref = seq_int,
                 refLen = seq_size,
-                mat = self.score_mat,
                 gapO = self.ssw_gapO,
-                gapE = self.ssw_gapE)
+                gapE = self.ssw_gapE,
+                filter = self.ql[i].min_score if self.ql[i].min_score > 0 else 0)
+
+            # The beginning position was not searched since the score is too low
+            if res.ref_begin == -1:
+                counts.reverse_skipped += 1
+                continue
 
             # Update bool mat and counters if the score is high enough
             if res.score >= self.ql[i].min_score and res.ref_end-res.ref_begin >= self.ql[i].min_len:
-                self.ql[i].count += 1
-                found = 1
-                for i in range (res.ref_begin, res.ref_end+1):
-                    bool_mat[i] = 1
-
-        # Dealoc int8_t* allocated for seq_int
-        free(seq_int) ##
+                if found == NULL:
+                    self.ql[i].count += 1
+                else:
+                    found[i] += 1
+                if i < MEMO_MAX_QUERY:
+                    mask[0] |= 1ULL << i
+                match = 1
+                for j in range (res.ref_begin, res.ref_end+1):
+                    bool_mat[j] = 1
+
+        if not aligned:
+            counts.prefiltered += 1
 
         # Print bool mat with number to verify the match
 #        print ("".join(["{:<3}".format(i) for i in range (seq_size)]))
@@ -188,58 +443,195 @@ cdef class AdapterTrimmer:
 #            bool_str += "{}".format("XXX" if bool_mat[i] else "---")
 #        print (bool_str)
 
-        # Return an unchanged sequence if no significant match were found
-        if not found:
-            self.untrimmed += 1
-            free(bool_mat) ##
-            return seq
+        # Unchanged sequence if no significant match were found
+        if not match:
+            counts.untrimmed += 1
+            start[0] = 0
+            end[0] = seq_size
+            return UNTRIMMED
 
         # Find the longer interval without primers
         for i in range(seq_size):
             if bool_mat[i]:
-                start = i+1
+                begin = i+1
                 inter = 0
             else:
                 inter += 1
                 if inter > inter_max:
                     inter_max = inter
-                    start_max = start
+                    start_max = begin
                     end_max = i
         #print ("start {}  end {}  inter {}".format(start_max, end_max, inter_max))
 
-        free(bool_mat) ##
-        self.base_trimmed += seq_size-inter_max
+        counts.base_trimmed += seq_size-inter_max
 
-        # Return None if the size of the longer interval
+        # Fail if the size of the longer interval is too short
         if inter_max < self.min_size:
-            self.fail += 1
-            return None
+            counts.fail += 1
+            start[0] = 0
+            end[0] = 0
+            return FAIL
 
         # Finally in the last case
-        self.trimmed += 1
-        return seq[start_max:end_max+1]
-
-    def get_summary (self):
-
+        counts.trimmed += 1
+        start[0] = start_max
+        end[0] = end_max+1
+        return TRIMMED
+
+    cdef int32_t trim_3prime (self, int8_t* seq_int, int32_t seq_size, int8_t has_n,
+        int32_t* start, int32_t* end, s_counts* counts, int32_t* found, uint64_t* mask) nogil:
+#       3' anchored trimming: the adapters are only aligned on the tail of the read and the read is
+#       cut at the beginning of the first adapter match, removing everything downstream. Without
+#       match, the end of the read is compared with the beginning of the adapters to find short
+#       stubs that are too short for the alignment thresholds
+#       @param has_n    1 if the read contains ambiguous bases (disables the seed prefilter)
+#       Other parameters and return value as align_core
         cdef:
-            dict summary
-            int32_t i
+            int32_t i, win_start = 0, win_size, cut = seq_size, stub
+            s_align res
+            int8_t match = 0, aligned = 0
 
-        summary = {}
-        summary["total"] = int(self.total)
-        summary["untrimmed"] = int(self.untrimmed)
-        summary["trimmed"] = int(self.trimmed)
-        summary["fail"] = int(self.fail)
-        summary["base_trimmed"] = int(self.base_trimmed)
-        summary["adapter_found"] = []
+        # Restrict the alignments to the tail of the read
+        if self.search_window and seq_size > self.search_window:
+            win_start = seq_size - self.search_window
+        win_size = seq_size - win_start
 
         for i in range(self.n_query):
-            summary["adapter_found"].append(int(self.ql[i].count))
 
-        return summary
+            # Skip the alignment if the window does not share any exact seed with the adapter
+            if not has_n and self.ql[i].seed_len and not seed_hit(&self.ql[i], seq_int+win_start, win_size):
+                counts.align_skipped += 1
+                continue
 
+            aligned = 1
+            res = ssw_align_profile(
+                prof = self.ql[i].profile,
+                ref = seq_int+win_start,
+                refLen = win_size,
+                gapO = self.ssw_gapO,
+                gapE = self.ssw_gapE,
+                filter = self.ql[i].min_score if self.ql[i].min_score > 0 else 0)
 
-    #~~~~~~~PRIVATE METHODS~~~~~~~#
+            if res.ref_begin == -1:
+                counts.reverse_skipped += 1
+                continue
+
+            # Keep the most upstream match
+            if res.score >= self.ql[i].min_score and res.ref_end-res.ref_begin >= self.ql[i].min_len:
+                if found == NULL:
+                    self.ql[i].count += 1
+                else:
+                    found[i] += 1
+                if i < MEMO_MAX_QUERY:
+                    mask[0] |= 1ULL << i
+                match = 1
+                if win_start + res.ref_begin < cut:
+                    cut = win_start + res.ref_begin
+
+        if not aligned:
+            counts.prefiltered += 1
+
+        # Search for an adapter stub at the very end of the read
+        if not match and self.min_stub:
+            stub = self.find_stub(seq_int, seq_size)
+            if stub:
+                counts.stub_trimmed += 1
+                match = 1
+                cut = seq_size - stub
+
+        if not match:
+            counts.untrimmed += 1
+            start[0] = 0
+            end[0] = seq_size
+            return UNTRIMMED
+
+        counts.base_trimmed += seq_size-cut
+
+        if cut < self.min_size:
+            counts.fail += 1
+            start[0] = 0
+            end[0] = 0
+            return FAIL
+
+        counts.trimmed += 1
+        start[0] = 0
+        end[0] = cut
+        return TRIMMED
+
+    cdef int32_t find_stub (self, int8_t* seq_int, int32_t seq_size) nogil:
+#       Find the longest suffix of the read matching the prefix of one of the adapters, with at
+#       most 1 mismatch per 10 bases. Ambiguous bases of the read or of the adapter always match
+#       @return The length of the stub or 0 if none of at least min_stub bases was found
+        cdef:
+            int32_t i, j, k, k_max, mismatch, best = 0
+
+        for i in range(self.n_query):
+            k_max = self.ql[i].size if self.ql[i].size < seq_size else seq_size
+            k = k_max
+            while k >= self.min_stub and k > best:
+                mismatch = 0
+                for j in range(k):
+                    if seq_int[seq_size-k+j] != self.ql[i].seq_int[j] and seq_int[seq_size-k+j] != 4 and self.ql[i].seq_int[j] != 4:
+                        mismatch += 1
+                        if mismatch > k/10:
+                            break
+                if mismatch <= k/10:
+                    best = k
+                    break
+                k -= 1
+
+        return best
+
+    cdef int8_t memo_get (self, uint64_t key, uint64_t check, int32_t seq_size, s_memo* entry) nogil:
+#       Search a sequence in the memoization cache and mark the entry found as recently used
+#       @param key, check Hashes of the sequence computed by memo_hash
+#       @param seq_size   Length of the sequence
+#       @param entry      Return a copy of the entry found
+#       @return 1 if the sequence was found, else 0
+        cdef:
+            s_memo* ways = &self.memo[(key % self.n_memo_set) * MEMO_WAYS]
+            int32_t i
+
+        openmp.omp_set_lock(&self.memo_lock)
+        for i in range(MEMO_WAYS):
+            if ways[i].key == key and ways[i].check == check and ways[i].size == seq_size:
+                ways[i].ref = 1
+                entry[0] = ways[i]
+                openmp.omp_unset_lock(&self.memo_lock)
+                return 1
+        openmp.omp_unset_lock(&self.memo_lock)
+        return 0
+
+    cdef void memo_put (self, s_memo* entry) nogil:
+#       Store an entry in its set of the memoization cache. The CLOCK hand of the set moves over
+#       the entries, clearing their reference bit, until it finds an empty or not recently used
+#       entry to replace
+        cdef:
+            uint64_t n = entry.key % self.n_memo_set
+            s_memo* ways = &self.memo[n * MEMO_WAYS]
+
+        openmp.omp_set_lock(&self.memo_lock)
+        while ways[self.memo_hand[n]].size != -1 and ways[self.memo_hand[n]].ref:
+            ways[self.memo_hand[n]].ref = 0
+            self.memo_hand[n] = (self.memo_hand[n] + 1) % MEMO_WAYS
+        ways[self.memo_hand[n]] = entry[0]
+        ways[self.memo_hand[n]].ref = 0
+        self.memo_hand[n] = (self.memo_hand[n] + 1) % MEMO_WAYS
+        openmp.omp_unset_lock(&self.memo_lock)
+
+    cdef int32_t trim_seq (self, const unsigned char* seq, int32_t seq_size, int8_t* seq_int,
+        int8_t* bool_mat, int32_t* start, int32_t* end) nogil:
+#       Encode a read sequence and trim it with the counters of the object, for the compiled callers
+#       working directly on packed sequences
+#       @param seq      Sequence of the read, not necessarily null terminated
+#       @param seq_size Length of the read
+#       @param seq_int  Scratch array of at least seq_size bytes receiving the encoded sequence
+#       @param bool_mat Scratch array of at least seq_size bytes
+#       @param start    Return the start of the interval
+#       @param end      Return the end of the interval (excluded)
+#       @return UNTRIMMED, TRIMMED or FAIL
+        DNA_seq_fill_int(<const char*>seq, seq_size, seq_int)
+        return self.trim_core(seq_int, seq_size, bool_mat, start, end, &self.counts, NULL)
 
     cdef s_query build_query (self, int32_t n, char* seq, float min_match_len, float min_match_score):
 #       Create a query struct and fill the fields
@@ -248,8 +640,119 @@ cdef class AdapterTrimmer:
         q.id = n
         q.size = len(seq)
         q.seq_int = DNA_seq_to_int(seq, q.size)
+        q.profile = ssw_init(q.seq_int, q.size, self.score_mat)
         q.count = 0
         q.min_len = <int32_t>(min_match_len*q.size) # compute min len and cast in int32_t
         q.min_score = <int32_t>(min_match_score*q.size) # compute min score and cast in int32_t
 
+        # Index the exact seeds of the adapter if a lossless seed length can be used
+        q.seed_len = self.seed_length(q)
+        q.seed_set = NULL
+        if q.seed_len:
+            q.seed_set = build_seed_set(q.seq_int, q.size, q.seed_len)
+
         return q
+
+    cdef int32_t seed_length (self, s_query q):
+#       Compute the longest exact seed that any alignment passing the score threshold has to contain.
+#       An alignment with M matches split by B breaks (mismatches, gaps and runs of N of the adapter)
+#       contains a run of at least ceil(M/(B+1)) identical bases. The lowest bound over all the
+#       combinations of mismatches and gaps reaching min_score is used.
+#       @return The seed length or 0 if it is too short to be useful
+        cdef:
+            int32_t n_run = 0, seed = q.size, x, g, g_max, m, breaks, run, i
+
+        if q.min_score <= 0 or self.ssw_match <= 0:
+            return 0
+
+        # Count the runs of ambiguous bases in the adapter
+        for i in range(q.size):
+            if q.seq_int[i] == 4 and (i == 0 or q.seq_int[i-1] != 4):
+                n_run += 1
+
+        g_max = (q.size*self.ssw_match - q.min_score) / self.ssw_gapO
+        for x in range(q.size+1):
+            for g in range(g_max+1):
+                # Minimal number of matches to reach min_score with x mismatches and g gaps
+                m = (q.min_score + x*self.ssw_mismatch + g*self.ssw_gapO + self.ssw_match-1) / self.ssw_match
+                if m + x > q.size:
+                    continue
+                breaks = x + g + n_run
+                run = (m + breaks) / (breaks + 1)
+                if run < seed:
+                    seed = run
+
+        if seed < SEED_MIN:
+            return 0
+        return seed if seed < SEED_MAX else SEED_MAX
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+cdef inline void add_counts (s_counts* dest, s_counts* src) nogil:
+#   Add the values of the src counters to the dest counters
+    dest.total += src.total
+    dest.untrimmed += src.untrimmed
+    dest.trimmed += src.trimmed
+    dest.fail += src.fail
+    dest.base_trimmed += src.base_trimmed
+    dest.reverse_skipped += src.reverse_skipped
+    dest.prefiltered += src.prefiltered
+    dest.align_skipped += src.align_skipped
+    dest.stub_trimmed += src.stub_trimmed
+    dest.memo_hit += src.memo_hit
+    dest.memo_miss += src.memo_miss
+
+cdef inline uint64_t mix64 (uint64_t h) nogil:
+#   Finalizer of MurmurHash3 spreading the bits of a 64 bits hash
+    h ^= h >> 33
+    h *= 0xff51afd7ed558ccdULL
+    h ^= h >> 33
+    h *= 0xc4ceb9fe1a85ec53ULL
+    h ^= h >> 33
+    return h
+
+cdef inline uint64_t memo_hash (int8_t* seq_int, int32_t size, uint64_t* check) nogil:
+#   Compute 2 independent 64 bits hashes of an encoded sequence, FNV-1a for the key and a
+#   multiplicative hash for the check. A wrong cache hit requires 2 different sequences of the same
+#   length colliding on both hashes
+    cdef:
+        uint64_t h1 = 0xcbf29ce484222325ULL, h2 = <uint64_t>size
+        int32_t i
+
+    for i in range(size):
+        h1 = (h1 ^ <uint8_t>seq_int[i]) * 0x100000001b3ULL
+        h2 = (h2 + <uint8_t>seq_int[i] + 1) * 0x9e3779b97f4a7c15ULL
+    check[0] = mix64(h2)
+    return mix64(h1)
+
+cdef uint64_t* build_seed_set (int8_t* seq_int, int32_t size, int32_t seed_len):
+#   Create a bitset of all the 2 bits packed seeds of seed_len bases without N found in seq_int
+    cdef:
+        uint64_t* seed_set
+        uint64_t kmer = 0, mask = (1ULL << (2*seed_len)) - 1
+        int32_t i, valid = 0
+
+    seed_set = <uint64_t*>calloc(((1ULL << (2*seed_len)) + 63) / 64, sizeof(uint64_t))
+    for i in range(size):
+        if seq_int[i] == 4:
+            valid = 0
+            continue
+        kmer = ((kmer << 2) | seq_int[i]) & mask
+        valid += 1
+        if valid >= seed_len:
+            seed_set[kmer >> 6] |= 1ULL << (kmer & 63)
+
+    return seed_set
+
+cdef inline int8_t seed_hit (s_query* q, int8_t* seq_int, int32_t size) nogil:
+#   Return 1 if any seed of the read (without N) is found in the seed set of the query
+    cdef:
+        uint64_t kmer = 0, mask = (1ULL << (2*q.seed_len)) - 1
+        int32_t i
+
+    for i in range(size):
+        kmer = ((kmer << 2) | seq_int[i]) & mask
+        if i >= q.seed_len-1 and q.seed_set[kmer >> 6] & (1ULL << (kmer & 63)):
+            return 1
+
+    return 0
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+"""
+@package    Sekator
+@brief      Gzip file reader decompressing ahead in background threads
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~GLOBAL IMPORTS~~~~~~~#
+
+# Standard library imports
+from multiprocessing.pool import ThreadPool
+from collections import deque
+from itertools import chain
+from threading import Thread
+from Queue import Queue
+import struct
+import io
+import zlib
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+def decompress_bgzf_block (data):
+    """
+    Decompress the deflated data of a BGZF block and verify its CRC and size. zlib releases the
+    GIL while decompressing, so several blocks can be decompressed at once by threads
+    @param data Content of the block following its 18 bytes header
+    @return The decompressed block
+    """
+    block = zlib.decompress(data[:-8], -zlib.MAX_WBITS)
+    crc, size = struct.unpack("<II", data[-8:])
+    if crc != zlib.crc32(block) & 0xffffffff or size != len(block):
+        raise IOError ("Corrupted BGZF block")
+    return block
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class BlockGzipReader(object):
+    """
+    Iterate over the lines of a gzip file decompressed ahead by a background thread, so that the
+    decompression of several files and the parsing overlap. BGZF files are decompressed block
+    by block in parallel by a pool of n_thread threads. Other gzip files, including multi member
+    files, are decompressed as a stream. The file is never seeked, so that pipes can be read
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__ (self, path, n_thread=1, chunk_size=1048576, read_ahead=8):
+        """
+        @param path Path of the gzip file or binary file object with a peek method (io.BufferedReader)
+        @param n_thread Number of threads decompressing BGZF blocks
+        @param chunk_size Size of the compressed chunks read from the file and approximative size
+        of the decompressed chunks passed to the parser
+        @param read_ahead Maximal number of decompressed chunks waiting to be parsed
+        """
+        self.fp = io.open(path, "rb") if isinstance(path, basestring) else path
+        self.n_thread = n_thread
+        self.chunk_size = chunk_size
+        self.position = 0
+        self.compressed = 0 # Compressed size of the data decompressed so far
+        self.decompressed = 0
+        self.chunks = Queue(maxsize=read_ahead)
+
+        self.thread = Thread(target=self._decompress)
+        self.thread.daemon = True
+        self.thread.start()
+        self.lines = chain.from_iterable(self._split_lines())
+
+    def __iter__ (self):
+        return self.lines
+
+    def __repr__(self):
+        return "<Instance of {} from {} >\n".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def next (self):
+        return self.lines.next()
+
+    def tell (self):
+        """ Number of compressed bytes already decompressed """
+        return self.position
+
+    def close (self):
+        self.fp.close()
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _split_lines (self):
+        """
+        Generate lists of complete lines from the decompressed chunks
+        """
+        rest = ""
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+
+            lines = (rest+chunk).splitlines(True)
+            rest = lines.pop() if not lines[-1].endswith("\n") else ""
+            yield lines
+
+        if rest:
+            yield [rest]
+
+    def _decompress (self):
+        """
+        Decompression thread filling the chunks queue, ended by None or by the exception raised
+        """
+        try:
+            header = self.fp.peek(18)[:18]
+            if header[:4] == "\x1f\x8b\x08\x04" and header[12:14] == "BC":
+                self._decompress_bgzf()
+            else:
+                self._decompress_stream()
+            self.chunks.put(None)
+
+        except (IOError, zlib.error) as E:
+            self.chunks.put(IOError("Invalid gzip file: {}".format(E)))
+
+    def _decompress_stream (self):
+        """
+        Decompress a gzip file member after member
+        """
+        decompressor = zlib.decompressobj(16+zlib.MAX_WBITS)
+        while True:
+            data = self.fp.read(self.chunk_size)
+            self.position += len(data)
+            if not data:
+                break
+
+            # The data following the end of a member are the beginning of the next member
+            while data:
+                chunk = decompressor.decompress(data)
+                self.compressed += len(data)-len(decompressor.unused_data)
+                self.decompressed += len(chunk)
+                if chunk:
+                    self.chunks.put(chunk)
+                data = decompressor.unused_data
+                if data:
+                    decompressor = zlib.decompressobj(16+zlib.MAX_WBITS)
+
+        # Once a member is complete any additional data goes in unused_data. Detect truncated files
+        try:
+            decompressor.decompress("\0")
+        except zlib.error:
+            pass
+        if decompressor.unused_data != "\0":
+            raise IOError ("Compressed file ended before the end of the last gzip member")
+
+    def _decompress_bgzf (self):
+        """
+        Decompress a BGZF file with a pool of threads. The blocks are decompressed in parallel,
+        reassembled in order in chunks of about chunk_size bytes
+        """
+        pool = ThreadPool(self.n_thread)
+        pending = deque()
+        buffer = []
+        buffer_len = 0
+
+        for block in self._bgzf_blocks():
+            pending.append((len(block)+18, pool.apply_async(decompress_bgzf_block, (block,))))
+
+            # Collect the oldest blocks when enough blocks are being decompressed
+            while len(pending) > 4*self.n_thread or (pending and pending[0][1].ready()):
+                size, result = pending.popleft()
+                buffer.append(result.get())
+                buffer_len += len(buffer[-1])
+                self.compressed += size
+                self.decompressed += len(buffer[-1])
+                if buffer_len >= self.chunk_size:
+                    self.chunks.put("".join(buffer))
+                    buffer = []
+                    buffer_len = 0
+
+        while pending:
+            size, result = pending.popleft()
+            buffer.append(result.get())
+            self.compressed += size
+            self.decompressed += len(buffer[-1])
+        if buffer:
+            self.chunks.put("".join(buffer))
+
+        pool.close()
+        pool.join()
+
+    def _bgzf_blocks (self):
+        """
+        Generate the content of the BGZF blocks following their header
+        """
+        while True:
+            header = self.fp.read(18)
+            if not header:
+                break
+            if len(header) < 18 or header[:4] != "\x1f\x8b\x08\x04" or header[12:14] != "BC":
+                raise IOError ("Invalid BGZF block at offset {}".format(self.position))
+
+            size = struct.unpack("<H", header[16:18])[0] + 1
+            data = self.fp.read(size-18)
+            self.position += len(header)+len(data)
+            if len(data) != size-18:
+                raise IOError ("Truncated BGZF block at offset {}".format(self.position))
+            yield data
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""
+@package    Sekator
+@brief      Gzip file writer compressing independent blocks in parallel (pigz like)
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~GLOBAL IMPORTS~~~~~~~#
+
+# Standard library imports
+from multiprocessing.pool import ThreadPool
+from collections import deque
+import struct
+import zlib
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+# Maximal uncompressed size of a BGZF block, so that the compressed block never exceeds 64KB
+BGZF_BLOCK_SIZE = 65280
+
+# Empty BGZF block marking the end of a BGZF file
+BGZF_EOF = "\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+def compress_block (data, level=6, bgzf=False):
+    """
+    Compress a block of data in an independent gzip member. zlib releases the GIL while
+    compressing, so several blocks can be compressed at once by threads
+    @param data String to compress
+    @param level Compression level from 1 to 9
+    @param bgzf Add the BGZF extra field containing the size of the member in the header
+    @return The gzip member
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = compressor.compress(data) + compressor.flush()
+    trailer = struct.pack("<II", zlib.crc32(data) & 0xffffffff, len(data) & 0xffffffff)
+
+    if bgzf:
+        # 18 bytes header with a BC subfield giving the total size of the member minus 1
+        header = struct.pack("<4BI2BH2BHH", 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, 66, 67, 2, len(deflated)+25)
+    else:
+        header = struct.pack("<4BI2B", 0x1f, 0x8b, 8, 0, 0, 0, 0xff)
+
+    return header + deflated + trailer
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class BlockGzipWriter(object):
+    """
+    File like object writing a gzip file made of concatenated members. Data are buffered in
+    blocks of block_size bytes compressed by a pool of threads and written in order. The output
+    can be read by any gzip reader and, in BGZF mode, indexed by htslib based tools
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__ (self, path, level=6, block_size=1048576, bgzf=False, n_thread=1, pool=None):
+        """
+        @param path Path of the output file or writable binary file object
+        @param level Compression level from 1 to 9
+        @param block_size Size of the uncompressed blocks (limited to 65280 in BGZF mode)
+        @param bgzf Write a BGZF file
+        @param n_thread Number of compression threads
+        @param pool Optional ThreadPool shared with other writers. If None a pool of n_thread
+        threads is created and closed with the writer
+        """
+        self.fp = open(path, "wb") if isinstance(path, basestring) else path
+        self.level = level
+        self.bgzf = bgzf
+        self.block_size = min(block_size, BGZF_BLOCK_SIZE) if bgzf else block_size
+        self.own_pool = pool is None
+        self.pool = ThreadPool(n_thread) if pool is None else pool
+        self.max_pending = 2*n_thread
+        self.pending = deque()
+        self.buffer = []
+        self.buffer_len = 0
+
+    def __repr__(self):
+        return "<Instance of {} from {} >\n".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def write (self, data):
+        """
+        Buffer data and send the full blocks to compression
+        """
+        self.buffer.append(data)
+        self.buffer_len += len(data)
+
+        if self.buffer_len >= self.block_size:
+            data = "".join(self.buffer)
+            end = len(data) - len(data)%self.block_size
+            for i in range(0, end, self.block_size):
+                self._submit(data[i:i+self.block_size])
+
+            self.buffer = [data[end:]]
+            self.buffer_len = len(data)-end
+
+    def close (self):
+        """
+        Compress the last block, wait for all the blocks to be written and close the file
+        """
+        if self.buffer_len:
+            self._submit("".join(self.buffer))
+        self.buffer = []
+        self.buffer_len = 0
+
+        while self.pending:
+            self.fp.write(self.pending.popleft().get())
+        if self.bgzf:
+            self.fp.write(BGZF_EOF)
+
+        if self.own_pool:
+            self.pool.close()
+            self.pool.join()
+        self.fp.close()
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _submit (self, block):
+        """
+        Send a block to the compression pool and write the blocks already compressed in order.
+        Wait for the oldest block if too many blocks are pending
+        """
+        self.pending.append(self.pool.apply_async(compress_block, (block, self.level, self.bgzf)))
+
+        while self.pending and (self.pending[0].ready() or len(self.pending) > self.max_pending):
+            self.fp.write(self.pending.popleft().get())
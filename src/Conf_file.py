@@ -44,6 +44,43 @@ write_report : True
 # Compress the fastq output (BOOLEAN)
 compress_output : True
 
+# Gzip compression level of the fastq output, from 1 (fastest) to 9 (smallest) (POSITIVE INTEGER)
+compress_level : 6
+
+# Size in KB of the blocks of fastq output compressed in parallel as independent gzip members.
+# Blocks are limited to 63KB if bgzf_output is True (POSITIVE INTEGER) **
+compress_block_size : 1024
+
+# Write the compressed output in BGZF format, which can be indexed by htslib based tools (BOOLEAN)
+bgzf_output : False
+
+# Number of read pairs packed together and sent at once to the worker processes. The shared memory
+# slots holding the batches are sized from the first read pairs of the samples, 1MB at least
+# (POSITIVE INTEGER) **
+batch_size : 1000
+
+# Write the read pairs in the same order as in the input files, for reproducible outputs. Batches
+# processed ahead of their turn wait in a bounded buffer (BOOLEAN)
+ordered_output : False
+
+# Number of samples read and written at the same time by the pool of worker processes, which is
+# shared by all the samples (POSITIVE INTEGER) **
+concurrent_samples : 1
+
+# Print a machine readable STATS line with the throughput, the queue depths and the time spent in
+# each stage of the running samples every stats_interval seconds. 0 to disable (POSITIVE FLOAT)
+stats_interval : 0
+
+# Path of a file rewritten with the same statistics in the prometheus text format, to be scraped
+# while the program runs. Empty to disable (STRING)
+prometheus_file :
+
+# Directory of a cache of the parsed read pairs. The first run of an input writes its reads
+# uncompressed in columnar files, memory mapped by the next runs instead of decompressing and
+# parsing the fastq files again. The cache of an input is renewed if it is modified, but old caches
+# have to be deleted manually. Pipes and the standard input are not cached. Empty to disable (STRING)
+read_cache :
+
 ###################################################################################################
 [quality]
 
@@ -60,6 +97,11 @@ step : 2
 # Minimal quality in a given windows to be retained during trimming (0 <= POSITIVE INTEGER <= 40)
 qual_cutdown : 28
 
+# Implementation of the quality trimmer (python, numpy or compiled). All give the same results but
+# numpy computes all the windows of a read at once and compiled is a Cython extension working
+# directly on the quality string, which is the fastest (STRING)
+engine : compiled
+
 ###################################################################################################
 [adapter]
 
@@ -70,6 +112,8 @@ adapter_trim : True
 min_match_len : 0.3
 
 # Minimal SSW score/base of the adapter matching on the read (POSITIVE FLOAT <= ssw_match) **
+# High values (about 1.7 with the default ssw scores) allow to skip the alignment of the reads
+# that do not share any exact 8 to 10 bases seed with the adapters, without loss of sensitivity
 min_match_score : 1
 
 # Scores for stripped Smith and Waterman sequence alignment if :
@@ -85,6 +129,45 @@ ssw_mismatch : 2
 ssw_gapO : 3
 ssw_gapE : 1
 
+# Trim the reads from the first adapter match to their 3' end, as expected for adapter read-through,
+# instead of keeping the longest interval of the read without adapter (BOOLEAN)
+anchor_3prime : False
+
+# With anchor_3prime, align the adapters only on the last search_window bases of the reads, which
+# reduces the alignment work. 0 to search the whole reads (POSITIVE INTEGER)
+search_window : 0
+
+# With anchor_3prime, minimal length of the adapter stubs searched at the very end of the reads
+# without adapter match, with 1 mismatch allowed per 10 bases. 0 to disable (POSITIVE INTEGER)
+min_stub : 5
+
+# Minimal overlap between R1 and the reverse complement of R2 to detect the pairs whose insert is
+# shorter than the reads. Both reads are then cut at the insert size, removing adapter stubs of any
+# length. Requires the compiled quality engine. 0 to disable (POSITIVE INTEGER)
+min_overlap : 0
+
+# Memory in MB of the cache of each worker storing the trimming results of the sequences already
+# aligned, so that the exact duplicates of amplicon or low complexity libraries are not aligned
+# again. Disabled with more than 64 adapters (+rc). 0 to disable (POSITIVE FLOAT)
+memo_size : 0
+
+###################################################################################################
+[sweep]
+
+# Optional section to evaluate several parameter sets in a single pass over the fastq files. A
+# space separated list of values can be given for each of the following parameters, and all the
+# combinations of the values are evaluated, the other parameters keeping the values of the
+# sections above. A trimming report is written for each parameter set (sample_setN) with a table
+# comparing all the sets (sample_sweep_report.csv). Leave empty to sweep nothing (STRING)
+qual_cutdown :
+win_size :
+min_match_len :
+min_match_score :
+
+# Write the fastq output of the parameters of the sections above. Set False to only get the
+# reports of the parameter sets when tuning the parameters (BOOLEAN)
+write_output : True
+
 ###################################################################################################
 # SAMPLE DEFINITIONS
 
@@ -97,6 +180,11 @@ ssw_gapE : 1
 #   preferably absolute path without spaces) (STRING)
 # - adapter_list = list of adapter DNA sequence to be trimmed if adapter_trimming is required.
 # - Separate each adapter by a blank space (LIST OF STR)
+# Optionally, to stream the reads through pipes without intermediate files:
+# - interleaved_path = fastq(.gz) file or named pipe containing each read R1 followed by its read R2,
+#   used instead of R1_path and R2_path. "-" to read the standard input (STRING)
+# - output_path = interleaved fastq(.gz) file written instead of the R1 and R2 filtered files. "-"
+#   to write to the standard output, the messages are then printed on the standard error (STRING)
 
 [sample1]
 name : S1_pass
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+#    @package    Sekator
+#    @brief      Declaration of FastQualityTrimmer for the other Cython extensions
+#    @copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+#    @author     Adrien Leger - 2014
+#    * <adrien.leger@gmail.com>
+#    * <adrien.leger@inserm.fr>
+#    * <adrien.leger@univ-nantes.fr>
+#    * [Github](https://github.com/a-slide)
+#    * [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+
+#~~~~~~~CIMPORTS~~~~~~~#
+
+# C standard library import
+from libc.stdint cimport int32_t, uint64_t
+
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+cdef class FastQualityTrimmer:
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~SELF VARIABLES DEFINITION~~~~~~~#
+
+    cdef:
+        readonly double qual_cutdown
+        readonly int32_t win_size, step, min_size
+        readonly bint left_trim, right_trim
+        readonly uint64_t total, untrimmed, trimmed, fail, base_trimmed
+        readonly double qual_mean_sum
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    cdef int32_t trim_core (self, const unsigned char* qual, int32_t seq_size, int32_t* start, int32_t* end) nogil
+    cdef int32_t fail_read (self, int32_t seq_size, int32_t* start, int32_t* end) nogil
+    cdef int32_t reject_read (self, const unsigned char* qual, int32_t seq_size, int32_t* start, int32_t* end) nogil
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+#    @package    Sekator
+#    @brief      Perform quality trimming of fastq sequences
+#    @copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+#    @author     Adrien Leger - 2014
+#    * <adrien.leger@gmail.com>
+#    * <adrien.leger@inserm.fr>
+#    * <adrien.leger@univ-nantes.fr>
+#    * [Github](https://github.com/a-slide)
+#    * [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+
+
+#~~~~~~~CIMPORTS~~~~~~~#
+
+# C standard library import
+from libc.stdint cimport int8_t, int32_t, int64_t, uint64_t
+cimport cython
+
+#~~~~~~~GLOBAL IMPORTS~~~~~~~#
+
+# Third party package import
+import numpy as np
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+# Offset of the quality characters in fastq files
+DEF PHRED_OFFSET = 33
+
+# Status of the reads returned by trim_batch (same values as in AdapterTrimmer)
+cpdef enum:
+    UNTRIMMED = 0
+    TRIMMED = 1
+    FAIL = 2
+
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+cdef class FastQualityTrimmer:
+    """
+    Compiled version of QualityTrimmer giving the same results. The sliding window sum is updated
+    base by base directly from the Phred+33 quality string of the reads, without any numpy array
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~SELF VARIABLES DEFINITION~~~~~~~#
+
+    # Declared in FastQualityTrimmer.pxd to be shared with the other extensions
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, double qual_cutdown=25, int32_t win_size=5, int32_t step=1, int32_t min_size=30,\
+        bint left_trim=True, bint right_trim=True):
+
+#        Init quality trimmer
+#        @param qual_cutdown Minimal quality in a given windows
+#        @param win_size Size of the sliding windows
+#        @param step Step of sliding window during trimming
+#        @param min_size Minimal size of read to be considered as valid
+#        @param left_trim Triming starting from left extremity of reads
+#        @param right_trim Triming starting from right extremity of reads
+
+        # Init object variables
+        self.qual_cutdown = qual_cutdown
+        self.win_size = win_size
+        self.step = step
+        self.min_size = min_size
+        self.left_trim = left_trim
+        self.right_trim = right_trim
+
+        # Counters
+        self.total = 0
+        self.untrimmed = 0
+        self.trimmed = 0
+        self.fail = 0
+        self.base_trimmed = 0
+        self.qual_mean_sum = 0
+
+    property mean_qual:
+        def __get__(self):
+            return self.qual_mean_sum / self.total
+
+    def __str__(self):
+        msg = "FAST QUALITY TRIMMER CLASS\n"
+        msg += "\tQuality cutdown : {}\n".format(self.qual_cutdown)
+        msg += "\tSliding windows size : {}\n".format(self.win_size)
+        msg += "\tSliding windows step : {}\n".format(self.step)
+        msg += "\tMinimal size of sequences : {}\n".format(self.min_size)
+        msg += "\tTrim from left : {}\n".format(self.left_trim)
+        msg += "\tTrim from right : {}\n".format(self.right_trim)
+        msg += "\tTotal sequences : {}\n".format(self.total)
+        msg += "\tUntrimmed sequences : {}\n".format(self.untrimmed)
+        msg += "\tTrimmed sequences : {}\n".format(self.trimmed)
+        msg += "\tFailed sequence : {}\n".format(self.fail)
+        msg += "\tNumber of base trimmed : {}\n".format(self.base_trimmed)
+        msg += "\tCumulative sum of quality : {}\n".format(self.qual_mean_sum)
+        return msg
+
+    def __repr__(self):
+        return ("<Instance of FastQualityTrimmer Class>\n")
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def __call__(self, object seq):
+
+#        Compute mean quality score and compare to the minimal quality required
+#        @param seq a ReadBatch.FastqRead or Fastq.FastqSeq object
+
+        cdef:
+            bytes qualstr = seq.qualstr
+            int32_t status, start=0, end=0
+
+        status = self.trim_core(qualstr, len(qualstr), &start, &end)
+
+        if status == UNTRIMMED:
+            return seq
+        if status == FAIL:
+            return None
+        return seq[start:end]
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def trim_batch (self, quals, lengths):
+
+#        Same as __call__ for a block of reads which qualities are packed in a contiguous buffer
+#        @param quals   Buffer of the concatenated Phred+33 quality strings of the reads
+#        @param lengths Sequence of the lengths of the reads in the buffer
+#        @return 3 numpy arrays containing the start, the end (excluded) and the status (UNTRIMMED,
+#                TRIMMED or FAIL) of each read
+
+        cdef:
+            const unsigned char[:] qual_view = quals
+            int32_t[:] len_view
+            int32_t[:] start_view, end_view
+            int8_t[:] status_view
+            Py_ssize_t n_read, i
+            int64_t offset = 0
+
+        lengths = np.ascontiguousarray(lengths, dtype=np.int32)
+        n_read = lengths.shape[0]
+        len_view = lengths
+        if lengths.sum() > qual_view.shape[0]:
+            raise ValueError("The quality buffer is shorter than the sum of the read lengths")
+
+        starts = np.zeros(n_read, dtype=np.int32)
+        ends = np.zeros(n_read, dtype=np.int32)
+        status = np.zeros(n_read, dtype=np.int8)
+        start_view = starts
+        end_view = ends
+        status_view = status
+
+        with nogil:
+            for i in range(n_read):
+                status_view[i] = self.trim_core(<const unsigned char*>&qual_view[offset] if len_view[i] else NULL,
+                    len_view[i], &start_view[i], &end_view[i])
+                offset += len_view[i]
+
+        return starts, ends, status
+
+    def get_summary (self):
+
+        summary = {}
+        summary["total"] = int(self.total)
+        summary["untrimmed"] = int(self.untrimmed)
+        summary["trimmed"] = int(self.trimmed)
+        summary["fail"] = int(self.fail)
+        summary["base_trimmed"] = int(self.base_trimmed)
+        summary["qual_mean_sum"] = int(self.qual_mean_sum)
+
+        return summary
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    cdef int32_t trim_core (self, const unsigned char* qual, int32_t seq_size, int32_t* start, int32_t* end) nogil:
+#       Find the first window passing the quality cutdown from each extremity of the read
+#       @param qual     Phred+33 quality string of the read
+#       @param seq_size Length of the read
+#       @param start    Return the start of the trimmed read
+#       @param end      Return the end of the trimmed read (excluded)
+#       @return UNTRIMMED, TRIMMED or FAIL
+        cdef:
+            int32_t i, win = self.win_size
+            int64_t win_sum, total_sum = 0
+            bint found_start = False, found_end = False
+
+        # Update counters and init border index
+        start[0] = 0
+        end[0] = seq_size
+        for i in range(seq_size):
+            total_sum += qual[i]
+        total_sum -= <int64_t>PHRED_OFFSET*seq_size
+        self.total += 1
+        if seq_size:
+            self.qual_mean_sum += <double>total_sum / seq_size
+
+        # Trimming left end with a window sum rolled base by base and tested every step bases
+        if self.left_trim:
+            if seq_size >= win:
+                win_sum = 0
+                for i in range(win):
+                    win_sum += qual[i] - PHRED_OFFSET
+                i = 0
+                while True:
+                    if i % self.step == 0 and <double>win_sum / win >= self.qual_cutdown:
+                        start[0] = i
+                        found_start = True
+                        break
+                    if i+win >= seq_size:
+                        break
+                    win_sum += qual[i+win] - qual[i]
+                    i += 1
+
+            if not found_start:
+                return self.fail_read(seq_size, start, end)
+
+        # Trimming right end, i being the end of the window
+        if self.right_trim:
+            if seq_size >= win:
+                win_sum = 0
+                for i in range(seq_size-win, seq_size):
+                    win_sum += qual[i] - PHRED_OFFSET
+                i = seq_size
+                while True:
+                    if (seq_size-i) % self.step == 0 and <double>win_sum / win >= self.qual_cutdown:
+                        end[0] = i
+                        found_end = True
+                        break
+                    if i-win <= 0:
+                        break
+                    win_sum += qual[i-win-1] - qual[i-1]
+                    i -= 1
+
+            if not found_end:
+                return self.fail_read(seq_size, start, end)
+
+        # In the case were no trimming was done
+        if start[0] == 0 and end[0] == seq_size:
+            self.untrimmed += 1
+            return UNTRIMMED
+
+        # Trimmed read if its lenghth is sufficient
+        if end[0]-start[0] >= self.min_size:
+            self.trimmed += 1
+            self.base_trimmed += (start[0] + seq_size - end[0])
+            return TRIMMED
+
+        return self.fail_read(seq_size, start, end)
+
+    cdef int32_t fail_read (self, int32_t seq_size, int32_t* start, int32_t* end) nogil:
+#       Update the counters of a failed read and reset its interval
+        self.fail += 1
+        self.base_trimmed += seq_size
+        start[0] = 0
+        end[0] = 0
+        return FAIL
+
+    cdef int32_t reject_read (self, const unsigned char* qual, int32_t seq_size, int32_t* start, int32_t* end) nogil:
+#       Count as failed a read rejected by another filter before the quality trimming, so that the
+#       total of reads analysed stays the same as if the read was trimmed
+#       @param qual     Phred+33 quality string of the read
+#       @param seq_size Length of the read
+        cdef:
+            int32_t i
+            int64_t total_sum = 0
+
+        for i in range(seq_size):
+            total_sum += qual[i]
+        total_sum -= <int64_t>PHRED_OFFSET*seq_size
+        self.total += 1
+        if seq_size:
+            self.qual_mean_sum += <double>total_sum / seq_size
+        return self.fail_read(seq_size, start, end)
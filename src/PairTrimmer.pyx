@@ -0,0 +1,411 @@
+# -*- coding: utf-8 -*-
+
+#    @package    Sekator
+#    @brief      Trim read pairs and format the fastq output in a single compiled pass
+#    @copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+#    @author     Adrien Leger - 2014
+#    * <adrien.leger@gmail.com>
+#    * <adrien.leger@inserm.fr>
+#    * <adrien.leger@univ-nantes.fr>
+#    * [Github](https://github.com/a-slide)
+#    * [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+
+
+#~~~~~~~CIMPORTS~~~~~~~#
+
+# C standard library import
+from libc.stdint cimport int8_t, int32_t, int64_t, uint64_t
+from libc.stdlib cimport malloc, free
+from libc.string cimport memcpy
+from posix.time cimport clock_gettime, timespec, CLOCK_MONOTONIC
+cimport cython
+
+# Local package import
+from FastQualityTrimmer cimport FastQualityTrimmer
+from AdapterTrimmer cimport AdapterTrimmer
+
+#~~~~~~~GLOBAL IMPORTS~~~~~~~#
+
+# Third party package import
+import numpy as np
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+# Status of the reads (same values as in AdapterTrimmer and FastQualityTrimmer)
+DEF FAIL = 2
+
+# Bytes added to the name, sequence and quality of a read by the fastq format: "@", "\n+\n", 2 "\n"
+DEF FASTQ_OVERHEAD = 6
+
+# Complement of the upper case bases, other characters are complemented in N
+cdef char COMPLEMENT[256]
+for i in range(256):
+    COMPLEMENT[i] = ord("N")
+for base, comp in zip("ACGT", "TGCA"):
+    COMPLEMENT[ord(base)] = ord(comp)
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+cdef inline double now () nogil:
+#   Monotonic clock in seconds, callable without the GIL
+    cdef timespec t
+    clock_gettime(CLOCK_MONOTONIC, &t)
+    return t.tv_sec + t.tv_nsec*1e-9
+
+cdef inline int32_t format_record (const char* name, int32_t name_len, const char* seq, const char* qual,
+    int32_t size, unsigned char* out) nogil:
+#   Write a fastq record in out and return its size
+    cdef int32_t pos
+    out[0] = c'@'
+    memcpy(&out[1], name, name_len)
+    pos = name_len+1
+    out[pos] = c'\n'
+    memcpy(&out[pos+1], seq, size)
+    pos += size+1
+    out[pos] = c'\n'
+    out[pos+1] = c'+'
+    out[pos+2] = c'\n'
+    memcpy(&out[pos+3], qual, size)
+    pos += size+3
+    out[pos] = c'\n'
+    return pos+1
+
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+cdef class PairTrimmer:
+    """
+    Fused quality trimming, adapter trimming and fastq formatting of blocks of read pairs. The
+    reads are trimmed directly in the packed names, sequences and qualities strings of the blocks
+    and the fastq records of the pairs passing both filters are written in an output buffer,
+    without creating any python object per read. The counters of the trimmers are updated as
+    with their own trim_batch methods. Optionally the pairs whose insert is shorter than the reads
+    are first detected by the overlap of R1 with the reverse complement of R2 and both reads are
+    cut at the insert size, removing the adapter read-through whatever its length. The time spent
+    in each step is accumulated to profile the workers
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~SELF VARIABLES DEFINITION~~~~~~~#
+
+    cdef:
+        readonly FastQualityTrimmer quality_trimmer
+        readonly AdapterTrimmer adapter_trimmer
+        readonly int32_t min_overlap, min_size
+        readonly uint64_t overlap_trimmed, overlap_fail, overlap_base_trimmed
+        readonly double quality_time, adapter_time, format_time
+
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, FastQualityTrimmer quality_trimmer=None, AdapterTrimmer adapter_trimmer=None,\
+        int32_t min_overlap=0, int32_t min_size=30):
+
+#        @param quality_trimmer FastQualityTrimmer or None to skip the quality trimming
+#        @param adapter_trimmer AdapterTrimmer or None to skip the adapter trimming
+#        @param min_overlap     Minimal overlap between R1 and R2 to cut the reads at the insert
+#                               size (0 = no overlap detection)
+#        @param min_size        Minimal insert size of the pairs cut at the insert size
+
+        self.quality_trimmer = quality_trimmer
+        self.adapter_trimmer = adapter_trimmer
+        self.min_overlap = min_overlap
+        self.min_size = min_size
+
+        # Counters
+        self.overlap_trimmed = 0
+        self.overlap_fail = 0
+        self.overlap_base_trimmed = 0
+
+        # Timers
+        self.quality_time = 0
+        self.adapter_time = 0
+        self.format_time = 0
+
+    def __repr__(self):
+        return ("<Instance of PairTrimmer Class>\n")
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def get_summary (self):
+
+        summary = {}
+        summary["overlap_trimmed"] = int(self.overlap_trimmed)
+        summary["overlap_fail"] = int(self.overlap_fail)
+        summary["overlap_base_trimmed"] = int(self.overlap_base_trimmed)
+
+        return summary
+
+    def get_timing (self):
+
+        timing = {}
+        timing["quality"] = self.quality_time
+        timing["adapter"] = self.adapter_time
+        timing["format"] = self.format_time
+
+        return timing
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def trim_format (self, block1, block2, unsigned char[:] out, bint interleaved=False):
+
+#        Trim the pairs of reads of 2 ReadBlock and write the fastq records of the pairs passing the
+#        filters in out, all the R1 records followed by all the R2 records. The adapter trimming
+#        is done on the quality trimmed reads, as in the pipeline of trim_batch calls
+#        @param block1      ReadBlock of the reads R1
+#        @param block2      ReadBlock of the reads R2, at the same index
+#        @param out         Writable buffer receiving the fastq records, or None to only trim the
+#                           pairs and update the counters
+#        @param interleaved Write each R1 record followed by its R2 record instead
+#        @return The number of pairs passing the quality trimming, the number of pairs passing the
+#                adapter trimming (0 for a disabled trimmer) and the sizes of the R1 and R2 output.
+#                In interleaved mode the whole output is counted in the R1 size
+
+        cdef:
+            bytes names1 = block1.names, seqs1 = block1.seqs, quals1 = block1.quals
+            bytes names2 = block2.names, seqs2 = block2.seqs, quals2 = block2.quals
+            const char* c_names1 = names1
+            const char* c_seqs1 = seqs1
+            const char* c_quals1 = quals1
+            const char* c_names2 = names2
+            const char* c_seqs2 = seqs2
+            const char* c_quals2 = quals2
+            int32_t[:] name_len1, len1, name_len2, len2
+            int32_t[:] start1, end1, start2, end2
+            int8_t[:] passed
+            bint quality_trim = self.quality_trimmer is not None
+            bint adapter_trim = self.adapter_trimmer is not None
+            Py_ssize_t n_read, i
+            int32_t max_len = 0, pass_qual = 0, pass_adapt = 0, size1, size2
+            int64_t need = 0
+            int8_t* seq_int = NULL
+            int8_t* bool_mat = NULL
+            double t
+
+        name_len1 = np.ascontiguousarray(block1.name_lengths, dtype=np.int32)
+        len1 = np.ascontiguousarray(block1.lengths, dtype=np.int32)
+        name_len2 = np.ascontiguousarray(block2.name_lengths, dtype=np.int32)
+        len2 = np.ascontiguousarray(block2.lengths, dtype=np.int32)
+        n_read = len1.shape[0]
+        if len2.shape[0] != n_read:
+            raise ValueError("The blocks R1 and R2 do not contain the same number of reads")
+
+        # Coordinates of the reads after trimming and pass flags of the pairs
+        start1 = np.zeros(n_read, dtype=np.int32)
+        end1 = np.zeros(n_read, dtype=np.int32)
+        start2 = np.zeros(n_read, dtype=np.int32)
+        end2 = np.zeros(n_read, dtype=np.int32)
+        passed = np.zeros(n_read, dtype=np.int8)
+
+        # Scratch arrays of the adapter trimming
+        for i in range(n_read):
+            max_len = max(max_len, len1[i], len2[i])
+        if adapter_trim:
+            seq_int = <int8_t *>malloc((max_len+1) * sizeof(int8_t))
+            bool_mat = <int8_t *>malloc((max_len+1) * sizeof(int8_t))
+
+        with nogil:
+            self.trim_pairs(c_seqs1, c_quals1, &len1[0] if n_read else NULL, c_seqs2, c_quals2,
+                &len2[0] if n_read else NULL, n_read, quality_trim, adapter_trim, seq_int, bool_mat,
+                &start1[0] if n_read else NULL, &end1[0] if n_read else NULL, &start2[0] if n_read else NULL,
+                &end2[0] if n_read else NULL, &passed[0] if n_read else NULL, &pass_qual, &pass_adapt)
+
+            # Size of the fastq output
+            t = now()
+            for i in range(n_read):
+                if passed[i]:
+                    need += name_len1[i] + 2*(end1[i]-start1[i]) + name_len2[i] + 2*(end2[i]-start2[i]) + 2*FASTQ_OVERHEAD
+
+        free(seq_int)
+        free(bool_mat)
+
+        if out is None:
+            return pass_qual if quality_trim else 0, pass_adapt if adapter_trim else 0, 0, 0
+
+        if need > out.shape[0]:
+            raise ValueError("The output buffer is too small for the fastq records ({} bytes needed)".format(need))
+
+        with nogil:
+            if interleaved:
+                size1 = self.format_interleaved(c_names1, c_seqs1, c_quals1, name_len1, len1, start1, end1,
+                    c_names2, c_seqs2, c_quals2, name_len2, len2, start2, end2, passed, &out[0] if need else NULL)
+                size2 = 0
+            else:
+                size1 = self.format_fastq(c_names1, c_seqs1, c_quals1, name_len1, len1, start1, end1, passed, &out[0] if need else NULL)
+                size2 = self.format_fastq(c_names2, c_seqs2, c_quals2, name_len2, len2, start2, end2, passed, &out[size1] if need else NULL)
+            self.format_time += now()-t
+
+        return pass_qual if quality_trim else 0, pass_adapt if adapter_trim else 0, size1, size2
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    cdef void trim_pairs (self, const char* seqs1, const char* quals1, int32_t* len1, const char* seqs2,
+        const char* quals2, int32_t* len2, Py_ssize_t n_read, bint quality_trim, bint adapter_trim,
+        int8_t* seq_int, int8_t* bool_mat, int32_t* start1, int32_t* end1, int32_t* start2,
+        int32_t* end2, int8_t* passed, int32_t* pass_qual, int32_t* pass_adapt) nogil:
+#       Find the coordinates of the trimmed reads and the pairs passing both filters. All the pairs
+#       are cut at the insert size and quality trimmed first, then adapter trimmed, to time both
+#       steps per block
+#       @param seqs1, quals1, len1 Packed sequences, qualities and lengths of the reads R1
+#       @param seqs2, quals2, len2 Packed sequences, qualities and lengths of the reads R2
+#       @param n_read              Number of pairs
+#       @param quality_trim        Perform the quality trimming
+#       @param adapter_trim        Perform the adapter trimming
+#       @param seq_int, bool_mat   Scratch arrays of the adapter trimming
+#       @param start1, end1        Return the coordinates of the trimmed reads R1
+#       @param start2, end2        Return the coordinates of the trimmed reads R2
+#       @param passed              Return 1 for the pairs passing the filters
+#       @param pass_qual           Return the number of pairs passing the quality trimming
+#       @param pass_adapt          Return the number of pairs passing the adapter trimming
+        cdef:
+            Py_ssize_t i
+            int64_t offset1 = 0, offset2 = 0
+            int32_t status1, status2, a_start1, a_end1, a_start2, a_end2, size1, size2, insert
+            bint ok
+            double t = now()
+
+        for i in range(n_read):
+            size1 = len1[i]
+            size2 = len2[i]
+            ok = True
+
+            # Cut both reads at the insert size if it is shorter than the reads
+            if self.min_overlap:
+                insert = self.insert_size(&seqs1[offset1], size1, &seqs2[offset2], size2)
+                if insert:
+                    self.overlap_trimmed += 1
+                    self.overlap_base_trimmed += size1 + size2 - 2*insert
+                    size1 = size2 = insert
+                    if insert < self.min_size:
+                        self.overlap_fail += 1
+                        size1 = size2 = 0
+                        ok = False
+
+            start1[i] = 0
+            end1[i] = size1
+            start2[i] = 0
+            end2[i] = size2
+
+            # The reads of the pairs rejected at the insert size are counted as failed by the
+            # quality trimmer, so that it still reports 2 reads per pair analysed
+            if not ok and quality_trim:
+                self.quality_trimmer.reject_read(<const unsigned char*>&quals1[offset1] if len1[i] else NULL,
+                    len1[i], &start1[i], &end1[i])
+                self.quality_trimmer.reject_read(<const unsigned char*>&quals2[offset2] if len2[i] else NULL,
+                    len2[i], &start2[i], &end2[i])
+
+            if ok and quality_trim:
+                status1 = self.quality_trimmer.trim_core(<const unsigned char*>&quals1[offset1] if size1 else NULL,
+                    size1, &start1[i], &end1[i])
+                status2 = self.quality_trimmer.trim_core(<const unsigned char*>&quals2[offset2] if size2 else NULL,
+                    size2, &start2[i], &end2[i])
+                ok = status1 != FAIL and status2 != FAIL
+                pass_qual[0] += ok
+
+            passed[i] = ok
+            offset1 += len1[i]
+            offset2 += len2[i]
+
+        self.quality_time += now()-t
+        if not adapter_trim:
+            return
+
+        t = now()
+        offset1 = offset2 = 0
+        for i in range(n_read):
+
+            # Adapter trimming of the quality trimmed reads, coordinates are shifted to the full reads
+            if passed[i]:
+                status1 = self.adapter_trimmer.trim_seq(<const unsigned char*>&seqs1[offset1+start1[i]],
+                    end1[i]-start1[i], seq_int, bool_mat, &a_start1, &a_end1)
+                status2 = self.adapter_trimmer.trim_seq(<const unsigned char*>&seqs2[offset2+start2[i]],
+                    end2[i]-start2[i], seq_int, bool_mat, &a_start2, &a_end2)
+                end1[i] = start1[i] + a_end1
+                start1[i] += a_start1
+                end2[i] = start2[i] + a_end2
+                start2[i] += a_start2
+                passed[i] = status1 != FAIL and status2 != FAIL
+                pass_adapt[0] += passed[i]
+
+            offset1 += len1[i]
+            offset2 += len2[i]
+
+        self.adapter_time += now()-t
+
+    cdef int32_t insert_size (self, const char* seq1, int32_t size1, const char* seq2, int32_t size2) nogil:
+#       Find the insert size of a pair shorter than both reads, for which the beginning of R1 is the
+#       reverse complement of the beginning of R2 on at least min_overlap bases, with at most 1
+#       mismatch per 10 bases. Ambiguous bases always match. The longest insert is retained
+#       @param seq1, size1 Sequence and length of R1
+#       @param seq2, size2 Sequence and length of R2
+#       @return The insert size or 0 if the insert is not shorter than the reads
+        cdef:
+            int32_t insert, j, mismatch
+            char base1, base2
+
+        insert = (size1 if size1 < size2 else size2) - 1
+        while insert >= self.min_overlap:
+            mismatch = 0
+            for j in range(insert):
+                base1 = seq1[j] & 0xDF
+                base2 = COMPLEMENT[<unsigned char>(seq2[insert-1-j] & 0xDF)]
+                if base1 != base2 and base1 != c'N' and base2 != c'N':
+                    mismatch += 1
+                    if mismatch > insert/10:
+                        break
+            if mismatch <= insert/10:
+                return insert
+            insert -= 1
+
+        return 0
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef int32_t format_fastq (self, const char* names, const char* seqs, const char* quals,
+        int32_t[:] name_len, int32_t[:] lengths, int32_t[:] start, int32_t[:] end, int8_t[:] passed,
+        unsigned char* out) nogil:
+#       Write the fastq records of the reads of the pairs passing the filters
+#       @param names, seqs, quals Packed names, sequences and qualities of the reads
+#       @param name_len, lengths  Lengths of the names and of the reads
+#       @param start, end         Coordinates of the trimmed reads
+#       @param passed             Flags of the pairs to write
+#       @param out                Output buffer large enough for all the records
+#       @return The number of bytes written
+        cdef:
+            Py_ssize_t i
+            int64_t name_offset = 0, offset = 0
+            int32_t pos = 0
+
+        for i in range(lengths.shape[0]):
+            if passed[i]:
+                pos += format_record(&names[name_offset], name_len[i], &seqs[offset+start[i]],
+                    &quals[offset+start[i]], end[i]-start[i], &out[pos])
+            name_offset += name_len[i]
+            offset += lengths[i]
+
+        return pos
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef int32_t format_interleaved (self, const char* names1, const char* seqs1, const char* quals1,
+        int32_t[:] name_len1, int32_t[:] len1, int32_t[:] start1, int32_t[:] end1,
+        const char* names2, const char* seqs2, const char* quals2, int32_t[:] name_len2,
+        int32_t[:] len2, int32_t[:] start2, int32_t[:] end2, int8_t[:] passed, unsigned char* out) nogil:
+#       Write the fastq records of the pairs passing the filters, each R1 record followed by its R2
+#       record. Parameters of R1 and R2 and return value as format_fastq
+        cdef:
+            Py_ssize_t i
+            int64_t name_offset1 = 0, offset1 = 0, name_offset2 = 0, offset2 = 0
+            int32_t pos = 0
+
+        for i in range(len1.shape[0]):
+            if passed[i]:
+                pos += format_record(&names1[name_offset1], name_len1[i], &seqs1[offset1+start1[i]],
+                    &quals1[offset1+start1[i]], end1[i]-start1[i], &out[pos])
+                pos += format_record(&names2[name_offset2], name_len2[i], &seqs2[offset2+start2[i]],
+                    &quals2[offset2+start2[i]], end2[i]-start2[i], &out[pos])
+            name_offset1 += name_len1[i]
+            offset1 += len1[i]
+            name_offset2 += name_len2[i]
+            offset2 += len2[i]
+
+        return pos
@@ -34,9 +34,10 @@ class ProgressBar (object):
 
     def __call__ (self, n):
         """
-        Call each iteration of the loop to verify is the progress bar needs to be updated
+        Call each iteration of the loop to verify is the progress bar needs to be updated. n can
+        increase by more than one between calls, in which case all the steps crossed are printed
         """
-        if n%self.numeric_step == 0:
+        while n >= self.n_step*self.numeric_step:
             if self.n_step == self.number_step :
                 print("\t[{}] 100% DONE".format("X"*self.n_step))
             else:
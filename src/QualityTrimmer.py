@@ -12,6 +12,18 @@
 * [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
 """
 
+#~~~~~~~GLOBAL IMPORTS~~~~~~~#
+
+# Third party package import
+import numpy as np
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+# Status of the reads returned by trim_batch (same values as in AdapterTrimmer)
+UNTRIMMED = 0
+TRIMMED = 1
+FAIL = 2
+
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 class QualityTrimmer(object):
     """
@@ -77,13 +89,60 @@ class QualityTrimmer(object):
     def __call__(self, seq):
         """
         Compute mean quality score and compare to the minimal quality required
-        @param seq a Fastq.FastqSeq object
+        @param seq a ReadBatch.FastqRead or Fastq.FastqSeq object
+        """
+        start, end, status = self._trim(seq.qual)
+
+        if status == UNTRIMMED:
+            return seq
+        if status == FAIL:
+            return None
+        return seq[start:end]
+
+    def trim_batch(self, quals, lengths):
         """
+        Same as __call__ for a block of reads which qualities are packed in a contiguous buffer
+        @param quals Buffer of the concatenated Phred+33 quality strings of the reads
+        @param lengths Sequence of the lengths of the reads in the buffer
+        @return 3 numpy arrays containing the start, the end (excluded) and the status (UNTRIMMED,
+        TRIMMED or FAIL) of each read
+        """
+        qual_array = np.frombuffer(quals, dtype=np.uint8).astype(np.int16) - 33
+        starts = np.zeros(len(lengths), dtype=np.int32)
+        ends = np.zeros(len(lengths), dtype=np.int32)
+        status = np.zeros(len(lengths), dtype=np.int8)
+        offset = 0
+
+        for i, length in enumerate(lengths):
+            starts[i], ends[i], status[i] = self._trim(qual_array[offset:offset+length])
+            offset += length
+
+        return starts, ends, status
 
+    def get_summary (self):
+
+        summary = {}
+        summary["total"] = int(self.total)
+        summary["untrimmed"] = int(self.untrimmed)
+        summary["trimmed"] = int(self.trimmed)
+        summary["fail"] = int(self.fail)
+        summary["base_trimmed"] = int(self.base_trimmed)
+        summary["qual_mean_sum"] = int(self.qual_mean_sum)
+
+        return summary
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _trim(self, qual):
+        """
+        Find the first window passing the quality cutdown from each extremity of the read
+        @param qual Array of quality values of the read
+        @return The start, the end (excluded) and the status of the read (UNTRIMMED, TRIMMED or FAIL)
+        """
         # Update counters and init border index
         self.total += 1
-        self.qual_mean_sum += seq.qual.mean()
-        seq_size = len(seq)
+        self.qual_mean_sum += qual.mean()
+        seq_size = len(qual)
         start = 0 # Init in case of trimming by right end only
         end = seq_size # Init in case of trimming by left end only
         found_start = found_end = False
@@ -95,18 +154,18 @@ class QualityTrimmer(object):
             # Loop from the begining of seq until the windows quality is high enough
             for i in range(0, seq_size-self.win_size+1, self.step):
 
-#                print ("Win : {}  Qual : {}".format(seq.qual[i:i+self.win_size], seq.qual[i:i+self.win_size].mean()))
+#                print ("Win : {}  Qual : {}".format(qual[i:i+self.win_size], qual[i:i+self.win_size].mean()))
                 # Mark the start and leave the loop if the quality of the windows is high enough
-                if seq.qual[i:i+self.win_size].mean() >= self.qual_cutdown:
+                if qual[i:i+self.win_size].mean() >= self.qual_cutdown:
                     start = i
                     found_start = True
                     break
 
-            # If the windows arrived at the end of the sequence return None
+            # If the windows arrived at the end of the sequence the read fails
             if not found_start:
                 self.fail += 1
                 self.base_trimmed += seq_size
-                return None
+                return 0, 0, FAIL
 
         # Trimming right end
         if self.right_trim:
@@ -115,46 +174,187 @@ class QualityTrimmer(object):
             # Back loop from the end of seq until the windows quality is high enough
             for i in range(seq_size, 0+self.win_size-1, -self.step):
 
-#                print ("Win : {}  Qual : {}".format(seq.qual[i-self.win_size:i], seq.qual[i-self.win_size:i].mean()))
+#                print ("Win : {}  Qual : {}".format(qual[i-self.win_size:i], qual[i-self.win_size:i].mean()))
                 # Mark the end and leave the loop if the quality of the windows is high enough
-                if seq.qual[i-self.win_size:i].mean() >= self.qual_cutdown:
+                if qual[i-self.win_size:i].mean() >= self.qual_cutdown:
                     end = i
                     found_end = True
                     break
 
-            # If the windows arrive at the beginning of the sequence return None
+            # If the windows arrive at the beginning of the sequence the read fails
             if not found_end:
                 self.fail += 1
                 self.base_trimmed += seq_size
-                return None
+                return 0, 0, FAIL
 
         # In the case were no trimming was done
         if start == 0 and end == seq_size:
             self.untrimmed += 1
-            return seq
+            return 0, seq_size, UNTRIMMED
 
-        # Return the trimmed read if its lenghth is sufficient
+        # Trimmed read if its lenghth is sufficient
         if end-start >= self.min_size:
             self.trimmed += 1
             self.base_trimmed += (start + seq_size - end)
-
-            ## Create a new object instead of slicing
-#            return ("-"*start+seq.seq[start:end]+"-"*(seq_size - end))
-            return seq[start:end]
+            return start, end, TRIMMED
 
         else:
             self.fail += 1
             self.base_trimmed += seq_size
-            return None
+            return 0, 0, FAIL
 
-    def get_summary (self):
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class NumpyQualityTrimmer(QualityTrimmer):
+    """
+    Vectorized version of QualityTrimmer giving the same results. The mean quality of all the
+    windows of a batch of reads is computed at once from the cumulative sum of a padded quality
+    matrix and the first passing window from each extremity is found with argmax
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 
-        summary = {}
-        summary["total"] = int(self.total)
-        summary["untrimmed"] = int(self.untrimmed)
-        summary["trimmed"] = int(self.trimmed)
-        summary["fail"] = int(self.fail)
-        summary["base_trimmed"] = int(self.base_trimmed)
-        summary["qual_mean_sum"] = int(self.qual_mean_sum)
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
 
-        return summary
+    def trim_batch(self, quals, lengths):
+        """
+        Same as QualityTrimmer.trim_batch but all the reads are processed at once in a zero padded
+        quality matrix
+        @param quals Buffer of the concatenated Phred+33 quality strings of the reads
+        @param lengths Sequence of the lengths of the reads in the buffer
+        @return 3 numpy arrays containing the start, the end (excluded) and the status (UNTRIMMED,
+        TRIMMED or FAIL) of each read
+        """
+        lengths = np.asarray(lengths, dtype=np.int64)
+        width = lengths.max() if lengths.size else 0
+
+        # Fill a zero padded matrix with the quality values, in the same order than in the buffer
+        qual_mat = np.zeros((lengths.size, width), dtype=np.int16)
+        mask = np.arange(width) < lengths[:,np.newaxis]
+        qual_mat[mask] = np.frombuffer(quals, dtype=np.uint8)[:lengths.sum()]
+        qual_mat[mask] -= 33
+
+        return self.trim_matrix(qual_mat, lengths)
+
+    def trim_matrix(self, qual_mat, lengths):
+        """
+        Trim a block of reads from a zero padded matrix of quality values
+        @param qual_mat 2D array of quality values with one row per read
+        @param lengths Sequence of the lengths of the reads
+        @return 3 numpy arrays containing the start, the end (excluded) and the status (UNTRIMMED,
+        TRIMMED or FAIL) of each read
+        """
+        lengths = np.asarray(lengths, dtype=np.int64)
+        n_seq, width = qual_mat.shape
+        rows = np.arange(n_seq)[:,np.newaxis]
+        win = self.win_size
+
+        # Cumulative sum with a leading 0 column. The sum of the window [i, i+win) is csum[i+win]-csum[i]
+        csum = np.zeros((n_seq, width+1), dtype=np.int64)
+        np.cumsum(qual_mat, axis=1, out=csum[:,1:])
+
+        start = np.zeros(n_seq, dtype=np.int64)
+        end = lengths.copy()
+        valid = np.ones(n_seq, dtype=bool)
+
+        # Trimming left end: windows starting at 0, step, 2*step... up to length-win
+        if self.left_trim:
+            pos = np.arange(0, max(width-win+1, 0), self.step)
+            passing = (pos <= (lengths-win)[:,np.newaxis]) & \
+                ((csum[:,pos+win] - csum[:,pos]) / float(win) >= self.qual_cutdown)
+            found, first = self._first_pass(passing)
+            start[found] = pos[first[found]]
+            valid &= found
+
+        # Trimming right end: windows ending at length, length-step... down to win
+        if self.right_trim:
+            ends = lengths[:,np.newaxis] - self.step * np.arange(max((width-win)//self.step+1, 0))
+            inside = ends >= win
+            ends_clip = np.where(inside, ends, win)
+            passing = inside & \
+                ((csum[rows, ends_clip] - csum[rows, ends_clip-win]) / float(win) >= self.qual_cutdown)
+            found, first = self._first_pass(passing)
+            end[found] = ends[found, first[found]]
+            valid &= found
+
+        # Classify the reads as in QualityTrimmer.__call__
+        untrimmed = valid & (start == 0) & (end == lengths)
+        trimmed = valid & ~untrimmed & (end-start >= self.min_size)
+        fail = ~(untrimmed | trimmed)
+        status = np.where(untrimmed, UNTRIMMED, np.where(trimmed, TRIMMED, FAIL)).astype(np.int8)
+
+        # Update counters
+        self.total += n_seq
+        self.qual_mean_sum += float((csum[rows[:,0], lengths] / lengths.astype(float)).sum()) if n_seq else 0
+        self.untrimmed += int(untrimmed.sum())
+        self.trimmed += int(trimmed.sum())
+        self.fail += int(fail.sum())
+        self.base_trimmed += int((start + lengths - end)[trimmed].sum() + lengths[fail].sum())
+
+        start[~trimmed] = 0
+        end[untrimmed] = lengths[untrimmed]
+        end[fail] = 0
+        return start.astype(np.int32), end.astype(np.int32), status
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _trim(self, qual):
+        """
+        Same as QualityTrimmer._trim but the mean quality of all the windows is computed at once
+        @param qual Array of quality values of the read
+        """
+        # Update counters and init border index
+        self.total += 1
+        self.qual_mean_sum += qual.mean()
+        seq_size = len(qual)
+        start = 0
+        end = seq_size
+
+        # Boolean array of passing windows. Index i correspond to the window [i, i+win_size)
+        csum = np.cumsum(qual)
+        win_sum = csum[self.win_size-1:].copy()
+        win_sum[1:] -= csum[:-self.win_size]
+        passing = win_sum / float(self.win_size) >= self.qual_cutdown
+
+        # Trimming left end: first passing window starting at a multiple of step
+        if self.left_trim:
+            index = np.flatnonzero(passing[::self.step])
+            if not index.size:
+                self.fail += 1
+                self.base_trimmed += seq_size
+                return 0, 0, FAIL
+            start = index[0]*self.step
+
+        # Trimming right end: first passing window ending at seq_size minus a multiple of step
+        if self.right_trim:
+            index = np.flatnonzero(passing[seq_size-self.win_size::-self.step]) if seq_size >= self.win_size else []
+            if not len(index):
+                self.fail += 1
+                self.base_trimmed += seq_size
+                return 0, 0, FAIL
+            end = seq_size - index[0]*self.step
+
+        # In the case were no trimming was done
+        if start == 0 and end == seq_size:
+            self.untrimmed += 1
+            return 0, seq_size, UNTRIMMED
+
+        # Trimmed read if its lenghth is sufficient
+        if end-start >= self.min_size:
+            self.trimmed += 1
+            self.base_trimmed += (start + seq_size - end)
+            return start, end, TRIMMED
+
+        else:
+            self.fail += 1
+            self.base_trimmed += seq_size
+            return 0, 0, FAIL
+
+    def _first_pass(self, passing):
+        """
+        Find the first passing window of each read
+        @param passing Boolean matrix of passing windows with one row per read
+        @return A boolean array of reads with at least one passing window and the index of the
+        first one
+        """
+        if passing.shape[1] == 0:
+            return np.zeros(passing.shape[0], dtype=bool), np.zeros(passing.shape[0], dtype=np.int64)
+        return passing.any(axis=1), passing.argmax(axis=1)
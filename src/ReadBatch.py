@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+
+"""
+@package    Sekator
+@brief      Blocks of fastq reads packed in contiguous strings for fast transfer between processes
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~GLOBAL IMPORTS~~~~~~~#
+
+# Standard library imports
+from itertools import islice
+import io
+
+# Third party package import
+import numpy as np
+
+# Local Package import
+from BlockGzipReader import BlockGzipReader
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class FastqRead(object):
+    """
+    Compact fastq read holding its name and the raw strings containing its sequence and quality,
+    usually the packed strings of a ReadBlock, with the coordinates of the read in them. Slicing
+    a read only moves its coordinates and the Phred qualities are decoded on demand. Provides the
+    attributes of the pyFastq FastqSeq objects used by the per read trimmer APIs
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~CLASS FIELDS~~~~~~~#
+
+    __slots__ = ("name", "seqs", "quals", "start", "end")
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__ (self, name, seqs, quals, start=0, end=None):
+        """
+        @param name Name of the read
+        @param seqs Sequence of the read or string containing it
+        @param quals Phred+33 quality string of the read or string containing it
+        @param start Start of the read in seqs and quals
+        @param end End (excluded) of the read in seqs and quals. Default to the end of seqs
+        """
+        self.name = name
+        self.seqs = seqs
+        self.quals = quals
+        self.start = start
+        self.end = len(seqs) if end is None else end
+
+    def __len__ (self):
+        return self.end-self.start
+
+    def __getitem__ (self, item):
+        """
+        Subsequence of the read sharing the strings of the read
+        """
+        start, end, step = item.indices(len(self))
+        assert step == 1, "Reads can only be sliced with a step of 1"
+        return FastqRead(self.name, self.seqs, self.quals, self.start+start, self.start+max(start, end))
+
+    def __reduce__ (self):
+        """ Pickle only the bases of the read, not the strings containing it """
+        return (FastqRead, (self.name, self.seq, self.qualstr))
+
+    def __repr__(self):
+        return "<Instance of {} from {} >\n".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    @property
+    def seq (self):
+        return self.seqs[self.start:self.end]
+
+    @property
+    def qualstr (self):
+        return self.quals[self.start:self.end]
+
+    @property
+    def qual (self):
+        """ Array of the Phred quality values of the read, decoded at each access """
+        return np.frombuffer(self.quals, dtype=np.uint8, count=len(self), offset=self.start).astype(np.int16) - 33
+
+    @property
+    def fastqstr (self):
+        return "@{}\n{}\n+\n{}\n".format(self.name, self.seq, self.qualstr)
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class ReadBlock(object):
+    """
+    Block of fastq reads stored as 3 strings of concatenated names, sequences and qualities and 2
+    arrays of lengths. A block is pickled in a few string copies instead of one object per read
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~CLASS FIELDS~~~~~~~#
+
+    __slots__ = ("names", "seqs", "quals", "name_lengths", "lengths")
+
+    #~~~~~~~CLASS METHODS~~~~~~~#
+
+    @classmethod
+    def from_lines (self, lines):
+        """
+        Pack a list of raw fastq lines
+        @param lines List of lines read from a fastq file, 4 lines per read
+        """
+        if len(lines)%4:
+            raise ValueError ("Truncated fastq record at the end of the file")
+
+        names = [line[1:].rstrip() for line in lines[0::4]]
+        seqs = [line.rstrip() for line in lines[1::4]]
+        quals = [line.rstrip() for line in lines[3::4]]
+        lengths = np.array([len(seq) for seq in seqs], dtype=np.int32)
+
+        # Verify the fastq structure of the block at once
+        n = len(seqs)
+        if "".join([line[:1] for line in lines[0::4]]) != "@"*n or "".join([line[:1] for line in lines[2::4]]) != "+"*n:
+            raise ValueError ("Invalid fastq record near read {}".format(names[0] if n else ""))
+        if not np.array_equal(lengths, [len(qual) for qual in quals]):
+            raise ValueError ("Sequence and quality lengths differ near read {}".format(names[0]))
+
+        return ReadBlock(
+            names = "".join(names),
+            seqs = "".join(seqs),
+            quals = "".join(quals),
+            name_lengths = np.array([len(name) for name in names], dtype=np.int32),
+            lengths = lengths)
+
+    @classmethod
+    def from_reads (self, reads):
+        """
+        Pack a list of reads
+        @param reads List of FastqRead or pyFastq FastqSeq objects
+        """
+        return ReadBlock(
+            names = "".join([read.name for read in reads]),
+            seqs = "".join([read.seq for read in reads]),
+            quals = "".join([read.qualstr for read in reads]),
+            name_lengths = np.array([len(read.name) for read in reads], dtype=np.int32),
+            lengths = np.array([len(read) for read in reads], dtype=np.int32))
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__ (self, names="", seqs="", quals="", name_lengths=None, lengths=None):
+        """
+        @param names Concatenated names of the reads
+        @param seqs Concatenated sequences of the reads
+        @param quals Concatenated Phred+33 qualities of the reads
+        @param name_lengths Array of the lengths of the names
+        @param lengths Array of the lengths of the sequences
+        """
+        self.names = names
+        self.seqs = seqs
+        self.quals = quals
+        self.name_lengths = np.zeros(0, dtype=np.int32) if name_lengths is None else name_lengths
+        self.lengths = np.zeros(0, dtype=np.int32) if lengths is None else lengths
+
+    def __len__ (self):
+        return len(self.lengths)
+
+    def __iter__ (self):
+        """
+        Iterate over the reads of the block as FastqRead sharing the packed strings of the block
+        """
+        offsets = self._offsets(self.lengths).tolist()
+        for name, start, length in zip(self.get_names(), offsets, self.lengths.tolist()):
+            yield FastqRead(name, self.seqs, self.quals, start, start+length)
+
+    def __repr__(self):
+        return "<Instance of {} from {} >\n".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def trim (self, index, starts, ends):
+        """
+        Create a new block with a subset of trimmed reads
+        @param index Array of the index of the reads to keep
+        @param starts Array of the start of each kept read
+        @param ends Array of the end (excluded) of each kept read
+        """
+        pos = self._offsets(self.lengths)[index]
+        name_pos = self._offsets(self.name_lengths)[index]
+        name_lengths = self.name_lengths[index]
+
+        bounds = zip((pos+starts).tolist(), (pos+ends).tolist())
+        name_bounds = zip(name_pos.tolist(), (name_pos+name_lengths).tolist())
+
+        return ReadBlock(
+            names = "".join([self.names[i:j] for i, j in name_bounds]),
+            seqs = "".join([self.seqs[i:j] for i, j in bounds]),
+            quals = "".join([self.quals[i:j] for i, j in bounds]),
+            name_lengths = name_lengths,
+            lengths = (np.asarray(ends) - starts).astype(np.int32))
+
+    def get_names (self):
+        """ List of the names of the reads """
+        return self._split(self.names, self.name_lengths)
+
+    @property
+    def fastqstr (self):
+        """
+        Format all the reads of the block in fastq
+        """
+        return "".join(["@%s\n%s\n+\n%s\n" % read for read in zip(
+            self._split(self.names, self.name_lengths),
+            self._split(self.seqs, self.lengths),
+            self._split(self.quals, self.lengths))])
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _offsets (self, lengths):
+        """ Start position of each element in a concatenated string """
+        offsets = np.zeros(len(lengths), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+        return offsets
+
+    def _split (self, blob, lengths):
+        """ Split a concatenated string in a list of strings """
+        offsets = self._offsets(lengths).tolist()
+        return [blob[i:i+l] for i, l in zip(offsets, lengths.tolist())]
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class ReadBatch(object):
+    """
+    Pair of ReadBlock with the reads R1 and R2 at the same index
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~CLASS FIELDS~~~~~~~#
+
+    __slots__ = ("R1", "R2")
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__ (self, R1, R2):
+        self.R1 = R1
+        self.R2 = R2
+
+    def __len__ (self):
+        return len(self.R1)
+
+    def __repr__(self):
+        return "<Instance of {} from {} >\n".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def take (self, index):
+        """
+        Create a new batch with a subset of untrimmed read pairs
+        @param index Array of the index of the pairs to keep
+        """
+        index = np.asarray(index, dtype=np.int64)
+        starts = np.zeros(len(index), dtype=np.int32)
+        return ReadBatch(
+            self.R1.trim(index, starts, self.R1.lengths[index]),
+            self.R2.trim(index, starts, self.R2.lengths[index]))
+
+    @property
+    def fastqstr (self):
+        """
+        Format all the read pairs of the batch in interleaved fastq, each read R1 followed by its
+        read R2
+        """
+        return "".join(["@%s\n%s\n+\n%s\n@%s\n%s\n+\n%s\n" % pair for pair in zip(
+            self.R1._split(self.R1.names, self.R1.name_lengths),
+            self.R1._split(self.R1.seqs, self.R1.lengths),
+            self.R1._split(self.R1.quals, self.R1.lengths),
+            self.R2._split(self.R2.names, self.R2.name_lengths),
+            self.R2._split(self.R2.seqs, self.R2.lengths),
+            self.R2._split(self.R2.quals, self.R2.lengths))])
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class ReadBatchReader(object):
+    """
+    Iterate over a pair of fastq files (gzipped or not) by ReadBatch of batch_size read pairs.
+    The pairing of the reads is verified while streaming: a ValueError is raised if the names of
+    R1 and R2 reads differ or if one of the files ends before the other. Gzip files are
+    decompressed ahead in their own thread, R1 and R2 in parallel. Without R2 file, the pairs are
+    read from a single interleaved fastq file, each read R1 followed by its read R2. "-" reads the
+    standard input, gzipped or not. Files are never seeked, so that pipes can be read
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__ (self, R1_path, R2_path=None, batch_size=1000, n_thread=1):
+        """
+        @param R1_path Path to the fastq file R1, or to the interleaved fastq file
+        @param R2_path Path to the fastq file R2, or None for an interleaved R1_path
+        @param batch_size Number of read pairs per batch
+        @param n_thread Number of threads decompressing the blocks of each BGZF file
+        """
+        self.batch_size = batch_size
+        self.n_thread = n_thread
+        self.R1_fp = self._open(R1_path)
+        self.R2_fp = self._open(R2_path) if R2_path else None
+        self.n_pair = 0
+
+    def __iter__ (self):
+        return self
+
+    def __repr__(self):
+        return "<Instance of {} from {} >\n".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def next (self):
+        """
+        Return the next ReadBatch
+        """
+        if self.R2_fp:
+            lines1 = list(islice(self.R1_fp, 4*self.batch_size))
+            lines2 = list(islice(self.R2_fp, 4*self.batch_size))
+        else:
+            lines1, lines2 = self._deinterleave(list(islice(self.R1_fp, 8*self.batch_size)))
+
+        if len(lines1) != len(lines2):
+            raise ValueError ("Fastq R1 and Fastq R2 files do not contain the same number of reads ({} pairs read before the end of {})".format(
+                self.n_pair + min(len(lines1), len(lines2))/4, "R1" if len(lines1) < len(lines2) else "R2"))
+
+        if not lines1:
+            self.close()
+            raise StopIteration
+
+        batch = ReadBatch(ReadBlock.from_lines(lines1), ReadBlock.from_lines(lines2))
+        self._check_pairs(batch)
+        self.n_pair += len(batch)
+        return batch
+
+    def tell (self):
+        """
+        Number of bytes of the R1 file consumed, compressed bytes for gzip files, to follow the
+        progress without counting the reads first
+        """
+        return self.R1_fp.tell()
+
+    def compression_ratio (self):
+        """
+        Ratio between the size of the R1 (or interleaved) file and the size of its content,
+        estimated on the part decompressed so far. 1 for uncompressed files
+        """
+        if isinstance(self.R1_fp, BlockGzipReader):
+            return self.R1_fp.compressed/float(max(self.R1_fp.decompressed, 1))
+        return 1.0
+
+    def close (self):
+        self.R1_fp.close()
+        if self.R2_fp:
+            self.R2_fp.close()
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _open (self, fastq):
+        """
+        Open a fastq file with a tell method giving the number of bytes read from the file. Files
+        starting with the gzip magic number are decompressed, whatever their name, so that named
+        pipes and the standard input ("-") can be gzipped
+        """
+        # File descriptor 0 since multiprocessing replaces sys.stdin by /dev/null in the children
+        fp = io.open(0, "rb", closefd=False) if fastq == "-" else io.open(fastq, "rb")
+        if fp.peek(2)[:2] == "\x1f\x8b":
+            return BlockGzipReader(fp, self.n_thread)
+        return fp
+
+    def _deinterleave (self, lines):
+        """
+        Split the lines of an interleaved fastq file in the lines of the reads R1 and R2
+        """
+        if len(lines)%8 and not len(lines)%4:
+            raise ValueError ("The interleaved fastq file contains an odd number of reads ({} pairs read before the end)".format(
+                self.n_pair + len(lines)/8))
+
+        lines1 = [line for i in xrange(0, len(lines), 8) for line in lines[i:i+4]]
+        lines2 = [line for i in xrange(4, len(lines), 8) for line in lines[i:i+4]]
+        return lines1, lines2
+
+    def _check_pairs (self, batch):
+        """
+        Verify that the reads R1 and R2 of a batch have the same name, ignoring the comment after
+        the first blank and the /1 /2 suffixes
+        """
+        # Fast path for files with identical names
+        if batch.R1.names == batch.R2.names:
+            return
+
+        for i, (name1, name2) in enumerate(zip(batch.R1.get_names(), batch.R2.get_names())):
+            if self._pair_name(name1) != self._pair_name(name2):
+                raise ValueError ("Read pair {} is not properly paired: {} and {}".format(self.n_pair+i+1, name1, name2))
+
+    def _pair_name (self, name):
+        """ Name of a read without comment and mate suffix """
+        name = name.split(None, 1)[0] if name else name
+        return name[:-2] if name[-2:] in ("/1", "/2") else name
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+"""
+@package    Sekator
+@brief      Columnar cache of parsed read pairs, memory mapped to trim the same input again quickly
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~GLOBAL IMPORTS~~~~~~~#
+
+# Standard library imports
+from hashlib import sha1
+import shutil
+import json
+import mmap
+import os
+
+# Third party package import
+import numpy as np
+
+# Local Package import
+from ReadBatch import ReadBlock, ReadBatch
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+VERSION = 1
+
+# String columns of each mate, concatenated without separator
+STRING_COLUMNS = ["names", "seqs", "quals"]
+
+# Offset columns of each mate: int64 ends of the names and of the sequences (and qualities) of
+# the reads, starting with a 0
+OFFSET_COLUMNS = ["name_offsets", "offsets"]
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+def cache_path (cache_dir, paths):
+    """
+    Path of the cache of a list of input files, keyed by their absolute path, size and
+    modification time so that a modified input is parsed again
+    """
+    inputs = [(os.path.abspath(path), os.path.getsize(path), os.path.getmtime(path)) for path in paths]
+    key = sha1(json.dumps([VERSION, inputs])).hexdigest()
+    return os.path.join(cache_dir, "{}.cache".format(key))
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class ReadCacheWriter(object):
+    """
+    Write the ReadBatch parsed from fastq files in a cache directory containing one file per column
+    and per mate: the concatenated names, sequences and qualities and the int64 offsets of the
+    reads in them. The columns are written in a temporary directory renamed when the cache is
+    complete, so that an interrupted parsing or an invalid input never leaves a partial cache
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__ (self, path):
+        """
+        @param path Path of the cache directory, given by cache_path
+        """
+        self.path = path
+        self.tmp_path = "{}.tmp{}".format(path, os.getpid())
+        os.makedirs(self.tmp_path)
+        self.n_pair = 0
+        self.fps = {}
+        self.ends = {}
+        for mate in ("R1", "R2"):
+            for column in STRING_COLUMNS + OFFSET_COLUMNS:
+                self.fps[column+mate] = open(os.path.join(self.tmp_path, column+mate), "wb")
+            for column in OFFSET_COLUMNS:
+                self.ends[column+mate] = 0
+                np.zeros(1, dtype=np.int64).tofile(self.fps[column+mate])
+
+    def __repr__(self):
+        return "<Instance of {} from {} >\n".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def write (self, batch):
+        """
+        Append a ReadBatch to the columns
+        """
+        for mate, block in (("R1", batch.R1), ("R2", batch.R2)):
+            for column in STRING_COLUMNS:
+                self.fps[column+mate].write(getattr(block, column))
+            for column, lengths in (("name_offsets", block.name_lengths), ("offsets", block.lengths)):
+                ends = self.ends[column+mate] + np.cumsum(lengths, dtype=np.int64)
+                ends.tofile(self.fps[column+mate])
+                if len(ends):
+                    self.ends[column+mate] = int(ends[-1])
+        self.n_pair += len(batch)
+
+    def close (self):
+        """
+        Write the index of the cache and move it to its final path. If another process completed
+        the same cache in the meantime, this one is discarded
+        """
+        for fp in self.fps.values():
+            fp.close()
+        with open(os.path.join(self.tmp_path, "index"), "wb") as fp:
+            json.dump({"version":VERSION, "n_pair":self.n_pair}, fp)
+        try:
+            os.rename(self.tmp_path, self.path)
+        except OSError:
+            shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+    def abort (self):
+        """
+        Remove the incomplete cache
+        """
+        for fp in self.fps.values():
+            fp.close()
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class ReadCacheReader(object):
+    """
+    Iterate over the read pairs of a cache directory by ReadBatch of batch_size read pairs. The
+    columns are memory mapped, so that the batches are sliced from the page cache without any
+    decompression or parsing
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__ (self, path, batch_size=1000):
+        """
+        @param path Path of a complete cache directory
+        @param batch_size Number of read pairs per batch
+        """
+        with open(os.path.join(path, "index"), "rb") as fp:
+            index = json.load(fp)
+        if index["version"] != VERSION:
+            raise IOError ("Incompatible read cache version in {}".format(path))
+
+        self.batch_size = batch_size
+        self.size = index["n_pair"]
+        self.n_pair = 0
+        self.columns = {}
+        for mate in ("R1", "R2"):
+            for column in STRING_COLUMNS:
+                self.columns[column+mate] = self._map(os.path.join(path, column+mate))
+            for column in OFFSET_COLUMNS:
+                self.columns[column+mate] = np.memmap(os.path.join(path, column+mate), dtype=np.int64, mode="r")
+
+    def __iter__ (self):
+        return self
+
+    def __repr__(self):
+        return "<Instance of {} from {} >\n".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def next (self):
+        """
+        Return the next ReadBatch
+        """
+        if self.n_pair >= self.size:
+            raise StopIteration
+        start, end = self.n_pair, min(self.n_pair+self.batch_size, self.size)
+        self.n_pair = end
+        return ReadBatch(self._block("R1", start, end), self._block("R2", start, end))
+
+    def tell (self):
+        """
+        Number of read pairs consumed, to follow the progress against size
+        """
+        return self.n_pair
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _map (self, path):
+        """ Memory map a string column, empty columns cannot be mapped """
+        with open(path, "rb") as fp:
+            return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else ""
+
+    def _block (self, mate, start, end):
+        """
+        Slice the ReadBlock of the reads start to end (excluded) of a mate
+        """
+        name_offsets = np.array(self.columns["name_offsets"+mate][start:end+1])
+        offsets = np.array(self.columns["offsets"+mate][start:end+1])
+        name_start, name_end, seq_start, seq_end = int(name_offsets[0]), int(name_offsets[-1]), int(offsets[0]), int(offsets[-1])
+        return ReadBlock(
+            names = self.columns["names"+mate][name_start:name_end],
+            seqs = self.columns["seqs"+mate][seq_start:seq_end],
+            quals = self.columns["quals"+mate][seq_start:seq_end],
+            name_lengths = np.diff(name_offsets).astype(np.int32),
+            lengths = np.diff(offsets).astype(np.int32))
@@ -28,18 +28,29 @@ class Sample(object):
 
     #~~~~~~~FUNDAMENTAL METHODS~~~~~~~#
 
-    def __init__ (self, name, R1_path, R2_path, adapter_list, compress_output):
-
+    def __init__ (self, name, R1_path, R2_path, adapter_list, compress_output, interleaved_path=None, output_path=None):
+        """
+        @param name Unique name of the sample, prefix of the output files
+        @param R1_path, R2_path Fastq files R1 and R2
+        @param adapter_list List of adapter sequences
+        @param compress_output Gzip the output files
+        @param interleaved_path Interleaved fastq file read instead of R1_path and R2_path, "-"
+        for the standard input
+        @param output_path Interleaved fastq file written instead of the R1 and R2 output files,
+        "-" for the standard output
+        """
         # Create self variables
         self.name = name
         self.R1_path = R1_path
         self.R2_path = R2_path
+        self.interleaved_path = interleaved_path
         self.adapter_list = adapter_list
 
         self._test_values()
 
         self.R1_outname = "{}_R1_filtered.fastq{}".format(self.name, ".gz" if compress_output else "")
         self.R2_outname = "{}_R2_filtered.fastq{}".format(self.name, ".gz" if compress_output else "")
+        self.interleaved_outname = output_path
 
         self.ADD_TO_SAMPLE_NAMES(self.name)
 
@@ -17,20 +17,34 @@
 
 try:
     # Standard library imports
-    from multiprocessing import Value, Process, Queue, cpu_count
+    from multiprocessing import Process, Queue, cpu_count
+    from multiprocessing.pool import ThreadPool
     from time import time
     from datetime import datetime
-    from gzip import open as gopen
+    from gzip import open as gopen, GzipFile
+    from itertools import islice
+    from copy import deepcopy
+    from itertools import product
+    import io
     import os
+    import json
     import ConfigParser
     import optparse
     import sys
 
+    # Third party package import
+    import numpy as np
+
     # Local Package import
-    from AdapterTrimmer import AdapterTrimmer
-    from QualityTrimmer import QualityTrimmer
+    from AdapterTrimmer import AdapterTrimmer, MEMO_MAX_ADAPTERS
+    from QualityTrimmer import QualityTrimmer, NumpyQualityTrimmer, FAIL
+    from FastQualityTrimmer import FastQualityTrimmer
+    from PairTrimmer import PairTrimmer
     from Conf_file import write_example_conf
-    from pyFastq.FastqReader import FastqReader
+    from ReadBatch import ReadBlock, ReadBatch, ReadBatchReader
+    from ReadCache import ReadCacheReader, ReadCacheWriter, cache_path
+    from SharedRing import SharedRing, SlotSizeError
+    from BlockGzipWriter import BlockGzipWriter
     from Sample import Sample
     from ProgressBar import ProgressBar
 
@@ -49,7 +63,11 @@ class Sekator (object):
     #~~~~~~~CLASS FIELDS~~~~~~~#
 
     VERSION = "Sekator 0.2.1"
-    USAGE = "Usage: %prog -c Conf.txt [-i -h]"
+    USAGE = "Usage: %prog -c Conf.txt [-i -h --strict-count --preview N --fraction f]"
+    SLOT_PAIR_SIZE = 2048 # Minimal bytes reserved per read pair in the shared memory slots
+    SLOT_MIN_SIZE = 1048576 # Minimal size of the shared memory slots, for long read pairs
+    SLOT_SAMPLE_PAIRS = 1000 # Read pairs read ahead in each sample to size the shared memory slots
+    SWEEP_PARAMETERS = [("qual_cutdown", int), ("win_size", int), ("min_match_len", float), ("min_match_score", float)]
 
     #~~~~~~~CLASS METHODS~~~~~~~#
 
@@ -65,18 +83,26 @@ class Sekator (object):
             help= "Path to the configuration file [Mandatory]")
         optparser.add_option('-i', dest="init_conf", action='store_true',
             help= "Generate an example configuration file and exit [Facultative]")
+        optparser.add_option('--strict-count', dest="strict_count", action='store_true',
+            help= "Count the reads of R1 and R2 before trimming to verify that they are equal. Pairing is always verified while trimming [Facultative]")
+        optparser.add_option('--preview', dest="preview", type="int", default=0,
+            help= "Trim only the first N read pairs of each sample, without output files, and print the report with the adapter hit rates and a projection of the full run [Facultative]")
+        optparser.add_option('--fraction', dest="fraction", type="float", default=0,
+            help= "Preview on a random fraction f of the read pairs, until N pairs with --preview [Facultative]")
 
         # Parse arguments
         options, args = optparser.parse_args()
 
-        return Sekator(options.conf_file, options.init_conf)
+        return Sekator(options.conf_file, options.init_conf, options.strict_count, options.preview, options.fraction)
 
     #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
 
-    def __init__(self, conf_file=None, init_conf=None):
+    def __init__(self, conf_file=None, init_conf=None, strict_count=False, preview=0, fraction=0):
         """
         Initialization function, parse options from configuration file and verify their values.
         All self.variables are initialized explicitly in init.
+        @param preview Number of read pairs trimmed per sample in preview mode (0 = all)
+        @param fraction Fraction of the read pairs sampled in preview mode (0 = all)
         """
 
         # Create a example conf file if needed
@@ -85,7 +111,11 @@ class Sekator (object):
             write_example_conf()
             sys.exit(0)
 
-        print("Initialize Sekator")
+        self.strict_count = strict_count
+        self.preview = preview
+        self.fraction = fraction
+        self.preview_mode = bool(preview or fraction)
+
         # Parse the configuration file and verify the values of variables
         try:
 
@@ -98,11 +128,26 @@ class Sekator (object):
             cp = ConfigParser.RawConfigParser(allow_no_value=False)
             cp.read(self.conf)
 
+            # The messages go to the standard error if the fastq output is written to the standard output
+            if [i for i in cp.sections() if cp.has_option(i, "output_path") and cp.get(i, "output_path") == "-"]:
+                sys.stdout = sys.stderr
+            print("Initialize Sekator")
+
             # General section
             self.min_size = cp.getint("general", "min_size")
             self.n_thread = cpu_count() if cp.getboolean("general", "auto_thread") else cp.getint("general", "n_thread")
             self.write_report = cp.getboolean("general", "write_report")
             self.compress_output = cp.getboolean("general", "compress_output")
+            self.batch_size = cp.getint("general", "batch_size") if cp.has_option("general", "batch_size") else 1000
+            self.ordered_output = cp.getboolean("general", "ordered_output") if cp.has_option("general", "ordered_output") else False
+            self.concurrent_samples = cp.getint("general", "concurrent_samples") if cp.has_option("general", "concurrent_samples") else 1
+            self.stats_interval = cp.getfloat("general", "stats_interval") if cp.has_option("general", "stats_interval") else 0
+            self.prometheus_file = cp.get("general", "prometheus_file") if cp.has_option("general", "prometheus_file") else ""
+            self.read_cache = cp.get("general", "read_cache") if cp.has_option("general", "read_cache") else ""
+            if self.compress_output:
+                self.compress_level = cp.getint("general", "compress_level") if cp.has_option("general", "compress_level") else 6
+                self.compress_block_size = cp.getint("general", "compress_block_size") if cp.has_option("general", "compress_block_size") else 1024
+                self.bgzf_output = cp.getboolean("general", "bgzf_output") if cp.has_option("general", "bgzf_output") else False
 
             # Quality Trimming section
             self.left_trim = cp.getboolean("quality", "left_trim")
@@ -112,6 +157,7 @@ class Sekator (object):
                 self.win_size = cp.getint("quality", "win_size")
                 self.step = cp.getint("quality", "step")
                 self.qual_cutdown = cp.getint("quality", "qual_cutdown")
+                self.quality_engine = cp.get("quality", "engine") if cp.has_option("quality", "engine") else "python"
 
             # Adapter Trimming section
             self.adapter_trim = cp.getboolean("adapter", "adapter_trim")
@@ -122,22 +168,51 @@ class Sekator (object):
                 self.ssw_mismatch = cp.getint("adapter", "ssw_mismatch")
                 self.ssw_gapO = cp.getint("adapter", "ssw_gapO")
                 self.ssw_gapE = cp.getint("adapter", "ssw_gapE")
+                self.anchor_3prime = cp.getboolean("adapter", "anchor_3prime") if cp.has_option("adapter", "anchor_3prime") else False
+                self.search_window = cp.getint("adapter", "search_window") if cp.has_option("adapter", "search_window") else 0
+                self.min_stub = cp.getint("adapter", "min_stub") if cp.has_option("adapter", "min_stub") else 0
+                self.min_overlap = cp.getint("adapter", "min_overlap") if cp.has_option("adapter", "min_overlap") else 0
+                self.memo_size = cp.getfloat("adapter", "memo_size") if cp.has_option("adapter", "memo_size") else 0
+
+            # Parameter sweep section. The parameter sets are all the combinations of the values
+            # listed for each swept parameter, the other parameters keeping their value
+            self.sweep_sets = []
+            self.write_output = True
+            if cp.has_section("sweep"):
+                self.write_output = cp.getboolean("sweep", "write_output") if cp.has_option("sweep", "write_output") else True
+                grid = []
+                for name, cast in self.SWEEP_PARAMETERS:
+                    if cp.has_option("sweep", name) and cp.get("sweep", name).strip():
+                        grid.append([(name, cast(value)) for value in cp.get("sweep", name).split()])
+                if grid:
+                    self.sweep_sets = [("set{}".format(i+1), dict(values)) for i, values in enumerate(product(*grid))]
 
             # Samples are a special case, since the number of sections is variable
             # Iterate only on sections starting by "sample", create Sample objects
             # And store them in a list
             self.sample_list = []
             for sample in [i for i in cp.sections() if i.startswith("sample")]:
-                # Test the validity of files
-                self._is_readable_file(cp.get(sample, "R1_path"))
-                self._is_readable_file(cp.get(sample, "R1_path"))
+                # Test the validity of files. Interleaved files replace R1 and R2 files and the
+                # standard input ("-") cannot be tested
+                interleaved_path = cp.get(sample, "interleaved_path") if cp.has_option(sample, "interleaved_path") else None
+                R1_path = R2_path = None
+                if interleaved_path:
+                    if interleaved_path != "-":
+                        self._is_readable_file(interleaved_path)
+                else:
+                    R1_path = cp.get(sample, "R1_path")
+                    R2_path = cp.get(sample, "R2_path")
+                    self._is_readable_file(R1_path)
+                    self._is_readable_file(R2_path)
                 # Create Sample objects
                 self.sample_list.append (Sample (
                     name = cp.get(sample, "name"),
-                    R1_path = cp.get(sample, "R1_path"),
-                    R2_path = cp.get(sample, "R2_path"),
+                    R1_path = R1_path,
+                    R2_path = R2_path,
                     adapter_list = [] if not self.adapter_trim else cp.get(sample, "adapter_list").split(),
-                    compress_output = self.compress_output))
+                    compress_output = self.compress_output,
+                    interleaved_path = interleaved_path,
+                    output_path = cp.get(sample, "output_path") if cp.has_option(sample, "output_path") else None))
 
             # Values are tested in a private function
             self._test_values()
@@ -155,8 +230,6 @@ class Sekator (object):
 
         print ("All configuration file parameters are valid")
 
-        self.buffer_size = 20 # Buffer size for writing in fastq file
-
     def __str__(self):
         msg = "SEKATOR CLASS\n\tParameters list\n"
         # list all values in object dict in alphabetical order
@@ -172,238 +245,769 @@ class Sekator (object):
     #~~~~~~~PRIVATE METHODS~~~~~~~#
 
     def __call__ (self):
-        """ Main function of the script """
-
+        """
+        Main function of the script. A single pool of n_thread filter processes is started for
+        the whole run and fed with the batches of all the samples. Up to concurrent_samples
+        samples are processed at once, each one with its own reader and writer processes. A new
+        sample is started as soon as a running one is written. The writers send snapshots of the
+        stats of their sample every stats_interval seconds, published as a stats line and in the
+        prometheus file, and their final stats when the sample is written
+        """
         start_time = time()
 
-        for n, sample in enumerate (self.sample_list):
-
-            print ("ANALYSING SAMPLE {} ({}/{})".format(sample.name, n+1, len(self.sample_list)))
-
-            print ("\tVerify Fastq and count the number of reads")
-            n_read1 = self._count_fastq (sample.R1_path)
-            n_read2 = self._count_fastq (sample.R2_path)
-            assert n_read1 == n_read2, "Fastq R1 and Fastq R2 files do not contain the same number of reads"
-            self.progress_bar = ProgressBar(total_seq = n_read1, number_step = 10)
+        # Verify the number of reads of all the samples before starting any process
+        if self.strict_count and not self.preview_mode and not self._verify_counts():
+            sys.exit(1)
 
-            # Init generic shared memory counters
-            self.total = Value('i', 0)
-            self.pass_qual = Value('i', 0)
-            self.pass_adapt = Value('i', 0)
-            self.total_pass = Value('i', 0)
+        # Init the shared memory ring containing the read batches of all the samples. The number of
+        # slots bounds the memory usage (2 batches per worker + 1 for the reader and 1 for the
+        # writer of each running sample). In ordered mode 2 more slots per worker are reserved for
+        # the batches waiting in the reorder buffers so that a slow batch does not immediately
+        # stall the other workers
+        n_slot = 2*self.n_thread + 2*self.concurrent_samples
+        if self.ordered_output:
+            n_slot += 2*self.n_thread
+        self.ring = SharedRing(n_slot = n_slot, slot_size = self._slot_size())
+
+        # Slot indexes to filter go through a queue shared by all the samples, filtered slots go
+        # through the out queue of their sample. The writers send the stats of their sample in statq
+        self.inq = Queue()
+        self.outqs = [Queue() for sample in self.sample_list]
+        self.statq = Queue()
+
+        # Start the long-lived filter processes
+        self.ps = [Process(target=self.filter, args=(i,)) for i in range(self.n_thread)]
+        for p in self.ps:
+            p.start()
+
+        # Start the samples in turn while less than concurrent_samples are running
+        self.live_stats = {}
+        running = {}
+        error = False
+        n = 0
+        while running or (n < len(self.sample_list) and not error):
+
+            if n < len(self.sample_list) and not error and len(running) < self.concurrent_samples:
+                running[n] = self._start_sample(n)
+                n += 1
+                continue
+
+            # Wait for a sample to be completely written, publishing the intermediate stats
+            sample_id, stats, done = self.statq.get()
+            sample = self.sample_list[sample_id]
+            self._publish_stats(sample.name, stats)
+            if not done:
+                continue
+
+            # After an error, a reader still waiting for a free slot is stopped
+            for p in running.pop(sample_id):
+                p.join(10 if stats["error"] else None)
+                if p.is_alive():
+                    p.terminate()
+                    p.join()
+
+            # Stop starting new samples if the input files were invalid or the output failed
+            if stats["error"]:
+                print ("\tFastq trimming of sample {} aborted".format(sample.name))
+                error = True
+                continue
+            print ("\tFastq trimming of sample {} done".format(sample.name))
+
+            if self.preview_mode:
+                self._write_preview(sample, stats)
+            elif self.write_report:
+                self._write_report(sample.name, sample.adapter_list, stats)
+                if self.sweep_sets:
+                    self._write_sweep_report(sample, stats)
+
+        # Stop the filter processes
+        for p in self.ps:
+            self.inq.put("STOP")
+        for p in self.ps:
+            p.join()
 
-            # Define Quality Trimmer Object and specific shared memory counters
-            if self.quality_trim:
-                self.quality_trimmer = QualityTrimmer(
-                    qual_cutdown = self.qual_cutdown,
-                    win_size = self.win_size,
-                    step = self.step,
-                    min_size = self.min_size,
-                    left_trim = self.left_trim,
-                    right_trim = self.right_trim)
-
-                self.qual_total = Value('i', 0)
-                self.qual_untrimmed = Value('i', 0)
-                self.qual_trimmed = Value('i', 0)
-                self.qual_fail = Value('i', 0)
-                self.qual_base_trimmed = Value('i', 0)
-                self.qual_mean_sum = Value('i', 0)
-
-            # Define Adapter Trimmer Object and specific shared memory counters
-            if self.adapter_trim:
-                self.adapter_trimmer = AdapterTrimmer(
-                    adapter_list = sample.adapter_list,
-                    min_size = self.min_size,
-                    min_match_len = self.min_match_len,
-                    min_match_score = self.min_match_score,
-                    ssw_match = self.ssw_match,
-                    ssw_mismatch = self.ssw_mismatch,
-                    ssw_gapO = self.ssw_gapO,
-                    ssw_gapE = self.ssw_gapE)
-
-                self.adapt_total = Value('i', 0)
-                self.adapt_untrimmed = Value('i', 0)
-                self.adapt_trimmed = Value('i', 0)
-                self.adapt_fail = Value('i', 0)
-                self.adapt_base_trimmed = Value('i', 0)
-
-            # Init queues for input file reading and output file writing (limited to 10000 objects)
-            self.inq = Queue(maxsize=10000)
-            self.outq = Queue(maxsize=10000)
-
-            # Init processes for file reading, distributed filtering and file writing
-            self.pin = Process(target=self.reader, args=(sample.R1_path, sample.R2_path))
-            self.ps = [Process(target=self.filter, args=(i,)) for i in range(self.n_thread)]
-            self.pout = Process(target=self.writer, args=(sample.R1_outname, sample.R2_outname))
-
-            # Start processes
-            print ("\tStarting fastq trimming")
-            self.pin.start()
-            self.pout.start()
-            for p in self.ps:
-                p.start()
-
-            # Blocks until the process is finished
-            self.pin.join()
-            for i in range(len(self.ps)):
-                self.ps[i].join()
-            self.pout.join()
-            print ("\tFastq trimming done")
-
-            if self.write_report:
-                self._write_report(sample.name, len(sample.adapter_list))
+        if error:
+            sys.exit(1)
 
         print ("Done in {}s".format(round(time()-start_time, 3)))
         return(0)
 
-    def reader(self, R1_path, R2_path):
+    def reader(self, sample_id):
         """
-        Initialize HTSseq FastqReader to iterate over paired fastq files. Data are send in the
-        in queue for the workers. Add n_thread STOP pills at the end of the inq for each worker.
+        Iterate over paired fastq files, decompressed ahead in background threads, by batches of
+        batch_size read pairs packed in free slots of the shared memory ring, tagged with their
+        sample id and sequence number. Slot indexes are send in the in queue for the workers. The
+        time spent waiting for a free slot measures the backpressure of the workers and of the
+        writer. The time spent parsing the files and the depth of the in queue are also sent to the
+        writer every stats_interval seconds. At the end, even if the files are invalid, an END
+        message with the number of batches sent and the remaining stats of the reader is sent
+        directly to the writer of the sample. Interleaved inputs can be pipes or the standard
+        input, the progress bar is only shown for regular files. With read_cache, the batches of
+        regular files are read from the memory mapped cache of the input if it exists, else the
+        parsed batches are also written in a new cache. In preview mode, only the first preview
+        read pairs, or a random fraction of them, are sent to the workers, and the number of pairs
+        of the whole input is estimated for the projection of the full run. The END message is
+        sent whatever the error, flagged if the input could not be read completely
         """
-
-        # Init FastqReader generators
-        R1_gen = FastqReader(R1_path)
-        R2_gen = FastqReader(R2_path)
-        n = 0
-
-        # Iterate over reads in fastq files until exhaustion
+        sample = self.sample_list[sample_id]
+        outq = self.outqs[sample_id]
+        seq = 0
+        error = 1
+        record = self._reader_record()
+        last = time()
+        cache_writer = None
+        n_input = n_sampled = n_byte = estimated = 0
+        rng = np.random.RandomState(1)
         try:
-            while True:
-                read1 = R1_gen.next()
-                read2 = R2_gen.next()
-
-                # Add a tuple read1 and read2 to the end of the queue
-                self.inq.put( ( read1, read2 ) )
-                n+=1
-
-                # update the progress bar
-                self.progress_bar(n)
-
-        except StopIteration as E:
-            print(E)
-
-        # Add a STOP pill to the queue
-        for i in range(self.n_thread):
-            self.inq.put("STOP")
+            paths = [sample.interleaved_path] if sample.interleaved_path else [sample.R1_path, sample.R2_path]
+            cache = None
+            regular = all([os.path.isfile(path) for path in paths])
+            if self.read_cache and regular:
+                cache = cache_path(self.read_cache, paths)
+
+            # The progress is followed with the number of bytes read from the R1 or interleaved file,
+            # or with the number of pairs read from the cache
+            progress_bar = None
+            if cache and os.path.isdir(cache):
+                print ("\tRead the parsed reads from the cache {}".format(cache))
+                reader = ReadCacheReader(cache, self.batch_size)
+                estimated = reader.size
+                if not self.preview_mode:
+                    progress_bar = ProgressBar(total_seq = reader.size, number_step = 10)
+            else:
+                reader = ReadBatchReader(paths[0], paths[1] if len(paths) == 2 else None, self.batch_size, self.n_thread)
+                if regular and not self.preview_mode:
+                    progress_bar = ProgressBar(total_seq = os.path.getsize(paths[0]), number_step = 10)
+                # A partial read of the input in preview mode cannot be cached
+                if cache and not self.preview_mode:
+                    try:
+                        cache_writer = ReadCacheWriter(cache)
+                    except OSError as E:
+                        print ("\tThe read cache cannot be written: {}".format(E))
+
+            # Iterate over read batches in fastq files until exhaustion
+            t = time()
+            for batch in reader:
+                if cache_writer:
+                    cache_writer.write(batch)
+
+                # Sample the pairs of the batch in preview mode. The size of the fastq records parsed
+                # is summed to estimate the number of pairs of the input from its size
+                if self.preview_mode:
+                    n_input += len(batch)
+                    n_byte += sum([len(block.names)+2*len(block.seqs)+6*len(block) for block in
+                        ([batch.R1, batch.R2] if sample.interleaved_path else [batch.R1])])
+                    if self.fraction:
+                        batch = batch.take((rng.random_sample(len(batch)) < self.fraction).nonzero()[0])
+                    if self.preview and n_sampled+len(batch) >= self.preview:
+                        batch = batch.take(np.arange(self.preview-n_sampled))
+                    n_sampled += len(batch)
+                record["timing"]["reader_parse"] += time()-t
+
+                # Copy the batch in a slot and add the slot to the end of the queue
+                for part in self.ring.split(batch):
+                    t = time()
+                    slot = self.ring.acquire()
+                    record["reader_wait"] += time()-t
+                    self.ring.write_batch(slot, part, seq, sample_id)
+                    self.inq.put(slot)
+                    seq += 1
+
+                    depth = self._qsize(self.inq)
+                    record["timing"]["reader_batches"] += 1
+                    record["timing"]["inq_depth_sum"] += depth
+                    record["timing"]["inq_depth_peak"] = max(record["timing"]["inq_depth_peak"], depth)
+
+                # update the progress bar and the stats of the writer
+                if progress_bar:
+                    progress_bar(reader.tell())
+                if self.stats_interval and time()-last >= self.stats_interval:
+                    outq.put(("STATS", record))
+                    record = self._reader_record()
+                    last = time()
+                if self.preview and n_sampled >= self.preview:
+                    break
+                t = time()
+            else:
+                # The whole input was read
+                estimated = n_input
+
+            # Estimate the number of pairs of a partially read input
+            if self.preview_mode and not estimated and regular and n_byte:
+                estimated = int(os.path.getsize(paths[0])/reader.compression_ratio()/(n_byte/float(n_input)))
+
+            if progress_bar:
+                progress_bar(progress_bar.total_seq)
+            if cache_writer:
+                cache_writer.close()
+            error = 0
+
+        except SlotSizeError as E:
+            print ("\t{}. Increase batch_size to enlarge the slots".format(E))
+        except (ValueError, IOError) as E:
+            print ("\tInvalid fastq files: {}".format(E))
+
+        # The END message is always sent, else the writer and the main process would wait forever
+        finally:
+            if error and cache_writer:
+                cache_writer.abort()
+            record.update({"n_batch":seq, "error":error})
+            if self.preview_mode:
+                record.update({"input_pairs":n_input, "estimated_pairs":estimated})
+            outq.put(("END", record))
 
     def filter(self, number):
         """
-        Parallelized filter that take as input a sequence couple in inqueue until a STOP pill is
-        found. Sequences go through a QualityFilter and a AdapterTrimmer object and ifthe couple
-        is able to pass filters then it is put at the end of outqueue. at the ebd of the process
-        a STOP pill is added to the outqueue.
+        Parallelized filter that take as input the slot of a batch of read pairs in inqueue until a
+        STOP pill is found. All the reads of the batch go through the QualityFilter and the
+        AdapterTrimmer objects of its sample. The fastq output of the couples able to pass filters
+        is written in the slot which is put at the end of the outqueue of the sample. With the
+        compiled quality engine, or without quality trimming, trimming and formatting are done in
+        a single pass by a PairTrimmer. In sweep mode, the batch is also trimmed without output by
+        the trimmers of each parameter set, so that all the sets are evaluated on a single
+        decompression and parsing of the fastq files. The counters of the batch are sent with the
+        slot in a stats record, with the time spent by the worker waiting for the batch and in each
+        step
         """
-        # Consume inq and produce and fill outq
-        for read1, read2 in iter(self.inq.get, "STOP"):
-
-            with self.total.get_lock():
-                self.total.value+=1
-
-            # Quality filtering
-            if self.quality_trim:
-                read1 = self.quality_trimmer(read1)
-                read2 = self.quality_trimmer(read2)
-                if not read1 or not read2:
+        trimmers = {}
+        worker = "worker_{}".format(number)
+
+        # Consume inq and produce and fill the outqs
+        t = time()
+        for slot in iter(self.inq.get, "STOP"):
+            timing = {"batches":1, "wait":time()-t}
+            sample_id = self.ring.sample(slot)
+            sample = self.sample_list[sample_id]
+            if sample_id not in trimmers:
+                trimmers[sample_id] = (self._init_trimmers(sample),
+                    [self._init_trimmers(sample, parameters) for name, parameters in self.sweep_sets])
+            main, sweep = trimmers[sample_id]
+            interleaved = sample.interleaved_outname is not None
+
+            batch = self.ring.read_batch(slot)
+            stats = {"total":len(batch)}
+
+            # Write the fastq output of the couples which passed both filters in the slot
+            stats.update(self._trim_slot(slot, batch, main, timing, interleaved, self.write_output))
+            if not self.write_output:
+                self.ring.set_output(slot, 0, 0)
+
+            # Counters of the parameter sets for this batch
+            if sweep:
+                t = time()
+                stats["sweep"] = {}
+                for (name, parameters), set_trimmers in zip(self.sweep_sets, sweep):
+                    stats["sweep"][name] = self._trim_slot(slot, batch, set_trimmers, {}, interleaved, False)
+                timing["sweep"] = time()-t
+            stats["workers"] = {worker:timing}
+
+            self.outqs[sample_id].put((slot, stats))
+            t = time()
+
+    def writer(self, sample_id):
+        """
+        Write the sequence couples which passed the filters from the slots of the outqueue of a
+        sample in a pair of fastq files and release the slots. Sequences will remains paired (ie at
+        the same index in the 2 files or consecutive in an interleaved file) but they may not be in the same order than in the input
+        fastq files, unless ordered_output is True. In this case the slots arriving before their
+        turn wait in a reorder buffer indexed by sequence number. The buffer is bounded by the
+        number of slots of the ring since the reader cannot fill new slots before the oldest ones
+        are written. The process will continue until all the batches announced by the END message
+        of the reader were received. The stats records of the batches are aggregated and sent in
+        the statq with the id of the sample, and a snapshot of them every stats_interval seconds.
+        The time spent waiting for the slots and writing them and the depth of the out queue are
+        added to the stats. Compressed outputs are written by blocks compressed in parallel by a
+        pool of n_thread threads shared by R1 and R2. Without output (write_output False) the slots
+        are only released. If the outputs cannot be opened or written, the remaining slots are
+        released without being written and the final stats are always sent, with an error flag
+        """
+        sample = self.sample_list[sample_id]
+        outq = self.outqs[sample_id]
+        stats = {"total":0, "pass_qual":0, "pass_adapt":0, "total_pass":0}
+        timing = {"writer_wait":0.0, "writer_write":0.0, "writer_batches":0, "outq_depth_sum":0, "outq_depth_peak":0}
+        stats["timing"] = timing
+        start = last = time()
+
+        # Reorder buffer and counters
+        reorder = {}
+        next_seq = 0
+        n_batch = None
+        received = 0
+        peak = late = 0
+
+        # Open output fastq streams for writing. If they cannot be opened, or if a write fails, the
+        # slots are still consumed and released to not block the reader and the other samples
+        out_R1 = out_R2 = pool = current = None
+        done = False
+        try:
+            try:
+                pool = ThreadPool(self.n_thread) if self.compress_output else None
+                if self.write_output and self.preview_mode:
+                    out_R1 = self._open_output(os.devnull, pool)
+                    out_R2 = None if sample.interleaved_outname else self._open_output(os.devnull, pool)
+                elif self.write_output and sample.interleaved_outname:
+                    out_R1 = self._open_output(sample.interleaved_outname, pool)
+                elif self.write_output:
+                    out_R1 = self._open_output(sample.R1_outname, pool)
+                    out_R2 = self._open_output(sample.R2_outname, pool)
+            except (IOError, OSError) as e:
+                print "I/O error({}): {}".format(e.errno, e.strerror)
+                out_R1 = out_R2 = None
+                stats["error"] = 1
+
+            # Keep running until all the batches of the sample were received
+            while n_batch is None or received < n_batch:
+                t = time()
+                slot, record = outq.get()
+                timing["writer_wait"] += time()-t
+
+                if self.stats_interval and time()-last >= self.stats_interval:
+                    timing["elapsed"] = time()-start
+                    self.statq.put((sample_id, deepcopy(stats), False))
+                    last = time()
+
+                if slot in ("END", "STATS"):
+                    if slot == "END":
+                        n_batch = record.pop("n_batch")
+                    self._merge_stats(stats, record)
                     continue
 
-                with self.pass_qual.get_lock():
-                    self.pass_qual.value+=1
+                # Slot held by the writer until it is written or buffered
+                current = slot
+                received += 1
+                depth = self._qsize(outq)
+                timing["writer_batches"] += 1
+                timing["outq_depth_sum"] += depth
+                timing["outq_depth_peak"] = max(timing["outq_depth_peak"], depth)
+                self._merge_stats(stats, record)
+
+                # Write the slot, or in ordered mode the slot and the following ones already
+                # buffered. The outputs are dropped after a failed write
+                t = time()
+                try:
+                    if not self.ordered_output:
+                        current = None
+                        self._write_slot(slot, out_R1, out_R2)
+                    else:
+                        reorder[self.ring.sequence(slot)] = slot
+                        current = None
+                        if next_seq not in reorder:
+                            late += 1
+                            peak = max(peak, len(reorder))
+                        while next_seq in reorder:
+                            next_seq += 1
+                            self._write_slot(reorder.pop(next_seq-1), out_R1, out_R2)
+                except (IOError, OSError) as e:
+                    print "I/O error({}): {}".format(e.errno, e.strerror)
+                    out_R1 = out_R2 = None
+                    stats["error"] = 1
+                timing["writer_write"] += time()-t
+
+            t = time()
+            try:
+                if out_R1:
+                    out_R1.close()
+                    if out_R2:
+                        out_R2.close()
+                if pool:
+                    pool.close()
+                    pool.join()
+            except (IOError, OSError) as e:
+                print "I/O error({}): {}".format(e.errno, e.strerror)
+                stats["error"] = 1
+            timing["writer_write"] += time()-t
+            done = True
+
+        # The final stats are always sent, else the main process would wait forever for the sample.
+        # After an unexpected error, the slots held and the remaining batches are released
+        finally:
+            if not done:
+                stats["error"] = 1
+                self._drain_slots(outq, ([current] if current is not None else []) + reorder.values(), n_batch, received)
+            timing["elapsed"] = time()-start
+            stats.update({"reorder_peak":peak, "reorder_late":late})
+            self.statq.put((sample_id, stats, True))
 
-            # Adapter trimming
-            if self.adapter_trim:
-                read1 = self.adapter_trimmer(read1)
-                read2 = self.adapter_trimmer(read2)
-                if not read1 or not read2:
-                    continue
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
 
-                with self.pass_adapt.get_lock():
-                    self.pass_adapt.value+=1
+    def _start_sample (self, sample_id):
+        """
+        Start the reader and the writer processes of a sample
+        @return The list of the started processes
+        """
+        sample = self.sample_list[sample_id]
+        print ("ANALYSING SAMPLE {} ({}/{})".format(sample.name, sample_id+1, len(self.sample_list)))
 
-            # If both filters passed = add to the output queue
-            self.outq.put( (read1, read2) )
+        print ("\tStarting fastq trimming")
+        processes = [Process(target=self.reader, args=(sample_id,)), Process(target=self.writer, args=(sample_id,))]
+        for p in processes:
+            p.start()
+        return processes
 
-        # Add a STOP pill to the queue
-        self.outq.put("STOP")
-        #print ("Filter N° {} done".format(number))
+    def _slot_size (self):
+        """
+        Size of the slots of the shared memory ring, for batches of batch_size read pairs of the
+        mean size of the first pairs of the samples plus 25%, or of SLOT_PAIR_SIZE bytes if
+        larger. The batches containing longer pairs are split in several slots. The slots are at
+        least SLOT_MIN_SIZE bytes so that a single long pair fits. Pipes and the standard input
+        cannot be read ahead and are not sampled
+        """
+        pair_size = self.SLOT_PAIR_SIZE
+        for sample in self.sample_list:
+            paths = [sample.interleaved_path] if sample.interleaved_path else [sample.R1_path, sample.R2_path]
+            if not all([os.path.isfile(path) for path in paths]):
+                continue
+
+            # Mean size of a pair, the reads of an interleaved file are the 2 mates of the pairs
+            size = 0
+            for path in paths:
+                block = self._head_fastq(path, 2*self.SLOT_SAMPLE_PAIRS/len(paths))
+                if len(block):
+                    size += 2/len(paths)*SharedRing.block_nbytes(block)/float(len(block))
+            pair_size = max(pair_size, int(1.25*size))
+
+        return max(self.batch_size*pair_size, self.SLOT_MIN_SIZE)
+
+    def _head_fastq (self, fastq, n_read):
+        """
+        Parse the first reads of a fastq file, gzipped or not
+        @return A ReadBlock of n_read reads at most, empty if the file cannot be parsed
+        """
+        try:
+            fp = io.open(fastq, "rb")
+            if fp.peek(2)[:2] == "\x1f\x8b":
+                fp = GzipFile(fileobj=fp)
+            lines = list(islice(fp, 4*n_read))
+            fp.close()
+            return ReadBlock.from_lines(lines[:len(lines)/4*4])
+        except (ValueError, IOError):
+            return ReadBlock()
 
-        # Collecting Trimmer informations
-        if self.quality_trim:
-            q_dict = self.quality_trimmer.get_summary()
-            with self.qual_total.get_lock():
-                self.qual_total.value += q_dict["total"]
-            with self.qual_untrimmed.get_lock():
-                self.qual_untrimmed.value+=q_dict["untrimmed"]
-            with self.qual_trimmed.get_lock():
-                self.qual_trimmed.value+=q_dict["trimmed"]
-            with self.qual_fail.get_lock():
-                self.qual_fail.value+=q_dict["fail"]
-            with self.qual_base_trimmed.get_lock():
-                self.qual_base_trimmed.value+=q_dict["base_trimmed"]
-            with self.qual_mean_sum.get_lock():
-                self.qual_mean_sum.value+=q_dict["qual_mean_sum"]
+    def _verify_counts (self):
+        """
+        Count the reads of the R1 and R2 files of the samples, interleaved inputs excepted
+        @return False if the files of a sample are unreadable or do not contain the same number
+        of reads
+        """
+        for sample in self.sample_list:
+            if sample.interleaved_path:
+                continue
+            print ("Verify Fastq and count the number of reads of sample {}".format(sample.name))
+            n_read1 = self._count_fastq (sample.R1_path)
+            n_read2 = self._count_fastq (sample.R2_path)
+            if n_read1 is None or n_read2 is None:
+                return False
+            if n_read1 != n_read2:
+                print ("\tFastq R1 and Fastq R2 files of sample {} do not contain the same number of reads ({} and {})".format(
+                    sample.name, n_read1, n_read2))
+                return False
+        return True
+
+    def _init_trimmers (self, sample, parameters={}):
+        """
+        Create the trimmers of a sample in a filter process
+        @param parameters Dict of the values of the swept parameters replacing the values of the
+        configuration file
+        @return The quality trimmer, the adapter trimmer (None if disabled), the PairTrimmer
+        fusing them (None if the quality engine is not compiled) and a dict of their summaries
+        before the first batch
+        """
+        quality_trimmer = adapter_trimmer = pair_trimmer = None
+        summary = {}
 
+        # Define Quality Trimmer Object
+        if self.quality_trim:
+            trimmer_class = {"python":QualityTrimmer, "numpy":NumpyQualityTrimmer, "compiled":FastQualityTrimmer}[self.quality_engine]
+            quality_trimmer = trimmer_class(
+                qual_cutdown = parameters.get("qual_cutdown", self.qual_cutdown),
+                win_size = parameters.get("win_size", self.win_size),
+                step = self.step,
+                min_size = self.min_size,
+                left_trim = self.left_trim,
+                right_trim = self.right_trim)
+            summary["quality"] = quality_trimmer.get_summary()
+
+        # Define Adapter Trimmer Object
         if self.adapter_trim:
-            a_dict = self.adapter_trimmer.get_summary()
-            with self.adapt_total.get_lock():
-                self.adapt_total.value+=a_dict["total"]
-            with self.adapt_untrimmed.get_lock():
-                self.adapt_untrimmed.value+=a_dict["untrimmed"]
-            with self.adapt_trimmed.get_lock():
-                self.adapt_trimmed.value+=a_dict["trimmed"]
-            with self.adapt_fail.get_lock():
-                self.adapt_fail.value+=a_dict["fail"]
-            with self.adapt_base_trimmed.get_lock():
-                self.adapt_base_trimmed.value+=a_dict["base_trimmed"]
-            #for n, adapter in enumerate (a_dict["adapter_found"]):
-                #with self.adapter_found.get_lock():
-                    #self.adapter_found[n] += adapter
-
-    def writer(self, R1_outname, R2_outname):
-        """
-        Write sequence couples from outqueue in a pair of fastq files. Sequences will remains
-        paired (ie at the same index in the 2 files) but they may not be in the same order
-        than in the input fastq files. The process will continue until n = n_thead STOP pills were
-        found in the outqueue (ie. the queue is empty)
-        """
-        # Open output fastq streams for writing
+            adapter_trimmer = AdapterTrimmer(
+                adapter_list = sample.adapter_list,
+                min_size = self.min_size,
+                min_match_len = parameters.get("min_match_len", self.min_match_len),
+                min_match_score = parameters.get("min_match_score", self.min_match_score),
+                ssw_match = self.ssw_match,
+                ssw_mismatch = self.ssw_mismatch,
+                ssw_gapO = self.ssw_gapO,
+                ssw_gapE = self.ssw_gapE,
+                anchor_3prime = self.anchor_3prime,
+                search_window = self.search_window,
+                min_stub = self.min_stub,
+                memo_size = self.memo_size)
+            summary["adapter"] = adapter_trimmer.get_summary()
+
+        # Fused trimming and formatting when all the trimmers are compiled
+        if not self.quality_trim or self.quality_engine == "compiled":
+            pair_trimmer = PairTrimmer(quality_trimmer, adapter_trimmer,
+                min_overlap = self.min_overlap if self.adapter_trim else 0,
+                min_size = self.min_size)
+            summary["pair"] = pair_trimmer.get_summary()
+            summary["timing"] = pair_trimmer.get_timing()
+
+        return quality_trimmer, adapter_trimmer, pair_trimmer, summary
+
+    def _write_slot (self, slot, out_R1, out_R2):
+        """
+        Write the fastq output of a slot and release the slot, even if the write fails. The
+        interleaved output is entirely in the R1 output
+        """
         try:
-            out_R1 = gopen(R1_outname, "wb") if self.compress_output else open(R1_outname, "wb")
-            out_R2 = gopen(R2_outname, "wb") if self.compress_output else open(R2_outname, "wb")
-
-            current_seq = 0
-            buffer_R1 = ""
-            buffer_R2 = ""
+            if out_R1:
+                fastq1, fastq2 = self.ring.read_output(slot)
+                out_R1.write(fastq1)
+                if out_R2:
+                    out_R2.write(fastq2)
+        finally:
+            self.ring.release(slot)
+
+    def _drain_slots (self, outq, slots, n_batch, received):
+        """
+        Release the slots held by a failed writer, then the slots of the batches remaining in the
+        out queue of its sample, so that the reader and the other samples are not blocked
+        @param slots List of the slots held by the writer
+        @param n_batch Number of batches of the sample, None if the END message was not received
+        @param received Number of batches already received
+        """
+        for slot in slots:
+            self.ring.release(slot)
+        while n_batch is None or received < n_batch:
+            slot, record = outq.get()
+            if slot == "END":
+                n_batch = record["n_batch"]
+            elif slot != "STATS":
+                self.ring.release(slot)
+                received += 1
+
+    def _open_output (self, path, pool):
+        """
+        Open an output fastq file, "-" for the standard output. Compressed outputs are compressed
+        by blocks in the threads of pool
+        """
+        fp = os.fdopen(os.dup(sys.__stdout__.fileno()), "wb") if path == "-" else path
+        if self.compress_output:
+            return BlockGzipWriter(fp, self.compress_level, self.compress_block_size*1024, self.bgzf_output, self.n_thread, pool)
+        return fp if path == "-" else open(path, "wb")
 
-            # Keep running until all thread STOP pills has been passed
-            for works in range(self.n_thread):
-                # Will exit the loop as soon as a STOP pill will be found
-                for read1, read2 in iter(self.outq.get, "STOP"):
+    def _trim_slot (self, slot, batch, trimmers, timing, interleaved=False, output=True):
+        """
+        Trim the batch of a slot with the trimmers created by _init_trimmers and write the fastq
+        output of the couples which passed both filters in the slot
+        @param timing Dict receiving the time spent in the quality, adapter and format steps
+        @param interleaved Format the output in interleaved fastq
+        @param output Write the output in the slot, else the batch is only trimmed
+        @return A stats record with the pass counters and the counters of the trimmers for this
+        batch only
+        """
+        quality_trimmer, adapter_trimmer, pair_trimmer, summary = trimmers
+        stats = {}
+
+        if pair_trimmer:
+            stats["pass_qual"], stats["pass_adapt"], size1, size2 = pair_trimmer.trim_format(
+                batch.R1, batch.R2, self.ring.output_buffer(slot) if output else None, interleaved)
+            if output:
+                self.ring.set_output(slot, size1, size2)
+            timing.update(self._diff_stats(pair_trimmer.get_timing(), summary["timing"]))
+        else:
+            stats["pass_qual"], stats["pass_adapt"], fastq1, fastq2 = self._trim_format(
+                batch, quality_trimmer, adapter_trimmer, timing, interleaved, output)
+            if output:
+                self.ring.write_output(slot, fastq1, fastq2)
+        stats["total_pass"] = stats["pass_adapt"] if self.adapter_trim else stats["pass_qual"] if self.quality_trim else len(batch)
 
-                    with self.total_pass.get_lock():
-                        self.total_pass.value+=1
+        if self.quality_trim:
+            stats["quality"] = self._diff_stats(quality_trimmer.get_summary(), summary["quality"])
+        if self.adapter_trim:
+            stats["adapter"] = self._diff_stats(adapter_trimmer.get_summary(), summary["adapter"])
+        if pair_trimmer:
+            stats["pair"] = self._diff_stats(pair_trimmer.get_summary(), summary["pair"])
+        return stats
 
-                    buffer_R1 += read1.fastqstr
-                    buffer_R2 += read2.fastqstr
+    def _trim_format (self, batch, quality_trimmer, adapter_trimmer, timing, interleaved=False, output=True):
+        """
+        Trim a batch with the python or numpy quality engines and format the fastq output of the
+        couples which passed both filters
+        @param timing Dict receiving the time spent in the quality, adapter and format steps
+        @param interleaved Format the output in interleaved fastq, returned as the R1 output
+        @param output Format the output, else empty outputs are returned
+        @return The number of couples passing the quality and the adapter trimming and the fastq
+        output of R1 and R2
+        """
+        block1, block2 = batch.R1, batch.R2
+        start1, end1 = np.zeros(len(batch), dtype=np.int32), block1.lengths.copy()
+        start2, end2 = np.zeros(len(batch), dtype=np.int32), block2.lengths.copy()
+        passed = np.ones(len(batch), dtype=bool)
+        pass_qual = pass_adapt = 0
+
+        # Quality filtering
+        t = time()
+        if self.quality_trim:
+            start1, end1, status1 = quality_trimmer.trim_batch(block1.quals, block1.lengths)
+            start2, end2, status2 = quality_trimmer.trim_batch(block2.quals, block2.lengths)
+            passed &= (status1 != FAIL) & (status2 != FAIL)
+            pass_qual = int(passed.sum())
+        timing["quality"] = time()-t
 
-                    if self.total_pass.value%self.buffer_size == 0:
-                        out_R1.write(buffer_R1)
-                        out_R2.write(buffer_R2)
-                        buffer_R1 = ""
-                        buffer_R2 = ""
+        # Adapter trimming of the quality trimmed reads, coordinates are shifted to the full reads
+        if self.adapter_trim:
+            index = passed.nonzero()[0]
+            if self.quality_trim:
+                block1 = block1.trim(index, start1[index], end1[index])
+                block2 = block2.trim(index, start2[index], end2[index])
+            a_start1, a_end1, status1 = adapter_trimmer.trim_batch(block1.seqs, block1.quals, block1.lengths, num_threads=1)
+            a_start2, a_end2, status2 = adapter_trimmer.trim_batch(block2.seqs, block2.quals, block2.lengths, num_threads=1)
+            end1[index] = start1[index] + a_end1
+            start1[index] += a_start1
+            end2[index] = start2[index] + a_end2
+            start2[index] += a_start2
+            passed[index] &= (status1 != FAIL) & (status2 != FAIL)
+            pass_adapt = int(passed.sum())
+        timing["adapter"] = time()-t-timing["quality"]
+        if not output:
+            return pass_qual, pass_adapt, "", ""
+
+        t = time()
+        index = passed.nonzero()[0]
+        block1 = batch.R1.trim(index, start1[index], end1[index])
+        block2 = batch.R2.trim(index, start2[index], end2[index])
+        fastq1, fastq2 = (ReadBatch(block1, block2).fastqstr, "") if interleaved else (block1.fastqstr, block2.fastqstr)
+        timing["format"] = time()-t
+
+        return pass_qual, pass_adapt, fastq1, fastq2
+
+    def _merge_stats (self, dest, src):
+        """
+        Add a stats record to the aggregated stats. Counters are summed, lists of counters are
+        summed element wise, nested records are merged and peaks keep their maximal value
+        """
+        for key, value in src.items():
+            if key not in dest:
+                dest[key] = {} if isinstance(value, dict) else value
+                if not isinstance(value, dict):
+                    continue
+            if isinstance(value, dict):
+                self._merge_stats(dest[key], value)
+            elif isinstance(value, list):
+                dest[key] = [i+j for i, j in zip(dest[key], value)]
+            elif key.endswith("_peak"):
+                dest[key] = max(dest[key], value)
+            else:
+                dest[key] += value
+
+    def _diff_stats (self, summary, previous):
+        """
+        Difference between the current summary of a trimmer and its previous summary, which is
+        replaced in place by the current one
+        @return A stats record with the counters of the last batch
+        """
+        diff = {}
+        for key, value in summary.items():
+            if isinstance(value, list):
+                diff[key] = [i-j for i, j in zip(value, previous[key])]
+            else:
+                diff[key] = value - previous[key]
+        previous.update(summary)
+        return diff
+
+    def _reader_record (self):
+        """ Empty stats record of a reader """
+        return {"reader_wait":0.0, "timing":{"reader_parse":0.0, "reader_batches":0, "inq_depth_sum":0, "inq_depth_peak":0}}
+
+    def _qsize (self, queue):
+        """ Approximate size of a queue, 0 on the platforms where it is not implemented """
+        try:
+            return queue.qsize()
+        except NotImplementedError:
+            return 0
 
-            out_R1.write(buffer_R1)
-            out_R2.write(buffer_R2)
-            buffer_R1 = ""
-            buffer_R2 = ""
+    def _timing_summary (self, stats):
+        """
+        Flatten the timers and counters of the stats of a sample. The times of the workers are
+        summed over all the workers
+        @return A dict of the timers in seconds, queue depths and counters of pairs
+        """
+        timing = stats.get("timing", {})
+        workers = stats.get("workers", {}).values()
+        summary = {
+            "pairs":stats["total"],
+            "pass":stats["total_pass"],
+            "elapsed":timing.get("elapsed", 0),
+            "reader_parse":timing.get("reader_parse", 0),
+            "reader_wait":stats.get("reader_wait", 0),
+            "writer_wait":timing.get("writer_wait", 0),
+            "writer_write":timing.get("writer_write", 0),
+            "inq_depth_mean":timing.get("inq_depth_sum", 0)/float(max(timing.get("reader_batches", 0), 1)),
+            "inq_depth_peak":timing.get("inq_depth_peak", 0),
+            "outq_depth_mean":timing.get("outq_depth_sum", 0)/float(max(timing.get("writer_batches", 0), 1)),
+            "outq_depth_peak":timing.get("outq_depth_peak", 0)}
+
+        for step in ("wait", "quality", "adapter", "format", "sweep"):
+            summary["worker_"+step] = sum([worker.get(step, 0) for worker in workers])
+        return summary
+
+    def _publish_stats (self, sample_name, stats):
+        """
+        Print a machine readable stats line of a sample if stats_interval is set and rewrite the
+        prometheus file with the last stats of all the samples if prometheus_file is set
+        """
+        self.live_stats[sample_name] = stats
 
-            out_R1.close()
-            out_R2.close()
+        if self.stats_interval:
+            line = self._timing_summary(stats)
+            line["sample"] = sample_name
+            line["pairs_per_s"] = line["pairs"]/line["elapsed"] if line["elapsed"] else 0
+            for key, value in line.items():
+                if isinstance(value, float):
+                    line[key] = round(value, 3)
+            print ("STATS\t{}".format(json.dumps(line, sort_keys=True)))
 
-        except IOError as e:
-            print "I/O error({}): {}".format(e.errno, e.strerror)
+        if self.prometheus_file:
+            self._write_prometheus()
 
-    #~~~~~~~PRIVATE METHODS~~~~~~~#
+    def _write_prometheus (self):
+        """
+        Write the timers and counters of all the samples in the prometheus text format. The file is
+        replaced atomically so that it can be scraped at any time
+        """
+        metrics = [
+            ("sekator_pairs_total", "counter", "Read pairs processed"),
+            ("sekator_pairs_passed_total", "counter", "Read pairs passing all the filters"),
+            ("sekator_elapsed_seconds", "gauge", "Time since the start of the sample"),
+            ("sekator_stage_seconds_total", "counter", "Time spent in each stage of the pipeline"),
+            ("sekator_worker_seconds_total", "counter", "Time spent by each worker in each step"),
+            ("sekator_queue_depth_mean", "gauge", "Mean number of batches waiting in the queues"),
+            ("sekator_queue_depth_peak", "gauge", "Maximal number of batches waiting in the queues")]
+        values = dict([(name, []) for name, kind, help in metrics])
+
+        for sample_name, stats in sorted(self.live_stats.items()):
+            summary = self._timing_summary(stats)
+            label = 'sample="{}"'.format(sample_name)
+            values["sekator_pairs_total"].append((label, summary["pairs"]))
+            values["sekator_pairs_passed_total"].append((label, summary["pass"]))
+            values["sekator_elapsed_seconds"].append((label, summary["elapsed"]))
+            for stage in ("reader_parse", "reader_wait", "writer_wait", "writer_write"):
+                values["sekator_stage_seconds_total"].append(('{},stage="{}"'.format(label, stage), summary[stage]))
+            for worker, timing in sorted(stats.get("workers", {}).items()):
+                for step in ("wait", "quality", "adapter", "format"):
+                    values["sekator_worker_seconds_total"].append(
+                        ('{},worker="{}",step="{}"'.format(label, worker, step), timing.get(step, 0)))
+            for queue in ("inq", "outq"):
+                values["sekator_queue_depth_mean"].append(('{},queue="{}"'.format(label, queue), summary[queue+"_depth_mean"]))
+                values["sekator_queue_depth_peak"].append(('{},queue="{}"'.format(label, queue), summary[queue+"_depth_peak"]))
+
+        with open (self.prometheus_file+".tmp", "wb") as fp:
+            for name, kind, help in metrics:
+                fp.write("# HELP {} {}\n# TYPE {} {}\n".format(name, help, name, kind))
+                for label, value in values[name]:
+                    fp.write("{}{{{}}} {}\n".format(name, label, value))
+        os.rename(self.prometheus_file+".tmp", self.prometheus_file)
 
     def _test_values(self):
         """
@@ -412,11 +1016,24 @@ class Sekator (object):
         # Verify values from the quality section
         assert self.min_size >= 0, "Authorized values for min_size : >= 0"
         assert self.n_thread > 0, "Authorized values for n_thread : > 0"
+        assert self.batch_size > 0, "Authorized values for batch_size : > 0"
+        assert self.concurrent_samples > 0, "Authorized values for concurrent_samples : > 0"
+        assert self.stats_interval >= 0, "Authorized values for stats_interval : >= 0"
+        assert self.preview >= 0, "Authorized values for --preview : >= 0"
+        assert 0 <= self.fraction <= 1, "Authorized values for --fraction : 0 to 1"
+        assert not self.read_cache or os.path.isdir(self.read_cache), "The read_cache directory {} does not exist".format(self.read_cache)
+        assert len([i for i in self.sample_list if i.interleaved_path == "-"]) <= 1, "Only one sample can be read from the standard input"
+        assert len([i for i in self.sample_list if i.interleaved_outname == "-"]) <= 1, "Only one sample can be written to the standard output"
+
+        if self.compress_output:
+            assert 1 <= self.compress_level <= 9, "Authorized values for compress_level : 1 to 9"
+            assert self.compress_block_size > 0, "Authorized values for compress_block_size : > 0"
 
         if self.quality_trim:
             assert self.win_size > 0, "Authorized values for win_size : > 0"
             assert self.step > 0, "Authorized values for step : > 0"
             assert 0 <= self.qual_cutdown <= 40, "Authorized values for qual_cutdown : 0 to 40"
+            assert self.quality_engine in ["python", "numpy", "compiled"], "Authorized values for engine : python, numpy, compiled"
 
         if self.adapter_trim:
             assert self.ssw_match
@@ -427,10 +1044,33 @@ class Sekator (object):
 
             max_score = self.ssw_match
             min_score = - max([self.ssw_mismatch, self.ssw_gapO, self.ssw_gapE])
+            assert self.search_window >= 0, "Authorized values for search_window : >= 0"
+            assert self.min_stub >= 0, "Authorized values for min_stub : >= 0"
+            assert self.min_overlap >= 0, "Authorized values for min_overlap : >= 0"
+            assert self.memo_size >= 0, "Authorized values for memo_size : >= 0"
+            if self.memo_size:
+                for sample in self.sample_list:
+                    if len(sample.adapter_list) > MEMO_MAX_ADAPTERS:
+                        print ("\tMemoization cache disabled for sample {}: more than {} adapters".format(
+                            sample.name, MEMO_MAX_ADAPTERS))
+            assert not self.min_overlap or not self.quality_trim or self.quality_engine == "compiled", \
+                "The detection of the insert overlap (min_overlap) requires the compiled quality engine"
 
             assert 0 < self.min_match_len <= 1, "Authorized values for min_match_len : > 0 to 1"
             assert min_score <= self.min_match_score <= max_score, "Authorized values for min_match_score : - higher penalty to ssw_match"
 
+        # Verify the values of the parameter sets of the sweep
+        for name, parameters in self.sweep_sets:
+            assert self.quality_trim or not ("qual_cutdown" in parameters or "win_size" in parameters), \
+                "The sweep of qual_cutdown and win_size requires the quality trimming"
+            assert self.adapter_trim or not ("min_match_len" in parameters or "min_match_score" in parameters), \
+                "The sweep of min_match_len and min_match_score requires the adapter trimming"
+            assert 0 <= parameters.get("qual_cutdown", 0) <= 40, "Authorized values for qual_cutdown : 0 to 40"
+            assert parameters.get("win_size", 1) > 0, "Authorized values for win_size : > 0"
+            assert 0 < parameters.get("min_match_len", 1) <= 1, "Authorized values for min_match_len : > 0 to 1"
+            if "min_match_score" in parameters:
+                assert min_score <= parameters["min_match_score"] <= max_score, "Authorized values for min_match_score : - higher penalty to ssw_match"
+
     def _is_readable_file (self, fp):
         """ Verify the readability of a file or list of file """
         if not os.access(fp, os.R_OK):
@@ -453,35 +1093,150 @@ class Sekator (object):
         except IOError as e:
             print "I/O error({}): {}".format(e.errno, e.strerror)
 
-    def _write_report (self, sample_name, n_adapter):
+    def _write_preview (self, sample, stats):
+        """
+        Print the report of a sample trimmed in preview mode, followed by the hit rate of each
+        adapter and a projection of the trimming of the whole input. The runtime of the parsing
+        is projected with the pairs parsed and the runtime of the rest of the pipeline with the
+        pairs sampled
+        """
+        if not stats["total"]:
+            print ("\tNo read pair sampled for sample {}".format(sample.name))
+            return
 
-        with open ("{}_trimming_report.csv".format(sample_name), "wb") as report:
-            report.write ("Program {}\tDate {}\n".format(self.VERSION,str(datetime.today())))
-            report.write("\nSample name\t{}\n".format(sample_name))
-            report.write("Generic section\n")
-            report.write("Total pair\t{}\n".format(self.total.value))
-            report.write("Pass quality trimming\t{}\n".format(self.pass_qual.value))
-            report.write("Pass adapter trimming\t{}\n".format(self.pass_adapt.value))
-            report.write("Pass total\t{}\n".format(self.total_pass.value))
+        self._write_report(sample.name, sample.adapter_list, stats, report=sys.stdout)
 
-            # Define Quality Trimmer Object and specific shared memory counters
-            if self.quality_trim:
-                report.write("\nQuality trimming section\n")
-                report.write("Total read\t{}\n".format(self.qual_total.value))
-                report.write("Untrimmed\t{}\n".format(self.qual_untrimmed.value))
-                report.write("Trimmed\t{}\n".format(self.qual_trimmed.value))
-                report.write("Fail\t{}\n".format(self.qual_fail.value))
-                report.write("Base trimmed\t{}\n".format(self.qual_base_trimmed.value))
-                report.write("Mean quality\t{}\n".format(self.qual_mean_sum.value/self.qual_total.value))
-
-            # Define Adapter Trimmer Object and specific shared memory counters
-            if self.adapter_trim:
-                report.write("\nAdapter trimming section\n")
-                report.write("Total read\t{}\n".format(self.adapt_total.value))
-                report.write("Untrimmed\t{}\n".format(self.adapt_untrimmed.value))
-                report.write("Trimmed\t{}\n".format(self.adapt_trimmed.value))
-                report.write("Fail\t{}\n".format(self.adapt_fail.value))
-                report.write("Base trimmed\t{}\n".format(self.adapt_base_trimmed.value))
+        print ("\nPreview section")
+        print ("Pairs parsed\t{}".format(stats["input_pairs"]))
+        print ("Pairs trimmed\t{}".format(stats["total"]))
+        print ("Fail fraction\t{}".format(round(1-stats["total_pass"]/float(stats["total"]), 4)))
+        if self.adapter_trim:
+            print ("Adapter hit rate (hits per read)")
+            for adapter, count in zip(sample.adapter_list, stats["adapter"]["adapter_found"]):
+                print ("{}\t{}".format(adapter, round(count/float(max(stats["adapter"]["total"], 1)), 4)))
+
+        if stats["estimated_pairs"]:
+            timing = self._timing_summary(stats)
+            parse = timing["reader_parse"]*stats["estimated_pairs"]/float(stats["input_pairs"])
+            trim = max(timing["elapsed"]-timing["reader_parse"], 0)*stats["estimated_pairs"]/float(stats["total"])
+            print ("Estimated pairs in input\t{}".format(stats["estimated_pairs"]))
+            print ("Projected passing pairs\t{}".format(int(stats["estimated_pairs"]*stats["total_pass"]/float(stats["total"]))))
+            print ("Projected runtime (s)\t{}".format(round(parse+trim, 1)))
+        else:
+            print ("The size of the input is unknown, no projection of the full run")
+
+    def _write_sweep_report (self, sample, stats):
+        """
+        Write a trimming report for each parameter set of the sweep, named after the sample and the
+        set, and a table comparing the counters of all the sets
+        """
+        names = [name for name, cast in self.SWEEP_PARAMETERS]
+
+        with open ("{}_sweep_report.csv".format(sample.name), "wb") as report:
+            report.write("Set\t{}\tPass quality trimming\tPass adapter trimming\tPass total\tQuality base trimmed\tAdapter base trimmed\n".format(
+                "\t".join(names)))
+
+            for name, parameters in self.sweep_sets:
+                set_stats = dict(stats)
+                set_stats.update(stats["sweep"][name])
+                self._write_report("{}_{}".format(sample.name, name), sample.adapter_list, set_stats, parameters)
+
+                report.write("{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format(name,
+                    "\t".join([str(parameters.get(i, getattr(self, i, ""))) for i in names]),
+                    set_stats["pass_qual"], set_stats["pass_adapt"], set_stats["total_pass"],
+                    set_stats["quality"]["base_trimmed"] if self.quality_trim else 0,
+                    set_stats["adapter"]["base_trimmed"] if self.adapter_trim else 0))
+
+    def _write_report (self, sample_name, adapter_list, stats, parameters=None, report=None):
+        """
+        Write the trimming report of a sample
+        @param parameters Dict of the swept parameters of a parameter set, listed in the report
+        @param report File object receiving the report, by default sample_name_trimming_report.csv
+        """
+        if report is None:
+            with open ("{}_trimming_report.csv".format(sample_name), "wb") as report:
+                return self._write_report(sample_name, adapter_list, stats, parameters, report)
+
+        report.write ("Program {}\tDate {}\n".format(self.VERSION,str(datetime.today())))
+        report.write("\nSample name\t{}\n".format(sample_name))
+        if parameters:
+            report.write("\nParameter set section\n")
+            for name, value in sorted(parameters.items()):
+                report.write("{}\t{}\n".format(name, value))
+            report.write("\n")
+        report.write("Generic section\n")
+        report.write("Total pair\t{}\n".format(stats["total"]))
+        report.write("Pass quality trimming\t{}\n".format(stats["pass_qual"]))
+        report.write("Pass adapter trimming\t{}\n".format(stats["pass_adapt"]))
+        report.write("Pass total\t{}\n".format(stats["total_pass"]))
+
+        report.write("\nBackpressure section\n")
+        report.write("Reader wait for free slot (s)\t{}\n".format(round(stats["reader_wait"], 3)))
+        if self.ordered_output:
+            report.write("Batches waiting in reorder buffer\t{}\n".format(stats["reorder_late"]))
+            report.write("Reorder buffer peak (batches)\t{}\n".format(stats["reorder_peak"]))
+            report.write("Reorder buffer capacity (batches)\t{}\n".format(self.ring.n_slot-1))
+
+        # Time spent in each stage, to find if a run is bound by the I/O, the IPC or the trimming
+        timing = self._timing_summary(stats)
+        report.write("\nTiming section\n")
+        report.write("Elapsed time (s)\t{}\n".format(round(timing["elapsed"], 3)))
+        report.write("Reader parse and decompression (s)\t{}\n".format(round(timing["reader_parse"], 3)))
+        report.write("Mean in queue depth (batches)\t{}\n".format(round(timing["inq_depth_mean"], 2)))
+        report.write("Peak in queue depth (batches)\t{}\n".format(timing["inq_depth_peak"]))
+        report.write("Workers wait for batches (s)\t{}\n".format(round(timing["worker_wait"], 3)))
+        report.write("Workers quality trimming (s)\t{}\n".format(round(timing["worker_quality"], 3)))
+        report.write("Workers adapter trimming (s)\t{}\n".format(round(timing["worker_adapter"], 3)))
+        report.write("Workers fastq formatting (s)\t{}\n".format(round(timing["worker_format"], 3)))
+        if self.sweep_sets:
+            report.write("Workers parameter sweep (s)\t{}\n".format(round(timing["worker_sweep"], 3)))
+        report.write("Mean out queue depth (batches)\t{}\n".format(round(timing["outq_depth_mean"], 2)))
+        report.write("Peak out queue depth (batches)\t{}\n".format(timing["outq_depth_peak"]))
+        report.write("Writer wait for batches (s)\t{}\n".format(round(timing["writer_wait"], 3)))
+        report.write("Writer write and compression (s)\t{}\n".format(round(timing["writer_write"], 3)))
+        report.write("Worker\tBatches\tWait (s)\tQuality (s)\tAdapter (s)\tFormat (s)\n")
+        for worker, w_dict in sorted(stats.get("workers", {}).items(), key=lambda item: int(item[0].split("_")[1])):
+            report.write("{}\t{}\t{}\n".format(worker, w_dict["batches"], "\t".join(
+                [str(round(w_dict.get(step, 0), 3)) for step in ("wait", "quality", "adapter", "format")])))
+
+        # Summaries of the quality trimmers of all the workers
+        if self.quality_trim:
+            q_dict = stats["quality"]
+            report.write("\nQuality trimming section\n")
+            report.write("Total read\t{}\n".format(q_dict["total"]))
+            report.write("Untrimmed\t{}\n".format(q_dict["untrimmed"]))
+            report.write("Trimmed\t{}\n".format(q_dict["trimmed"]))
+            report.write("Fail\t{}\n".format(q_dict["fail"]))
+            report.write("Base trimmed\t{}\n".format(q_dict["base_trimmed"]))
+            report.write("Mean quality\t{}\n".format(q_dict["qual_mean_sum"]/q_dict["total"]))
+
+        # Summaries of the adapter trimmers of all the workers
+        if self.adapter_trim:
+            a_dict = stats["adapter"]
+            report.write("\nAdapter trimming section\n")
+            report.write("Total read\t{}\n".format(a_dict["total"]))
+            report.write("Untrimmed\t{}\n".format(a_dict["untrimmed"]))
+            report.write("Trimmed\t{}\n".format(a_dict["trimmed"]))
+            report.write("Fail\t{}\n".format(a_dict["fail"]))
+            report.write("Base trimmed\t{}\n".format(a_dict["base_trimmed"]))
+            report.write("Reverse alignments skipped\t{}\n".format(a_dict["reverse_skipped"]))
+            report.write("Reads prefiltered\t{}\n".format(a_dict["prefiltered"]))
+            report.write("Alignments skipped\t{}\n".format(a_dict["align_skipped"]))
+            report.write("Stubs trimmed\t{}\n".format(a_dict["stub_trimmed"]))
+            if self.memo_size:
+                report.write("Memoization cache hits\t{}\n".format(a_dict["memo_hit"]))
+                report.write("Memoization cache misses\t{}\n".format(a_dict["memo_miss"]))
+
+            if self.min_overlap:
+                p_dict = stats["pair"]
+                report.write("\nInsert overlap section\n")
+                report.write("Pairs cut at insert size\t{}\n".format(p_dict["overlap_trimmed"]))
+                report.write("Pairs with a too short insert\t{}\n".format(p_dict["overlap_fail"]))
+                report.write("Base trimmed\t{}\n".format(p_dict["overlap_base_trimmed"]))
+
+            report.write("\nAdapter found section\n")
+            for adapter, count in zip(adapter_list, a_dict["adapter_found"]):
+                report.write("{}\t{}\n".format(adapter, count))
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 #   TOP LEVEL INSTRUCTIONS
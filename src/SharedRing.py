@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+"""
+@package    Sekator
+@brief      Ring of shared memory slots to pass read batches between processes without pickling
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~GLOBAL IMPORTS~~~~~~~#
+
+# Standard library imports
+from multiprocessing import Queue
+import mmap
+
+# Third party package import
+import numpy as np
+
+# Local Package import
+from ReadBatch import ReadBlock, ReadBatch
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class SlotSizeError(ValueError):
+    """ A single read pair does not fit in the shared memory slots """
+    pass
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class SharedRing(object):
+    """
+    Fixed size slots in an anonymous shared memory map inherited by the forked processes. The
+    reader packs a ReadBatch in a free slot, the workers write the fastq output of the read
+    pairs passing the filters in the same slot and the writer copies it to the output files
+    before releasing the slot. Only slot indexes go through the multiprocessing queues.
+    Layout of a slot containing n read pairs:
+    * header: 16 int64 = n, size of the names and sequences blobs of R1 and R2, sequence number,
+      sample id, size of the fastq output of R1 and R2
+    * int32 arrays: name lengths R1, lengths R1, name lengths R2, lengths R2
+    * string blobs: names R1, sequences R1, qualities R1, names R2, sequences R2, qualities R2
+    * fastq output of R1 followed by the fastq output of R2, in the rest of the slot
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~CLASS FIELDS~~~~~~~#
+
+    HEADER_SIZE = 128
+    PAIR_SIZE = 4*4 # Lengths of a read pair
+    FASTQ_OVERHEAD = 6 # Bytes added by the fastq format to the name, sequence and quality of a read
+
+    #~~~~~~~CLASS METHODS~~~~~~~#
+
+    @classmethod
+    def block_nbytes (self, block):
+        """ Size required to store the reads of a ReadBlock and their largest possible fastq output """
+        return (self.PAIR_SIZE/2 + self.FASTQ_OVERHEAD)*len(block) + 2*(len(block.names) + 2*len(block.seqs))
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__ (self, n_slot, slot_size):
+        """
+        Allocate the shared memory and fill the queue of free slots. Must be created before
+        starting the processes
+        @param n_slot Number of slots in the ring
+        @param slot_size Size of each slot in bytes
+        """
+        self.n_slot = n_slot
+        self.slot_size = slot_size
+        self.mm = mmap.mmap(-1, n_slot*slot_size)
+        self.free = Queue()
+        for i in range(n_slot):
+            self.free.put(i)
+
+    def __str__(self):
+        return "SHARED RING CLASS\n\tNumber of slots : {}\n\tSlot size : {}\n".format(self.n_slot, self.slot_size)
+
+    def __repr__(self):
+        return "<Instance of {} from {} >\n".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def acquire (self):
+        """ Wait for a free slot and return its index """
+        return self.free.get()
+
+    def release (self, slot):
+        """ Give back a slot to the ring """
+        self.free.put(slot)
+
+    def nbytes (self, batch):
+        """ Size required to store a ReadBatch and its largest possible fastq output in a slot """
+        return self.HEADER_SIZE + self.block_nbytes(batch.R1) + self.block_nbytes(batch.R2)
+
+    def split (self, batch):
+        """
+        Split a ReadBatch in parts small enough to fit in a slot
+        @return A list of ReadBatch
+        @exception SlotSizeError if a single read pair does not fit in a slot
+        """
+        if self.nbytes(batch) <= self.slot_size:
+            return [batch]
+        if len(batch) == 1:
+            raise SlotSizeError ("A read pair of {} bytes is larger than the shared memory slots ({} bytes)".format(
+                self.nbytes(batch), self.slot_size))
+
+        half = len(batch)/2
+        parts = []
+        for index in [np.arange(half), np.arange(half, len(batch))]:
+            parts.extend(self.split(ReadBatch(
+                batch.R1.trim(index, 0, batch.R1.lengths[index]),
+                batch.R2.trim(index, 0, batch.R2.lengths[index]))))
+        return parts
+
+    def write_batch (self, slot, batch, seq=0, sample=0):
+        """
+        Pack a ReadBatch in a slot
+        @param seq Sequence number of the batch in the input files
+        @param sample Index of the sample of the batch
+        """
+        n = len(batch)
+        header = np.zeros(16, dtype=np.int64)
+        header[:7] = [n, len(batch.R1.names), len(batch.R1.seqs), len(batch.R2.names), len(batch.R2.seqs), seq, sample]
+
+        pos = slot*self.slot_size
+        self.mm[pos:pos+self.HEADER_SIZE] = header.tostring()
+        pos += self.HEADER_SIZE
+        for lengths in [batch.R1.name_lengths, batch.R1.lengths, batch.R2.name_lengths, batch.R2.lengths]:
+            self.mm[pos:pos+4*n] = np.asarray(lengths, dtype=np.int32).tostring()
+            pos += 4*n
+        for blob in [batch.R1.names, batch.R1.seqs, batch.R1.quals, batch.R2.names, batch.R2.seqs, batch.R2.quals]:
+            self.mm[pos:pos+len(blob)] = blob
+            pos += len(blob)
+
+    def read_batch (self, slot):
+        """
+        Unpack the ReadBatch stored in a slot
+        """
+        n, names1, seqs1, names2, seqs2 = self._header(slot)[:5]
+        arrays = self._arrays(slot, n)
+
+        pos = slot*self.slot_size + self.HEADER_SIZE + self.PAIR_SIZE*n
+        blobs = []
+        for size in [names1, seqs1, seqs1, names2, seqs2, seqs2]:
+            blobs.append(self.mm[pos:pos+size])
+            pos += size
+
+        return ReadBatch(
+            ReadBlock(blobs[0], blobs[1], blobs[2], arrays[0], arrays[1]),
+            ReadBlock(blobs[3], blobs[4], blobs[5], arrays[2], arrays[3]))
+
+    def sequence (self, slot):
+        """ Sequence number of the batch stored in a slot """
+        return self._header(slot)[5]
+
+    def sample (self, slot):
+        """ Index of the sample of the batch stored in a slot """
+        return self._header(slot)[6]
+
+    def output_buffer (self, slot):
+        """
+        @return A writable array over the free space of a slot following the ReadBatch, where the
+        fastq output can be written directly
+        """
+        start = self._blobs_end(slot)
+        return np.frombuffer(self.mm, dtype=np.uint8, count=(slot+1)*self.slot_size-start, offset=start)
+
+    def set_output (self, slot, size1, size2):
+        """ Store the sizes of the fastq output of R1 and R2 written in the output buffer """
+        pos = slot*self.slot_size + 7*8
+        self.mm[pos:pos+16] = np.array([size1, size2], dtype=np.int64).tostring()
+
+    def write_output (self, slot, fastq1, fastq2):
+        """
+        Copy the fastq output of R1 and R2 in a slot
+        """
+        pos = self._blobs_end(slot)
+        if pos + len(fastq1) + len(fastq2) > (slot+1)*self.slot_size:
+            raise ValueError ("The fastq output is larger than the shared memory slots ({} bytes)".format(self.slot_size))
+        self.mm[pos:pos+len(fastq1)] = fastq1
+        self.mm[pos+len(fastq1):pos+len(fastq1)+len(fastq2)] = fastq2
+        self.set_output(slot, len(fastq1), len(fastq2))
+
+    def read_output (self, slot):
+        """
+        @return The fastq output of R1 and R2 stored in a slot
+        """
+        size1, size2 = self._header(slot)[7:9]
+        pos = self._blobs_end(slot)
+        return self.mm[pos:pos+size1], self.mm[pos+size1:pos+size1+size2]
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _header (self, slot):
+        return np.frombuffer(self.mm, dtype=np.int64, count=16, offset=slot*self.slot_size).tolist()
+
+    def _arrays (self, slot, n):
+        """ Views of the lengths arrays of a slot """
+        pos = slot*self.slot_size + self.HEADER_SIZE
+        arrays = []
+        for i in range(4):
+            arrays.append(np.frombuffer(self.mm, dtype=np.int32, count=n, offset=pos))
+            pos += 4*n
+        return arrays
+
+    def _blobs_end (self, slot):
+        """ Position of the end of the ReadBatch stored in a slot """
+        n, names1, seqs1, names2, seqs2 = self._header(slot)[:5]
+        return slot*self.slot_size + self.HEADER_SIZE + self.PAIR_SIZE*n + names1 + 2*seqs1 + names2 + 2*seqs2
@@ -4,7 +4,11 @@ from Cython.Build import cythonize
 from Cython.Distutils import build_ext
 
 extensions = [
-    Extension("AdapterTrimmer", ["AdapterTrimmer.pyx"]),
+    Extension("AdapterTrimmer", ["AdapterTrimmer.pyx"],
+        extra_compile_args=["-fopenmp"],
+        extra_link_args=["-fopenmp"]),
+    Extension("FastQualityTrimmer", ["FastQualityTrimmer.pyx"]),
+    Extension("PairTrimmer", ["PairTrimmer.pyx"]),
 ]
 
 setup(
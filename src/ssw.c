@@ -69,6 +69,16 @@
  */
 #define kroundup32(x) (--(x), (x)|=(x)>>1, (x)|=(x)>>2, (x)|=(x)>>4, (x)|=(x)>>8, (x)|=(x)>>16, ++(x))
 
+/* AVX2 kernels are compiled with a function level target attribute and selected at runtime */
+#if defined(__GNUC__) && (defined(__x86_64__) || defined(__i386__)) && !defined(SSW_NO_AVX2)
+#define SSW_AVX2 1
+#include <immintrin.h>
+#define AVX2_TARGET __attribute__((target("avx2")))
+
+/* Shift a 256 bits register left by n bytes across the 2 128 bits lanes */
+#define mm256_slli_si256(a, n) _mm256_alignr_epi8((a), _mm256_permute2x128_si256((a), (a), 0x08), 16-(n))
+#endif
+
 //#################################################################################################
 // STRUCTURES AND GLOBAL VARIABLES
 //#################################################################################################
@@ -90,6 +100,31 @@ struct _align{
 };
 typedef struct _align s_align;
 
+/* structure of a query profile precomputed once and reused for every alignment */
+struct _profile{
+    const int8_t* query;
+    int32_t queryLen;
+    const int8_t* mat;
+    uint8_t bias;
+    void* profile_byte;
+    void* profile_word;
+    void** profile_rev_byte;  // reverse profiles indexed by query end, built on first use
+    void** profile_rev_word;  // reverse profiles indexed by query end, built on first use
+};
+typedef struct _profile s_profile;
+
+/* SIMD kernels and profile builders used by ssw_align_profile. SSE2 by default, see ssw_simd_init */
+struct _simd {
+    int32_t avx2;
+    void* (*qp_byte) (const int8_t*, const int8_t*, const int32_t, const uint8_t);
+    void* (*qp_word) (const int8_t*, const int8_t*, const int32_t);
+    s_alignment_end (*sw_byte) (const int8_t*, int8_t, int32_t, int32_t, const uint8_t, const uint8_t, const void*, uint8_t, uint8_t);
+    s_alignment_end (*sw_word) (const int8_t*, int8_t, int32_t, int32_t, const uint8_t, const uint8_t, const void*, uint16_t);
+};
+typedef struct _simd s_simd;
+
+static s_simd SIMD = {0, qP_byte, qP_word, sw_sse2_byte, sw_sse2_word};
+
 /* This table is used to transform nucleotide letters into numbers.
  * A=a=0, C=c=1, G=g=2, T=t=3, all other char = 4*/
 static const int8_t NT_TABLE[128] = {
@@ -155,56 +190,199 @@ int8_t* score_matrix (
 
 int8_t* DNA_seq_to_int(char * DNA_seq, const int32_t seq_len)
 {
-    int32_t i;
     int8_t* mat;
     mat = malloc_int8_t(seq_len);
 
-    for (i = 0; i < seq_len; ++i) mat[i] = NT_TABLE[(int)DNA_seq[i]];
+    DNA_seq_fill_int(DNA_seq, seq_len, mat);
 
     return mat;
 }
 
-s_align ssw_align (const int8_t* query, // Query sequence encoded by integers
-                    int32_t queryLen, // Length of the query sequence
+void DNA_seq_fill_int(const char* DNA_seq, const int32_t seq_len, int8_t* mat)
+{
+    int32_t i;
+
+    for (i = 0; i < seq_len; ++i) mat[i] = NT_TABLE[(int)DNA_seq[i] & 0x7f];
+}
+
+int32_t ssw_simd_init (const int32_t allow_avx2)
+{
+    // Default SSE2 kernels
+    SIMD.avx2 = 0;
+    SIMD.qp_byte = qP_byte;
+    SIMD.qp_word = qP_word;
+    SIMD.sw_byte = sw_sse2_byte;
+    SIMD.sw_word = sw_sse2_word;
+
+#ifdef SSW_AVX2
+    __builtin_cpu_init();
+    if (allow_avx2 && __builtin_cpu_supports("avx2")) {
+        SIMD.avx2 = 1;
+        SIMD.qp_byte = qP_byte_avx2;
+        SIMD.qp_word = qP_word_avx2;
+        SIMD.sw_byte = sw_avx2_byte;
+        SIMD.sw_word = sw_avx2_word;
+    }
+#endif
+
+    return SIMD.avx2;
+}
+
+s_profile* ssw_init (const int8_t* query, // Query sequence encoded by integers
+                    const int32_t queryLen, // Length of the query sequence
+                    const int8_t* mat) // Score matrix produced by score_matrix()
+{
+    s_profile* p;
+    int32_t i, bias = 0;
+
+    // The byte kernel works on unsigned values, the matrix is shifted by the absolute value of the lowest score
+    for (i = 0; i < 25; ++i) if (mat[i] < bias) bias = mat[i];
+
+    p = (s_profile*)malloc(sizeof(s_profile));
+    p->query = query;
+    p->queryLen = queryLen;
+    p->mat = mat;
+    p->bias = (uint8_t)abs(bias);
+    p->profile_byte = SIMD.qp_byte(query, mat, queryLen, p->bias);
+    p->profile_word = SIMD.qp_word(query, mat, queryLen);
+    p->profile_rev_byte = (void**)calloc(queryLen, sizeof(void*));
+    p->profile_rev_word = (void**)calloc(queryLen, sizeof(void*));
+
+    return p;
+}
+
+void init_destroy (s_profile* p)
+{
+    int32_t i;
+
+    for (i = 0; i < p->queryLen; ++i) {
+        free(p->profile_rev_byte[i]);
+        free(p->profile_rev_word[i]);
+    }
+    free(p->profile_rev_byte);
+    free(p->profile_rev_word);
+    free(p->profile_byte);
+    free(p->profile_word);
+    free(p);
+}
+
+static void* cache_profile (void** slot, void* profile)
+{
+    // Store a newly built reverse profile unless an other thread stored one first
+    if (__sync_bool_compare_and_swap(slot, NULL, profile)) return profile;
+    free(profile);
+    return *slot;
+}
+
+s_align ssw_align_profile (s_profile* prof, // Query profile produced by ssw_init()
                     const int8_t* ref, // Reference sequence encoded by integers
                     int32_t refLen, // Length of the reference sequence
-                    const int8_t* mat, // Score matrix produced by score_matrix()
                     const int8_t gapO, // Weight of gap open (POSITIVE)
-                    const int8_t gapE) // Weight of gap extend (POSITIVE)
+                    const int8_t gapE, // Weight of gap extend (POSITIVE)
+                    const uint16_t filter) // Minimal score required to search the beginning position
 {
     s_alignment_end best;
     s_alignment_end best_reverse;
-    __m128i* vProfile_for;
-    __m128i* vProfile_rev;
     int8_t* query_reverse;
+    int32_t word = 0;
     s_align res;
 
-    // Find the alignment scores and ending positions
-    vProfile_for = qP_word(query, mat, queryLen);
-    best = sw_sse2_word(ref, 0, refLen, queryLen, gapO, gapE, vProfile_for, -1);
-    free(vProfile_for);
+    // Find the alignment scores and ending positions with the 8 bits kernel and fall back to the 16
+    // bits kernel if the score saturates
+    best = SIMD.sw_byte(ref, 0, refLen, prof->queryLen, gapO, gapE, prof->profile_byte, -1, prof->bias);
+    if (UNLIKELY(best.score == 255)) {
+        best = SIMD.sw_word(ref, 0, refLen, prof->queryLen, gapO, gapE, prof->profile_word, -1);
+        word = 1;
+    }
     res.score = best.score;
     res.ref_end = best.ref;
     res.query_end = best.query;
 
-    // Find the beginning position of the best alignment.
-    query_reverse = seq_reverse(query, res.query_end);
-    vProfile_rev = qP_word(query_reverse, mat, res.query_end+1);
-    best_reverse = sw_sse2_word(ref, 1, res.ref_end+1, res.query_end+1, gapO, gapE, vProfile_rev, res.score);
-    free(vProfile_rev);
-    free(query_reverse);
+    // Score only result if the alignment cannot be retained by the caller
+    if (res.score < filter) {
+        res.ref_begin = -1;
+        res.query_begin = -1;
+        return res;
+    }
+
+    // Find the beginning position of the best alignment with the same kernel. The reverse profiles
+    // only depend on the query end position, so they are built once for each end position and kept
+    // for the next reads. Other fields of the profile are read only, several threads can use it
+    if (word == 0) {
+        if (UNLIKELY(prof->profile_rev_byte[res.query_end] == NULL)) {
+            query_reverse = seq_reverse(prof->query, res.query_end);
+            cache_profile(&prof->profile_rev_byte[res.query_end],
+                SIMD.qp_byte(query_reverse, prof->mat, res.query_end+1, prof->bias));
+            free(query_reverse);
+        }
+        best_reverse = SIMD.sw_byte(ref, 1, res.ref_end+1, res.query_end+1, gapO, gapE,
+            prof->profile_rev_byte[res.query_end], res.score, prof->bias);
+    }
+    else {
+        if (UNLIKELY(prof->profile_rev_word[res.query_end] == NULL)) {
+            query_reverse = seq_reverse(prof->query, res.query_end);
+            cache_profile(&prof->profile_rev_word[res.query_end],
+                SIMD.qp_word(query_reverse, prof->mat, res.query_end+1));
+            free(query_reverse);
+        }
+        best_reverse = SIMD.sw_word(ref, 1, res.ref_end+1, res.query_end+1, gapO, gapE,
+            prof->profile_rev_word[res.query_end], res.score);
+    }
     res.ref_begin = best_reverse.ref;
     res.query_begin = res.query_end - best_reverse.query;
 
     return res;
 }
 
-static __m128i* qP_word (const int8_t* query_num,
+s_align ssw_align (const int8_t* query, // Query sequence encoded by integers
+                    int32_t queryLen, // Length of the query sequence
+                    const int8_t* ref, // Reference sequence encoded by integers
+                    int32_t refLen, // Length of the reference sequence
+                    const int8_t* mat, // Score matrix produced by score_matrix()
+                    const int8_t gapO, // Weight of gap open (POSITIVE)
+                    const int8_t gapE) // Weight of gap extend (POSITIVE)
+{
+    s_profile* prof;
+    s_align res;
+
+    // One shot alignment with a temporary query profile
+    prof = ssw_init(query, queryLen, mat);
+    res = ssw_align_profile(prof, ref, refLen, gapO, gapE, 0);
+    init_destroy(prof);
+
+    return res;
+}
+
+static void* qP_byte (const int8_t* query_num,
+                  const int8_t* mat,
+                  const int32_t queryLen,
+                  const uint8_t bias)
+{
+    int32_t segLen = (queryLen + 15) / 16;
+    __m128i* vProfile = (__m128i*)malloc_simd(5 * segLen * sizeof(__m128i));
+    int8_t* t = (int8_t*)vProfile;
+    int32_t nt, i, j;
+    int32_t segNum;
+
+    /* Generate query profile rearrange query sequence & calculate the weight of match/mismatch */
+    for (nt = 0; LIKELY(nt < 5); nt ++) {
+        for (i = 0; i < segLen; i ++) {
+            j = i;
+            for (segNum = 0; LIKELY(segNum < 16) ; segNum ++) {
+                *t++ = j>= queryLen ? bias : mat[nt * 5 + query_num[j]] + bias;
+                j += segLen;
+            }
+        }
+    }
+    return vProfile;
+}
+
+static void* qP_word (const int8_t* query_num,
                   const int8_t* mat,
                   const int32_t queryLen)
 {
     int32_t segLen = (queryLen + 7) / 8;
-    __m128i* vProfile = (__m128i*)malloc(5 * segLen * sizeof(__m128i));
+    __m128i* vProfile = (__m128i*)malloc_simd(5 * segLen * sizeof(__m128i));
     int16_t* t = (int16_t*)vProfile;
     int32_t nt, i, j;
     int32_t segNum;
@@ -222,15 +400,179 @@ static __m128i* qP_word (const int8_t* query_num,
     return vProfile;
 }
 
+static s_alignment_end sw_sse2_byte (const int8_t* ref,
+                             int8_t ref_dir,    // 0: forward ref; 1: reverse ref
+                             int32_t refLen,
+                             int32_t queryLen,
+                             const uint8_t gapO, /* positive but will be used as - */
+                             const uint8_t gapE, /* positive but will be used as - */
+                             const void* profile,
+                             uint8_t terminate,
+                             uint8_t bias)
+{
+    const __m128i* vProfile = (const __m128i*)profile;
+
+#define max16(m, vm) (vm) = _mm_max_epu8((vm), _mm_srli_si128((vm), 8)); \
+                     (vm) = _mm_max_epu8((vm), _mm_srli_si128((vm), 4)); \
+                     (vm) = _mm_max_epu8((vm), _mm_srli_si128((vm), 2)); \
+                     (vm) = _mm_max_epu8((vm), _mm_srli_si128((vm), 1)); \
+                     (m) = _mm_extract_epi16((vm), 0)
+
+    uint8_t max = 0;                             /* the max alignment score */
+    int32_t end_query = queryLen - 1;
+    int32_t end_ref = 0; /* 1_based best alignment ending point; Initialized as isn't aligned - 0. */
+    int32_t segLen = (queryLen + 15) / 16; /* number of segment */
+
+    /* largest score of the current reference position */
+    uint8_t maxColumn;
+
+    /* Define 16 byte 0 vector. */
+    __m128i vZero = _mm_set1_epi32(0);
+
+    __m128i* pvHStore = (__m128i*) calloc(segLen, sizeof(__m128i));
+    __m128i* pvHLoad = (__m128i*) calloc(segLen, sizeof(__m128i));
+    __m128i* pvE = (__m128i*) calloc(segLen, sizeof(__m128i));
+    __m128i* pvHmax = (__m128i*) calloc(segLen, sizeof(__m128i));
+
+    int32_t i, j, k;
+    /* 16 byte insertion begin vector */
+    __m128i vGapO = _mm_set1_epi8(gapO);
+
+    /* 16 byte insertion extension vector */
+    __m128i vGapE = _mm_set1_epi8(gapE);
+    __m128i vOne = _mm_set1_epi8(1);
+
+    /* 16 byte bias vector */
+    __m128i vBias = _mm_set1_epi8(bias);
+
+    __m128i vMaxScore = vZero; /* Trace the highest score of the whole SW matrix. */
+    __m128i vMaxMark = vZero; /* Trace the highest score till the previous column. */
+    __m128i vTemp;
+    int32_t begin = 0, end = refLen, step = 1;
+
+    /* outer loop to process the reference sequence */
+    if (ref_dir == 1) {
+        begin = refLen - 1;
+        end = -1;
+        step = -1;
+    }
+    for (i = begin; LIKELY(i != end); i += step) {
+        int32_t cmp;
+        __m128i e, vF = vZero; /* Initialize F value to 0.
+                               Any errors to vH values will be corrected in the Lazy_F loop.
+                             */
+        __m128i vH = pvHStore[segLen - 1];
+        vH = _mm_slli_si128 (vH, 1); /* Shift the 128-bit value in vH left by 1 byte. */
+
+        /* Swap the 2 H buffers. */
+        __m128i* pv = pvHLoad;
+
+        __m128i vMaxColumn = vZero; /* vMaxColumn is used to record the max values of column i. */
+
+        const __m128i* vP = vProfile + ref[i] * segLen; /* Right part of the vProfile */
+        pvHLoad = pvHStore;
+        pvHStore = pv;
+
+        /* inner loop to process the query sequence */
+        for (j = 0; LIKELY(j < segLen); j ++) {
+            vH = _mm_adds_epu8(vH, _mm_load_si128(vP + j));
+            vH = _mm_subs_epu8(vH, vBias); /* vH will be always > 0 */
+
+            /* Get max from vH, vE and vF. */
+            e = _mm_load_si128(pvE + j);
+            vH = _mm_max_epu8(vH, e);
+            vH = _mm_max_epu8(vH, vF);
+            vMaxColumn = _mm_max_epu8(vMaxColumn, vH);
+
+            /* Save vH values. */
+            _mm_store_si128(pvHStore + j, vH);
+
+            /* Update vE value. */
+            vH = _mm_subs_epu8(vH, vGapO); /* saturation arithmetic, result >= 0 */
+            e = _mm_subs_epu8(e, vGapE);
+            e = _mm_max_epu8(e, vH);
+            _mm_store_si128(pvE + j, e);
+
+            /* Update vF value. */
+            vF = _mm_subs_epu8(vF, vGapE);
+            vF = _mm_max_epu8(vF, vH);
+
+            /* Load the next vH. */
+            vH = _mm_load_si128(pvHLoad + j);
+        }
+
+        /* Lazy_F loop: same as in sw_sse2_word. Values are unsigned, vF >= vH when vF - (vH - 1) is not 0 */
+        for (k = 0; LIKELY(k < 16); ++k) {
+            vF = _mm_slli_si128 (vF, 1);
+            for (j = 0; LIKELY(j < segLen); ++j) {
+                vH = _mm_load_si128(pvHStore + j);
+                vH = _mm_max_epu8(vH, vF);
+                _mm_store_si128(pvHStore + j, vH);
+                vH = _mm_subs_epu8(vH, vGapO);
+                vF = _mm_subs_epu8(vF, vGapE);
+                if (UNLIKELY(_mm_movemask_epi8(_mm_cmpeq_epi8(_mm_subs_epu8(vF, _mm_subs_epu8(vH, vOne)), vZero)) == 0xffff)) goto end;
+            }
+        }
+
+end:
+        vMaxScore = _mm_max_epu8(vMaxScore, vMaxColumn);
+        vTemp = _mm_cmpeq_epi8(vMaxMark, vMaxScore);
+        cmp = _mm_movemask_epi8(vTemp);
+        if (cmp != 0xffff) {
+            uint8_t temp;
+            vMaxMark = vMaxScore;
+            max16(temp, vMaxScore);
+            vMaxScore = vMaxMark;
+
+            if (LIKELY(temp > max)) {
+                max = temp;
+                if (max + bias >= 255) break; /* overflow, the caller has to use the word kernel */
+                end_ref = i;
+                for (j = 0; LIKELY(j < segLen); ++j) pvHmax[j] = pvHStore[j];
+            }
+        }
+
+        /* Record the max score of current column. */
+        max16(maxColumn, vMaxColumn);
+        if (maxColumn == terminate) break;
+    }
+
+    /* Trace the alignment ending position on query. */
+    uint8_t *t = (uint8_t*)pvHmax;
+    int32_t column_len = segLen * 16;
+    for (i = 0; LIKELY(i < column_len); ++i, ++t) {
+        int32_t temp;
+        if (*t == max) {
+            temp = i / 16 + i % 16 * segLen;
+            if (temp < end_query) end_query = temp;
+        }
+    }
+
+    free(pvHmax);
+    free(pvE);
+    free(pvHLoad);
+    free(pvHStore);
+
+    /* Find the best alignment. A score of 255 means that the 8 bits range was exceeded */
+    s_alignment_end best;
+    best.score = max + bias >= 255 ? 255 : max;
+    best.ref = end_ref;
+    best.query = end_query;
+
+
+    return best;
+}
+
 static s_alignment_end sw_sse2_word (const int8_t* ref,
                              int8_t ref_dir,    // 0: forward ref; 1: reverse ref
                              int32_t refLen,
                              int32_t queryLen,
                              const uint8_t gapO, /* positive but will be used as - */
                              const uint8_t gapE, /* positive but will be used as - */
-                             const __m128i* vProfile,
+                             const void* profile,
                              uint16_t terminate)
 {
+    const __m128i* vProfile = (const __m128i*)profile;
 
 #define max8(m, vm) (vm) = _mm_max_epi16((vm), _mm_srli_si128((vm), 8)); \
                     (vm) = _mm_max_epi16((vm), _mm_srli_si128((vm), 4)); \
@@ -242,11 +584,8 @@ static s_alignment_end sw_sse2_word (const int8_t* ref,
     int32_t end_ref = 0; /* 1_based best alignment ending point; Initialized as isn't aligned - 0. */
     int32_t segLen = (queryLen + 7) / 8; /* number of segment */
 
-    /* array to record the largest score of each reference position */
-    uint16_t* maxColumn = (uint16_t*) calloc(refLen, 2);
-
-    /* array to record the alignment query ending position of the largest score of each reference position */
-    int32_t* end_query_column = (int32_t*) calloc(refLen, sizeof(int32_t));
+    /* largest score of the current reference position */
+    uint16_t maxColumn;
 
     /* Define 16 byte 0 vector. */
     __m128i vZero = _mm_set1_epi32(0);
@@ -262,6 +601,7 @@ static s_alignment_end sw_sse2_word (const int8_t* ref,
 
     /* 16 byte insertion extension vector */
     __m128i vGapE = _mm_set1_epi16(gapE);
+    __m128i vOne = _mm_set1_epi16(1);
 
     __m128i vMaxScore = vZero; /* Trace the highest score of the whole SW matrix. */
     __m128i vMaxMark = vZero; /* Trace the highest score till the previous column. */
@@ -318,7 +658,10 @@ static s_alignment_end sw_sse2_word (const int8_t* ref,
             vH = _mm_load_si128(pvHLoad + j);
         }
 
-        /* Lazy_F loop: has been revised to disallow adjacent insertion and then deletion, so don't update E(i, j), learn from SWPS3 */
+        /* Lazy_F loop: has been revised to disallow adjacent insertion and then deletion, so don't update E(i, j), learn from SWPS3.
+           The loop only stops when vF < vH (or vF is 0) in all the lanes: when gapO == gapE, a vH just raised by vF
+           gives vF == vH after the penalties, and the vF of the next segment computed in the inner loop from the
+           previous vH would miss the gap extension */
         for (k = 0; LIKELY(k < 8); ++k) {
             vF = _mm_slli_si128 (vF, 2);
             for (j = 0; LIKELY(j < segLen); ++j) {
@@ -327,7 +670,7 @@ static s_alignment_end sw_sse2_word (const int8_t* ref,
                 _mm_store_si128(pvHStore + j, vH);
                 vH = _mm_subs_epu16(vH, vGapO);
                 vF = _mm_subs_epu16(vF, vGapE);
-                if (UNLIKELY(! _mm_movemask_epi8(_mm_cmpgt_epi16(vF, vH)))) goto end;
+                if (UNLIKELY(! _mm_movemask_epi8(_mm_cmpgt_epi16(vF, _mm_subs_epu16(vH, vOne))))) goto end;
             }
         }
 
@@ -349,8 +692,8 @@ end:
         }
 
         /* Record the max score of current column. */
-        max8(maxColumn[i], vMaxColumn);
-        if (maxColumn[i] == terminate) break;
+        max8(maxColumn, vMaxColumn);
+        if (maxColumn == terminate) break;
     }
 
     /* Trace the alignment ending position on query. */
@@ -375,12 +718,347 @@ end:
     best.ref = end_ref;
     best.query = end_query;
 
-    free(maxColumn);
-    free(end_query_column);
 
     return best;
 }
 
+#ifdef SSW_AVX2
+
+AVX2_TARGET static void* qP_byte_avx2 (const int8_t* query_num,
+                  const int8_t* mat,
+                  const int32_t queryLen,
+                  const uint8_t bias)
+{
+    int32_t segLen = (queryLen + 31) / 32;
+    __m256i* vProfile = (__m256i*)malloc_simd(5 * segLen * sizeof(__m256i));
+    int8_t* t = (int8_t*)vProfile;
+    int32_t nt, i, j;
+    int32_t segNum;
+
+    /* Same as qP_byte with 32 lanes */
+    for (nt = 0; LIKELY(nt < 5); nt ++) {
+        for (i = 0; i < segLen; i ++) {
+            j = i;
+            for (segNum = 0; LIKELY(segNum < 32) ; segNum ++) {
+                *t++ = j>= queryLen ? bias : mat[nt * 5 + query_num[j]] + bias;
+                j += segLen;
+            }
+        }
+    }
+    return vProfile;
+}
+
+AVX2_TARGET static void* qP_word_avx2 (const int8_t* query_num,
+                  const int8_t* mat,
+                  const int32_t queryLen)
+{
+    int32_t segLen = (queryLen + 15) / 16;
+    __m256i* vProfile = (__m256i*)malloc_simd(5 * segLen * sizeof(__m256i));
+    int16_t* t = (int16_t*)vProfile;
+    int32_t nt, i, j;
+    int32_t segNum;
+
+    /* Same as qP_word with 16 lanes */
+    for (nt = 0; LIKELY(nt < 5); nt ++) {
+        for (i = 0; i < segLen; i ++) {
+            j = i;
+            for (segNum = 0; LIKELY(segNum < 16) ; segNum ++) {
+                *t++ = j>= queryLen ? 0 : mat[nt * 5 + query_num[j]];
+                j += segLen;
+            }
+        }
+    }
+    return vProfile;
+}
+
+AVX2_TARGET static s_alignment_end sw_avx2_byte (const int8_t* ref,
+                             int8_t ref_dir,    // 0: forward ref; 1: reverse ref
+                             int32_t refLen,
+                             int32_t queryLen,
+                             const uint8_t gapO, /* positive but will be used as - */
+                             const uint8_t gapE, /* positive but will be used as - */
+                             const void* profile,
+                             uint8_t terminate,
+                             uint8_t bias)
+{
+    const __m256i* vProfile = (const __m256i*)profile;
+
+#define max32(m, vm) { __m128i vm128 = _mm_max_epu8(_mm256_castsi256_si128(vm), _mm256_extracti128_si256((vm), 1)); \
+                       max16((m), vm128); }
+
+    uint8_t max = 0;                             /* the max alignment score */
+    int32_t end_query = queryLen - 1;
+    int32_t end_ref = 0;
+    int32_t segLen = (queryLen + 31) / 32; /* number of segment */
+
+    /* largest score of the current reference position */
+    uint8_t maxColumn;
+
+    __m256i vZero = _mm256_setzero_si256();
+
+    __m256i* pvHStore = (__m256i*) calloc_simd(segLen * sizeof(__m256i));
+    __m256i* pvHLoad = (__m256i*) calloc_simd(segLen * sizeof(__m256i));
+    __m256i* pvE = (__m256i*) calloc_simd(segLen * sizeof(__m256i));
+    __m256i* pvHmax = (__m256i*) calloc_simd(segLen * sizeof(__m256i));
+
+    int32_t i, j, k;
+    __m256i vGapO = _mm256_set1_epi8(gapO);
+    __m256i vGapE = _mm256_set1_epi8(gapE);
+    __m256i vOne = _mm256_set1_epi8(1);
+    __m256i vBias = _mm256_set1_epi8(bias);
+
+    __m256i vMaxScore = vZero; /* Trace the highest score of the whole SW matrix. */
+    __m256i vMaxMark = vZero; /* Trace the highest score till the previous column. */
+    __m256i vTemp;
+    int32_t begin = 0, end = refLen, step = 1;
+
+    /* outer loop to process the reference sequence */
+    if (ref_dir == 1) {
+        begin = refLen - 1;
+        end = -1;
+        step = -1;
+    }
+    for (i = begin; LIKELY(i != end); i += step) {
+        uint32_t cmp;
+        __m256i e, vF = vZero;
+        __m256i vH = pvHStore[segLen - 1];
+        vH = mm256_slli_si256 (vH, 1);
+
+        /* Swap the 2 H buffers. */
+        __m256i* pv = pvHLoad;
+
+        __m256i vMaxColumn = vZero;
+
+        const __m256i* vP = vProfile + ref[i] * segLen;
+        pvHLoad = pvHStore;
+        pvHStore = pv;
+
+        /* inner loop to process the query sequence */
+        for (j = 0; LIKELY(j < segLen); j ++) {
+            vH = _mm256_adds_epu8(vH, _mm256_load_si256(vP + j));
+            vH = _mm256_subs_epu8(vH, vBias);
+
+            e = _mm256_load_si256(pvE + j);
+            vH = _mm256_max_epu8(vH, e);
+            vH = _mm256_max_epu8(vH, vF);
+            vMaxColumn = _mm256_max_epu8(vMaxColumn, vH);
+
+            _mm256_store_si256(pvHStore + j, vH);
+
+            vH = _mm256_subs_epu8(vH, vGapO);
+            e = _mm256_subs_epu8(e, vGapE);
+            e = _mm256_max_epu8(e, vH);
+            _mm256_store_si256(pvE + j, e);
+
+            vF = _mm256_subs_epu8(vF, vGapE);
+            vF = _mm256_max_epu8(vF, vH);
+
+            vH = _mm256_load_si256(pvHLoad + j);
+        }
+
+        /* Lazy_F loop: same as in sw_sse2_word */
+        for (k = 0; LIKELY(k < 32); ++k) {
+            vF = mm256_slli_si256 (vF, 1);
+            for (j = 0; LIKELY(j < segLen); ++j) {
+                vH = _mm256_load_si256(pvHStore + j);
+                vH = _mm256_max_epu8(vH, vF);
+                _mm256_store_si256(pvHStore + j, vH);
+                vH = _mm256_subs_epu8(vH, vGapO);
+                vF = _mm256_subs_epu8(vF, vGapE);
+                if (UNLIKELY((uint32_t)_mm256_movemask_epi8(_mm256_cmpeq_epi8(_mm256_subs_epu8(vF, _mm256_subs_epu8(vH, vOne)), vZero)) == 0xffffffff)) goto end;
+            }
+        }
+
+end:
+        vMaxScore = _mm256_max_epu8(vMaxScore, vMaxColumn);
+        vTemp = _mm256_cmpeq_epi8(vMaxMark, vMaxScore);
+        cmp = (uint32_t)_mm256_movemask_epi8(vTemp);
+        if (cmp != 0xffffffff) {
+            uint8_t temp;
+            vMaxMark = vMaxScore;
+            max32(temp, vMaxScore);
+
+            if (LIKELY(temp > max)) {
+                max = temp;
+                if (max + bias >= 255) break; /* overflow, the caller has to use the word kernel */
+                end_ref = i;
+                for (j = 0; LIKELY(j < segLen); ++j) pvHmax[j] = pvHStore[j];
+            }
+        }
+
+        /* Record the max score of current column. */
+        max32(maxColumn, vMaxColumn);
+        if (maxColumn == terminate) break;
+    }
+
+    /* Trace the alignment ending position on query. */
+    uint8_t *t = (uint8_t*)pvHmax;
+    int32_t column_len = segLen * 32;
+    for (i = 0; LIKELY(i < column_len); ++i, ++t) {
+        int32_t temp;
+        if (*t == max) {
+            temp = i / 32 + i % 32 * segLen;
+            if (temp < end_query) end_query = temp;
+        }
+    }
+
+    free(pvHmax);
+    free(pvE);
+    free(pvHLoad);
+    free(pvHStore);
+
+    s_alignment_end best;
+    best.score = max + bias >= 255 ? 255 : max;
+    best.ref = end_ref;
+    best.query = end_query;
+
+
+    return best;
+}
+
+AVX2_TARGET static s_alignment_end sw_avx2_word (const int8_t* ref,
+                             int8_t ref_dir,    // 0: forward ref; 1: reverse ref
+                             int32_t refLen,
+                             int32_t queryLen,
+                             const uint8_t gapO, /* positive but will be used as - */
+                             const uint8_t gapE, /* positive but will be used as - */
+                             const void* profile,
+                             uint16_t terminate)
+{
+    const __m256i* vProfile = (const __m256i*)profile;
+
+#define max16w(m, vm) { __m128i vm128 = _mm_max_epi16(_mm256_castsi256_si128(vm), _mm256_extracti128_si256((vm), 1)); \
+                        max8((m), vm128); }
+
+    uint16_t max = 0;                            /* the max alignment score */
+    int32_t end_query = queryLen - 1;
+    int32_t end_ref = 0;
+    int32_t segLen = (queryLen + 15) / 16; /* number of segment */
+
+    /* largest score of the current reference position */
+    uint16_t maxColumn;
+
+    __m256i vZero = _mm256_setzero_si256();
+
+    __m256i* pvHStore = (__m256i*) calloc_simd(segLen * sizeof(__m256i));
+    __m256i* pvHLoad = (__m256i*) calloc_simd(segLen * sizeof(__m256i));
+    __m256i* pvE = (__m256i*) calloc_simd(segLen * sizeof(__m256i));
+    __m256i* pvHmax = (__m256i*) calloc_simd(segLen * sizeof(__m256i));
+
+    int32_t i, j, k;
+    __m256i vGapO = _mm256_set1_epi16(gapO);
+    __m256i vGapE = _mm256_set1_epi16(gapE);
+    __m256i vOne = _mm256_set1_epi16(1);
+
+    __m256i vMaxScore = vZero; /* Trace the highest score of the whole SW matrix. */
+    __m256i vMaxMark = vZero; /* Trace the highest score till the previous column. */
+    __m256i vTemp;
+    int32_t begin = 0, end = refLen, step = 1;
+
+    /* outer loop to process the reference sequence */
+    if (ref_dir == 1) {
+        begin = refLen - 1;
+        end = -1;
+        step = -1;
+    }
+    for (i = begin; LIKELY(i != end); i += step) {
+        uint32_t cmp;
+        __m256i e, vF = vZero;
+        __m256i vH = pvHStore[segLen - 1];
+        vH = mm256_slli_si256 (vH, 2);
+
+        /* Swap the 2 H buffers. */
+        __m256i* pv = pvHLoad;
+
+        __m256i vMaxColumn = vZero;
+
+        const __m256i* vP = vProfile + ref[i] * segLen;
+        pvHLoad = pvHStore;
+        pvHStore = pv;
+
+        /* inner loop to process the query sequence */
+        for (j = 0; LIKELY(j < segLen); j ++) {
+            vH = _mm256_adds_epi16(vH, _mm256_load_si256(vP + j));
+
+            e = _mm256_load_si256(pvE + j);
+            vH = _mm256_max_epi16(vH, e);
+            vH = _mm256_max_epi16(vH, vF);
+            vMaxColumn = _mm256_max_epi16(vMaxColumn, vH);
+
+            _mm256_store_si256(pvHStore + j, vH);
+
+            vH = _mm256_subs_epu16(vH, vGapO);
+            e = _mm256_subs_epu16(e, vGapE);
+            e = _mm256_max_epi16(e, vH);
+            _mm256_store_si256(pvE + j, e);
+
+            vF = _mm256_subs_epu16(vF, vGapE);
+            vF = _mm256_max_epi16(vF, vH);
+
+            vH = _mm256_load_si256(pvHLoad + j);
+        }
+
+        /* Lazy_F loop: same as in sw_sse2_word */
+        for (k = 0; LIKELY(k < 16); ++k) {
+            vF = mm256_slli_si256 (vF, 2);
+            for (j = 0; LIKELY(j < segLen); ++j) {
+                vH = _mm256_load_si256(pvHStore + j);
+                vH = _mm256_max_epi16(vH, vF);
+                _mm256_store_si256(pvHStore + j, vH);
+                vH = _mm256_subs_epu16(vH, vGapO);
+                vF = _mm256_subs_epu16(vF, vGapE);
+                if (UNLIKELY(! _mm256_movemask_epi8(_mm256_cmpgt_epi16(vF, _mm256_subs_epu16(vH, vOne))))) goto end;
+            }
+        }
+
+end:
+        vMaxScore = _mm256_max_epi16(vMaxScore, vMaxColumn);
+        vTemp = _mm256_cmpeq_epi16(vMaxMark, vMaxScore);
+        cmp = (uint32_t)_mm256_movemask_epi8(vTemp);
+        if (cmp != 0xffffffff) {
+            uint16_t temp;
+            vMaxMark = vMaxScore;
+            max16w(temp, vMaxScore);
+
+            if (LIKELY(temp > max)) {
+                max = temp;
+                end_ref = i;
+                for (j = 0; LIKELY(j < segLen); ++j) pvHmax[j] = pvHStore[j];
+            }
+        }
+
+        /* Record the max score of current column. */
+        max16w(maxColumn, vMaxColumn);
+        if (maxColumn == terminate) break;
+    }
+
+    /* Trace the alignment ending position on query. */
+    uint16_t *t = (uint16_t*)pvHmax;
+    int32_t column_len = segLen * 16;
+    for (i = 0; LIKELY(i < column_len); ++i, ++t) {
+        int32_t temp;
+        if (*t == max) {
+            temp = i / 16 + i % 16 * segLen;
+            if (temp < end_query) end_query = temp;
+        }
+    }
+
+    free(pvHmax);
+    free(pvE);
+    free(pvHLoad);
+    free(pvHStore);
+
+    s_alignment_end best;
+    best.score = max;
+    best.ref = end_ref;
+    best.query = end_query;
+
+
+    return best;
+}
+
+#endif // SSW_AVX2
+
 static int8_t* seq_reverse(const int8_t* seq, int32_t end)  /* end is 0-based alignment ending position */
 {
     int8_t* reverse = (int8_t*)calloc(end + 1, sizeof(int8_t));
@@ -409,6 +1087,30 @@ int8_t* malloc_int8_t (int dim)
     return mat;
 }
 
+void* malloc_simd (size_t size)
+{
+    void* mat;
+
+    // 32 bytes alignment required by the AVX2 aligned loads and stores
+    if (posix_memalign(&mat, 32, size) != 0)
+    {
+        fprintf (stderr, "Memory allocation error\n\n");
+        exit (EXIT_FAILURE);
+    }
+
+    return mat;
+}
+
+void* calloc_simd (size_t size)
+{
+    void* mat;
+
+    mat = malloc_simd (size);
+    memset (mat, 0, size);
+
+    return mat;
+}
+
 void print_int8_t (int8_t* mat, int dim)
 {
     int i;
@@ -62,6 +62,21 @@ typedef struct _align s_align;
     @field  read_end    0-based best alignment ending position on read
 */
 
+struct _profile;
+typedef struct _profile s_profile;
+/*! @typedef    structure of a precomputed query profile
+    @field  query           Query sequence encoded by integers (not owned by the profile)
+    @field  queryLen        Length of the query sequence
+    @field  mat             Score matrix produced by score_matrix (not owned by the profile)
+    @field  bias            Absolute value of the lowest score of mat, added to the 8 bits profiles
+    @field  profile_byte    Striped 8 bits query profile used for the forward alignment
+    @field  profile_word    Striped 16 bits query profile used if the 8 bits score saturates
+    @field  profile_rev_byte Striped 8 bits profiles of the reversed query, one per query end position.
+                            They are built the first time an alignment ends at this position
+    @field  profile_rev_word Same as profile_rev_byte for the 16 bits kernel
+    @note   A profile can be shared by several threads
+*/
+
 //// Public functions ////
 
 int8_t* score_matrix (const int8_t match, const int8_t mismatch);
@@ -89,6 +104,14 @@ int8_t* DNA_seq_to_int(char* DNA_seq, const int32_t seq_len);
     @note   Example if the query sequence is: ACGTN, the array will be : {0, 1, 2, 3, 4}
 */
 
+void DNA_seq_fill_int(const char* DNA_seq, const int32_t seq_len, int8_t* mat);
+
+/*! @function       Same as DNA_seq_to_int in an already allocated array
+    @param  DNA_seq DNA sequence in char
+    @param  seq_len Length of the DNA sequence
+    @param  mat     8 bits integer array of at least seq_len elements
+*/
+
 s_align ssw_align (const int8_t* query, int32_t queryLen, const int8_t* ref, int32_t refLen, const int8_t* mat, const int8_t gapO, const int8_t gapE);
 
 /*! @function   Do Striped Smith-Waterman alignment.
@@ -102,19 +125,85 @@ s_align ssw_align (const int8_t* query, int32_t queryLen, const int8_t* ref, int
     @return Alignment result structure
 */
 
+s_profile* ssw_init (const int8_t* query, const int32_t queryLen, const int8_t* mat);
+
+/*! @function   Create the query profile structure that can be reused for many alignments
+    @param query    Pointer to the query sequence; the query sequence needs to be numbers
+    @param queryLen Length of the query sequence
+    @param mat      Score matrix produced by score_matrix
+    @return Pointer to the query profile structure
+    @note   The query and the score matrix are not copied and have to outlive the profile
+*/
+
+void init_destroy (s_profile* p);
+
+/*! @function   Release the memory allocated by ssw_init
+    @param p    Pointer to the query profile structure
+*/
+
+s_align ssw_align_profile (s_profile* prof, const int8_t* ref, int32_t refLen, const int8_t gapO, const int8_t gapE, const uint16_t filter);
+
+/*! @function   Do Striped Smith-Waterman alignment with a query profile produced by ssw_init.
+    @param prof     Pointer to the query profile structure
+    @param ref      Pointer to the reference sequence; the reference sequence needs to be numbers
+    @param refLen   Length of the reference sequence
+    @param gapO     Penalty in case of gap opening (POSITIVE)
+    @param gapE     Penalty in case of gap extension (POSITIVE)
+    @param filter   Minimal score of the alignment. The beginning positions are not searched if the score
+                    is lower and the result only contains the score and the ending positions
+    @return Alignment result structure
+*/
+
+int32_t ssw_simd_init (const int32_t allow_avx2);
+
+/*! @function   Select the SIMD kernels used by ssw_init and ssw_align_profile. SSE2 kernels are used by
+                default, AVX2 kernels are selected if the CPU supports them.
+    @param allow_avx2   Set to 0 to force the use of the SSE2 kernels
+    @return 1 if the AVX2 kernels are selected, 0 for the SSE2 kernels
+    @note   Has to be called before ssw_init since profiles depend on the width of the kernels
+*/
+
 //// Private functions ////
 
-static __m128i* qP_word (const int8_t* query_num, const int8_t* mat, const int32_t queryLen);
+static void* cache_profile (void** slot, void* profile);
+// Atomically store a profile in an empty cache slot, or free it if the slot was filled by an other thread
+
+static void* qP_byte (const int8_t* query_num, const int8_t* mat, const int32_t queryLen, const uint8_t bias);
+// Generate 8 bits query profile rearrange query sequence & calculate the weight of match/mismatch + bias
+
+static void* qP_word (const int8_t* query_num, const int8_t* mat, const int32_t queryLen);
 // Generate query profile rearrange query sequence & calculate the weight of match/mismatch
 
+static s_alignment_end sw_sse2_byte (const int8_t* ref, int8_t ref_dir, int32_t refLen,
+    int32_t queryLen, const uint8_t gapO, const uint8_t gapE, const void* profile,
+    uint8_t terminate, uint8_t bias);
+/* Striped Smith-Waterman with 16 lanes of 8 bits
+   Same as sw_sse2_word but the score is returned as 255 when it exceeds the 8 bits range, in which case the
+   alignment has to be done again with sw_sse2_word
+ */
+
 static s_alignment_end sw_sse2_word (const int8_t* ref, int8_t ref_dir, int32_t refLen,
-    int32_t queryLen, const uint8_t gapO, const uint8_t gapE, const __m128i* vProfile,
+    int32_t queryLen, const uint8_t gapO, const uint8_t gapE, const void* profile,
     uint16_t terminate);
 /* Striped Smith-Waterman
    Record the highest score of each reference position. Return the alignment score and ending position of the best alignment.
    Gap begin and gap extension are different. with_match > 0, all other weights < 0. The returned positions are 0-based.
  */
 
+#if defined(__GNUC__) && (defined(__x86_64__) || defined(__i386__)) && !defined(SSW_NO_AVX2)
+
+static void* qP_byte_avx2 (const int8_t* query_num, const int8_t* mat, const int32_t queryLen, const uint8_t bias);
+static void* qP_word_avx2 (const int8_t* query_num, const int8_t* mat, const int32_t queryLen);
+static s_alignment_end sw_avx2_byte (const int8_t* ref, int8_t ref_dir, int32_t refLen,
+    int32_t queryLen, const uint8_t gapO, const uint8_t gapE, const void* profile,
+    uint8_t terminate, uint8_t bias);
+static s_alignment_end sw_avx2_word (const int8_t* ref, int8_t ref_dir, int32_t refLen,
+    int32_t queryLen, const uint8_t gapO, const uint8_t gapE, const void* profile,
+    uint16_t terminate);
+// Same as the SSE2 profiles and kernels with 256 bits registers (32 lanes of 8 bits, 16 lanes of 16 bits)
+
+#endif
+
 static int8_t* seq_reverse(const int8_t* seq, int32_t end);
 // Reverse the order of "letters" in a int8_t* sequence
 
@@ -124,4 +213,10 @@ void print_int8_t (int8_t* mat, int dim);
 int8_t* malloc_int8_t (int dim);
 // Allocate a 1D int8_t mat and verify its allocation
 
+void* malloc_simd (size_t size);
+// Allocate a 32 bytes aligned memory block for SIMD registers and verify its allocation
+
+void* calloc_simd (size_t size);
+// Same as malloc_simd with a zero initialized memory block
+
 #endif  // SSW_H
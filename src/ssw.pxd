@@ -18,6 +18,11 @@ cdef extern from "ssw.c":
 #                            position is not available
 #        @field  read_end    0-based best alignment ending position on read
 
+    ctypedef struct s_profile:
+        pass
+
+#        @typedef    structure of a precomputed query profile (opaque)
+
 
     int8_t* score_matrix (const int8_t match, const int8_t mismatch)
 
@@ -43,6 +48,13 @@ cdef extern from "ssw.c":
 #    @return 8 bits integer array encoding the sequence
 #    @note   Example if the query sequence is: ACGTN, the array will be : {0, 1, 2, 3, 4}
 
+    void DNA_seq_fill_int(const char* DNA_seq, const int32_t seq_len, int8_t* mat) nogil
+
+#    @function       Same as DNA_seq_to_int in an already allocated array
+#    @param  DNA_seq DNA sequence in char
+#    @param  seq_len Length of the DNA sequence
+#    @param  mat     8 bits integer array of at least seq_len elements
+
     s_align ssw_align (const int8_t* query, int32_t queryLen, const int8_t* ref, int32_t refLen, const int8_t* mat, const int8_t gapO, const int8_t gapE)
 
 #    @function   Do Striped Smith-Waterman alignment.
@@ -53,4 +65,38 @@ cdef extern from "ssw.c":
 #    @param mat      Score matrix produced by score_matrix
 #    @param gapO     Penalty in case of gap opening (POSITIVE)
 #    @param gapE     Penalty in case of gap extension (POSITIVE)
+#    @return Alignment result structure
+
+    int32_t ssw_simd_init (const int32_t allow_avx2)
+
+#    @function   Select the SIMD kernels used by ssw_init and ssw_align_profile. SSE2 kernels are used by
+#                default, AVX2 kernels are selected if the CPU supports them.
+#    @param allow_avx2   Set to 0 to force the use of the SSE2 kernels
+#    @return 1 if the AVX2 kernels are selected, 0 for the SSE2 kernels
+#    @note   Has to be called before ssw_init since profiles depend on the width of the kernels
+
+    s_profile* ssw_init (const int8_t* query, const int32_t queryLen, const int8_t* mat)
+
+#    @function   Create the query profile structure that can be reused for many alignments
+#    @param query    Pointer to the query sequence; the query sequence needs to be numbers
+#    @param queryLen Length of the query sequence
+#    @param mat      Score matrix produced by score_matrix
+#    @return Pointer to the query profile structure
+#    @note   The query and the score matrix are not copied and have to outlive the profile
+
+    void init_destroy (s_profile* p)
+
+#    @function   Release the memory allocated by ssw_init
+#    @param p    Pointer to the query profile structure
+
+    s_align ssw_align_profile (s_profile* prof, const int8_t* ref, int32_t refLen, const int8_t gapO, const int8_t gapE, const uint16_t filter) nogil
+
+#    @function   Do Striped Smith-Waterman alignment with a query profile produced by ssw_init.
+#    @param prof     Pointer to the query profile structure
+#    @param ref      Pointer to the reference sequence; the reference sequence needs to be numbers
+#    @param refLen   Length of the reference sequence
+#    @param gapO     Penalty in case of gap opening (POSITIVE)
+#    @param gapE     Penalty in case of gap extension (POSITIVE)
+#    @param filter   Minimal score of the alignment. The beginning positions are not searched if the score
+#                    is lower and the result only contains the score and the ending positions
 #    @return Alignment result structure